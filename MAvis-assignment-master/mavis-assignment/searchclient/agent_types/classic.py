@@ -15,12 +15,13 @@ from search_algorithms.graph_search import graph_search
 from utils import *
 
 
-def classic_agent_type(level, initial_state, action_library, goal_description, frontier):
+def classic_agent_type(level, initial_state, action_library, goal_description, frontier, deadline=None):
 
     # Create an action set where all agents can perform all actions
     action_set = [action_library] * level.num_agents
 
-    planning_success, plan = graph_search(initial_state, action_set, goal_description, frontier)
+    # Once the deadline has passed, the search stops, and an anytime search such as ARA* returns its best plan so far
+    planning_success, plan = graph_search(initial_state, action_set, goal_description, frontier, deadline=deadline)
 
     if not planning_success:
         print("Unable to solve level.", file=sys.stderr)
@@ -28,6 +29,11 @@ def classic_agent_type(level, initial_state, action_library, goal_description, f
 
     print(f"Found solution of length {len(plan)}", file=sys.stderr)
 
+    execute_plan(plan)
+
+
+def execute_plan(plan):
+    # Sends the joint actions of the plan to the server one at a time
     for joint_action in plan:
 
         # Send the joint action to the server
@@ -0,0 +1,304 @@
+# coding: utf-8
+#
+# Copyright 2021 The Technical University of Denmark
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#    http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from collections import deque
+
+from agent_types.classic import execute_plan
+from domains.hospital.actions import NoOpAction
+from domains.hospital.distances import HospitalDistanceTable, UNREACHABLE
+from domains.hospital.state import HospitalState
+from search_algorithms.graph_search import graph_search
+from utils import *
+
+# How decomposed_agent_type splits the level, set by --decomposition: into one group per color, which reaches all goals
+# of its color at once, or into one group per agent, which reaches the goals assigned to it one sub-goal at a time
+DECOMPOSITIONS = ['color', 'subgoal']
+decomposition = 'subgoal'
+
+# The number of steps a group waits for the others to clear its way before it is planned again
+MAX_WAIT = 4
+
+
+def decomposed_agent_type(level, initial_state, action_library, goal_description, frontier, deadline=None):
+    """
+    Plans groups of agents independently, each in a state holding only its agents, the boxes of their colors and the
+    boxes which no agent can move, and merges their plans into joint actions, see _merge. Since the merged plans may
+    leave goals unsatisfied, the groups are planned again from the state they reached for as long as that satisfies
+    more goals.
+    Whatever goals are still unsatisfied then are planned for in the full state with all agents, and if the reached
+    state cannot satisfy them, the whole level is planned for from the initial state, like classic_agent_type does.
+    """
+    operator_decomposition = initial_state.pending_actions is not None
+    distances = HospitalDistanceTable(level, [])
+    state = HospitalState(level, level.initial_agent_positions, level.initial_box_positions)
+    if operator_decomposition:
+        state.use_operator_decomposition()
+    plan = []
+    num_repairs = 0
+    num_unsatisfied = goal_description.num_unsatisfied_goals(state)
+    while num_unsatisfied > 0:
+        groups = _create_groups(level, state, goal_description, distances)
+        print(f"Decomposed: {len(groups)} groups of agents " +
+              ', '.join(str(agent_indices) for (agent_indices, _) in groups), file=sys.stderr)
+
+        group_segments = []
+        for (agent_indices, group_goal) in groups:
+            group_state = _filter_state(level, state, agent_indices)
+            if operator_decomposition:
+                group_state.use_operator_decomposition()
+            group_segments.append(_plan_group(level, group_state, [action_library] * len(agent_indices), group_goal,
+                                              frontier, deadline))
+
+        (state, merged_plan, merge_repairs) = _merge(level, state, groups, group_segments, action_library, frontier,
+                                                     deadline)
+        plan.extend(merged_plan)
+        num_repairs += merge_repairs
+        previous_num_unsatisfied = num_unsatisfied
+        num_unsatisfied = goal_description.num_unsatisfied_goals(state)
+        if num_unsatisfied >= previous_num_unsatisfied:
+            break
+
+    if num_unsatisfied > 0:
+        # The groups cannot reach the remaining goals on their own, so they are planned for together
+        print("Decomposed: planning the remaining goals with all agents", file=sys.stderr)
+        action_set = [action_library] * level.num_agents
+        solved, remaining_plan = graph_search(state, action_set, goal_description, frontier, deadline=deadline)
+        if not solved:
+            print("Decomposed: planning the level from the initial state", file=sys.stderr)
+            plan = []
+            solved, remaining_plan = graph_search(initial_state, action_set, goal_description, frontier,
+                                                  deadline=deadline)
+        if not solved:
+            print("Unable to solve level.", file=sys.stderr)
+            return
+        plan.extend(remaining_plan)
+
+    print(f"Decomposed: {num_repairs} repairs", file=sys.stderr)
+    print(f"Found solution of length {len(plan)}", file=sys.stderr)
+    execute_plan(plan)
+
+
+def _merge(level, state, groups, group_segments, action_library, frontier, deadline) -> tuple:
+    """
+    Merges the plans of the groups, given as segments (see _plan_group), by executing one step of every group at a
+    time from the state, and returns the reached state, the merged plan and the number of repairs. A group whose next
+    step is inapplicable or conflicts with the steps of the groups before it waits, and once it waited for more than
+    MAX_WAIT steps or no group can move, the goals of its current segment are planned for again in the full state,
+    with the other agents waiting, and the repair is executed while they wait. Since the other groups may have
+    disturbed the earlier goals of the segment, only the ones which are still satisfied are kept by the repair.
+    """
+    # The remaining segments of each group, as [goal description, new goals, remaining actions of its agents per step]
+    remaining_segments = [deque([segment_goal, new_goals, deque(segment_plan)]
+                                for (segment_goal, new_goals, segment_plan) in segments)
+                          for segments in group_segments]
+    no_op = NoOpAction()
+    plan = []
+    waits = [0] * len(groups)
+    num_repairs = 0
+    while True:
+        for segments in remaining_segments:
+            while segments and not segments[0][2]:
+                segments.popleft()
+        if not any(remaining_segments):
+            return state, plan, num_repairs
+
+        joint_action = [no_op] * level.num_agents
+        moving_groups = []
+        waiting_groups = []
+        for (group_index, (agent_indices, _)) in enumerate(groups):
+            segments = remaining_segments[group_index]
+            if not segments:
+                continue
+            next_joint_action = joint_action[:]
+            for (agent_index, action) in zip(agent_indices, segments[0][2][0]):
+                next_joint_action[agent_index] = action
+            if state.is_applicable(next_joint_action) and not state.is_conflicting(next_joint_action):
+                joint_action = next_joint_action
+                moving_groups.append(group_index)
+            else:
+                waiting_groups.append(group_index)
+
+        if moving_groups:
+            state = state.result(joint_action)
+            plan.append(joint_action)
+            for group_index in moving_groups:
+                remaining_segments[group_index][0][2].popleft()
+                waits[group_index] = 0
+        for group_index in waiting_groups:
+            waits[group_index] += 1
+
+        offending_groups = [group_index for group_index in waiting_groups if waits[group_index] > MAX_WAIT]
+        if not moving_groups:
+            offending_groups = waiting_groups
+        if not offending_groups:
+            continue
+
+        # The current segment of the offending group is planned again from here, while the other agents wait
+        num_repairs += 1
+        group_index = offending_groups[0]
+        agent_indices = groups[group_index][0]
+        (segment_goal, new_goals, _) = remaining_segments[group_index].popleft()
+        waits[group_index] = 0
+        repair_goal = segment_goal.create_new_goal_description_of_same_type(
+            [goal for goal in segment_goal.goals
+             if goal in new_goals or segment_goal.create_new_goal_description_of_same_type([goal]).is_goal(state)])
+        if repair_goal.is_goal(state):
+            continue
+        # An agent waiting on one of the goals cannot make room, so the repair would search in vain
+        blocking_agents = {state.agent_at(goal_position)[0] for (goal_position, _, is_positive_literal)
+                           in repair_goal.goals if is_positive_literal}.difference([-1], agent_indices)
+        if blocking_agents:
+            print(f"Decomposed: agents {agent_indices} are blocked by agents {sorted(blocking_agents)}", file=sys.stderr)
+            continue
+        action_set = [[no_op]] * level.num_agents
+        for agent_index in agent_indices:
+            action_set[agent_index] = action_library
+        repair = _search(level, state, agent_indices, action_set, repair_goal, frontier, deadline)
+        if repair is None:
+            print(f"Decomposed: agents {agent_indices} found no plan in the full state", file=sys.stderr)
+            continue
+        state = state.result_of_plan(repair) if repair else state
+        plan.extend(repair)
+
+
+def _create_groups(level, state, goal_description, distances) -> list:
+    """Returns the (agent indices, goal description) of each group of agents which has goals"""
+    agent_colors = [level.colors[agent_char] for (_, agent_char) in state.agent_positions]
+    groups = []
+    if decomposition == 'color':
+        for color in dict.fromkeys(agent_colors):
+            agent_indices = [agent_index for (agent_index, agent_color) in enumerate(agent_colors) if agent_color == color]
+            groups.append((agent_indices, goal_description.color_filter(color)))
+    else:
+        assigned_goals = _assign_goals(level, state, goal_description, distances)
+        for agent_index in range(level.num_agents):
+            groups.append(([agent_index], goal_description.create_new_goal_description_of_same_type(
+                assigned_goals[agent_index])))
+    return [(agent_indices, group_goal) for (agent_indices, group_goal) in groups if group_goal.goals]
+
+
+def _assign_goals(level, state, goal_description, distances) -> list:
+    """
+    Assigns the goals to the agents: the goals of an agent to that agent, and the box goals which the state does not
+    satisfy yet to an agent of their color, such that the agents of a color get about the same amount of work. The work
+    of a box goal for an agent is the distance from the agent to the nearest box of the letter plus the distance from
+    that box to the goal. The box goals which the state satisfies are assigned to all agents of their color, and come
+    first, such that no agent takes a box of the same letter from a goal of another agent.
+    """
+    agent_cells = [level.cell_id(position) for (position, _) in state.agent_positions]
+    agent_chars = [agent_char for (_, agent_char) in state.agent_positions]
+    box_cells = [(level.cell_id(position), box_char) for (position, box_char) in state.box_positions]
+
+    assigned_goals = [[] for _ in range(level.num_agents)]
+    unsatisfied_goals = []
+    for goal in goal_description.box_goals:
+        (goal_position, goal_char, is_positive_literal) = goal
+        if (state.object_at(goal_position) == goal_char) != is_positive_literal:
+            unsatisfied_goals.append(goal)
+            continue
+        for agent_index in range(level.num_agents):
+            if level.colors[agent_chars[agent_index]] == level.colors[goal_char]:
+                assigned_goals[agent_index].append(goal)
+
+    work = [0] * level.num_agents
+    for goal in unsatisfied_goals:
+        (goal_position, goal_char, _) = goal
+        goal_cell = level.cell_id(goal_position)
+        best_agent = None
+        best_work = None
+        for agent_index in range(level.num_agents):
+            if level.colors[agent_chars[agent_index]] != level.colors[goal_char]:
+                continue
+            goal_work = min((distances.distance(agent_cells[agent_index], box_cell) + distances.distance(box_cell, goal_cell)
+                             for (box_cell, box_char) in box_cells if box_char == goal_char), default=UNREACHABLE)
+            if goal_work >= UNREACHABLE:
+                continue
+            if best_agent is None or work[agent_index] + goal_work < best_work:
+                best_agent = agent_index
+                best_work = work[agent_index] + goal_work
+        if best_agent is not None:
+            assigned_goals[best_agent].append(goal)
+            work[best_agent] = best_work
+
+    for goal in goal_description.agent_goals:
+        (_, goal_char, _) = goal
+        if goal_char in agent_chars:
+            assigned_goals[agent_chars.index(goal_char)].append(goal)
+    return assigned_goals
+
+
+def _filter_state(level, state, agent_indices) -> HospitalState:
+    """
+    Returns a copy of the state with only the given agents, the boxes of their colors and the boxes which no agent can
+    move. Unlike HospitalState.color_filter, the latter are kept since they block the agents like walls.
+    """
+    agent_positions = state.agent_positions
+    agent_colors = {level.colors[agent_char] for (_, agent_char) in agent_positions}
+    group_colors = {level.colors[agent_positions[agent_index][1]] for agent_index in agent_indices}
+    box_positions = [(position, box_char) for (position, box_char) in state.box_positions
+                     if level.colors[box_char] in group_colors or level.colors[box_char] not in agent_colors]
+    return HospitalState(level, [agent_positions[agent_index] for agent_index in agent_indices], box_positions)
+
+
+def _plan_group(level, group_state, action_set, group_goal, frontier, deadline) -> list:
+    """
+    Returns the plan of a group in its own state as segments (goal description, new goals, actions of its agents per
+    step), where the goal description holds the new goals of the segment and those of the segments before it.
+    With the color decomposition, the single segment reaches all goals of the group. With the subgoal decomposition,
+    each segment reaches one more sub-goal while keeping the ones before, and the sub-goals without a plan are skipped.
+    """
+    if decomposition == 'color':
+        group_plan = _search(level, group_state, range(len(action_set)), action_set, group_goal, frontier, deadline)
+        if group_plan is None:
+            print(f"Decomposed: found no plan for {group_goal}", file=sys.stderr)
+            return []
+        return [(group_goal, group_goal.goals, group_plan)]
+
+    state = group_state
+    segments = []
+    goals = []
+    for index in range(group_goal.num_sub_goals()):
+        new_goals = group_goal.get_sub_goal(index).goals
+        sub_goal = group_goal.create_new_goal_description_of_same_type(goals + new_goals)
+        if not sub_goal.is_goal(state):
+            sub_plan = _search(level, state, range(len(action_set)), action_set, sub_goal, frontier, deadline)
+            if sub_plan is None:
+                print(f"Decomposed: found no plan for the sub-goal {group_goal.get_sub_goal(index)}", file=sys.stderr)
+                continue
+            state = state.result_of_plan(sub_plan) if sub_plan else state
+            segments.append((sub_goal, new_goals, sub_plan))
+        goals = sub_goal.goals
+    return segments
+
+
+def _search(level, state, agent_indices, action_set, goal, frontier, deadline) -> list:
+    """
+    Returns a plan reaching the goal from the state, or None if there is none, in which only the given agents act and
+    only the boxes of the letters of the unsatisfied goals, and of the boxes on them, are moved. Moving any other box
+    does not bring the goal closer, but every box that can be moved multiplies the states the search may explore, and
+    the heuristic even rewards moving a box off its goal when that brings an agent next to an unfinished box. For the
+    same reason, the heuristic must not count the distances of the waiting agents to the boxes.
+    """
+    chars = {state.agent_chars[agent_index] for agent_index in agent_indices}
+    for (goal_position, goal_char, is_positive_literal) in goal.box_goals:
+        char = state.object_at(goal_position)
+        if (char == goal_char) != is_positive_literal:
+            chars.add(goal_char)
+            # A box of another letter on the goal has to make room
+            if char is not None and 'A' <= char <= 'Z':
+                chars.add(char)
+    restricted_state = HospitalState(level.restrict(chars), state.agent_positions, state.box_positions)
+    if state.pending_actions is not None:
+        restricted_state.use_operator_decomposition()
+    solved, plan = graph_search(restricted_state, action_set, goal, frontier, deadline=deadline)
+    return plan if solved else None
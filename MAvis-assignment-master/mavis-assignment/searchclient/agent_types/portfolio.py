@@ -0,0 +1,131 @@
+# coding: utf-8
+#
+# Copyright 2021 The Technical University of Denmark
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#    http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import multiprocessing
+import os
+import queue
+import time
+import traceback
+
+import memory
+from agent_types.classic import execute_plan
+from configurations import create_action_library, create_frontier, create_heuristic
+from domains.hospital.simulator import HospitalSimulator
+from search_algorithms.graph_search import graph_search
+from utils import *
+
+# The configurations raced by default, see configurations.parse_config
+DEFAULT_PORTFOLIO = ['greedy:advanced', 'astar:advanced', 'greedy:goalcount', 'bfs']
+
+# How often the portfolio looks for workers which died without a result, in seconds
+POLL_INTERVAL = 0.5
+
+
+def portfolio_agent_type(level, initial_state, goal_description, configs, deadline=None):
+    """
+    Races a portfolio of configurations, i.e. (strategy, heuristic, action library) names, each in its own worker
+    process searching the same parsed level. The first plan which the simulator validates is sent to the server and
+    the remaining workers are killed. The workers share the --max-memory budget equally.
+    The searches of the workers stop at the deadline, and the portfolio gives up once no worker has reported within
+    POLL_INTERVAL after it, which leaves the workers time to report the plans an anytime search found by then.
+    """
+    context = multiprocessing.get_context()
+    results = context.Queue()
+
+    # Each heuristic is preprocessed once, here, and the workers receive it together with the level
+    heuristics = {}
+    for (_, heuristic_name, _) in configs:
+        if heuristic_name not in heuristics:
+            heuristics[heuristic_name] = create_heuristic(heuristic_name, level)
+
+    start_time = time.perf_counter()
+    workers = []
+    for (index, config) in enumerate(configs):
+        worker = context.Process(target=_search_worker, daemon=True,
+                                 args=(index, config, initial_state, goal_description, heuristics[config[1]],
+                                       memory.max_usage / len(configs), deadline, results))
+        worker.start()
+        workers.append(worker)
+
+    simulator = HospitalSimulator(level)
+    winner = None
+    plan = None
+    finished = set()
+    try:
+        while winner is None and len(finished) < len(workers):
+            try:
+                (index, plan_lines, error) = results.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                if deadline is not None and time.monotonic() >= deadline:
+                    print("Portfolio: the time limit has passed", file=sys.stderr)
+                    break
+                # A worker killed by e.g. the system never reports, while one exiting normally has reported
+                for (index, worker) in enumerate(workers):
+                    if index not in finished and worker.exitcode not in (None, 0):
+                        print(f"Portfolio: {format_config(configs[index])} died with exit code {worker.exitcode}",
+                              file=sys.stderr)
+                        finished.add(index)
+                continue
+
+            finished.add(index)
+            elapsed = time.perf_counter() - start_time
+            if plan_lines is None:
+                print(f"Portfolio: {format_config(configs[index])} found no plan after {elapsed:.2f} s", file=sys.stderr)
+                if error is not None:
+                    print(error, file=sys.stderr)
+                continue
+
+            joint_actions = [simulator.parse_joint_action(line) for line in plan_lines]
+            reached_goal, failed_actions = simulator.validate(joint_actions)
+            if reached_goal and not failed_actions:
+                winner = index
+                plan = joint_actions
+            else:
+                print(f"Portfolio: {format_config(configs[index])} found an invalid plan after {elapsed:.2f} s",
+                      file=sys.stderr)
+    finally:
+        for worker in workers:
+            if worker.is_alive():
+                worker.kill()
+        for worker in workers:
+            worker.join()
+
+    if winner is None:
+        print("Unable to solve level.", file=sys.stderr)
+        return
+
+    print(f"Portfolio winner: {format_config(configs[winner])} found a plan of length {len(plan)} after "
+          f"{time.perf_counter() - start_time:.2f} s", file=sys.stderr)
+    execute_plan(plan)
+
+
+def format_config(config) -> str:
+    return ':'.join(name for name in config if name is not None)
+
+
+def _search_worker(index, config, initial_state, goal_description, heuristic, max_usage, deadline, results):
+    # The workers must not write to stdout, which is the channel to the server, and the progress of their searches
+    # would be interleaved on stderr
+    sys.stdout = sys.stderr = open(os.devnull, 'w')
+    memory.max_usage = max_usage
+    exit_with_parent(POLL_INTERVAL)
+    try:
+        (strategy_name, _, action_library_name) = config
+        action_set = [create_action_library(action_library_name)] * len(initial_state.agent_chars)
+        frontier = create_frontier(strategy_name, heuristic)
+        # The deadline is a time.monotonic() value, which is the same clock in every process
+        solved, plan = graph_search(initial_state, action_set, goal_description, frontier, deadline=deadline)
+        results.put((index, [joint_action_to_string(joint_action) for joint_action in plan] if solved else None, None))
+    except Exception:
+        results.put((index, None, traceback.format_exc()))
+
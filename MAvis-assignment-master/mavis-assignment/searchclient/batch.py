@@ -0,0 +1,178 @@
+# coding: utf-8
+#
+# Copyright 2021 The Technical University of Denmark
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#    http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Solves many levels at once with a pool of worker processes, without the server. Every combination of a level and a
+# configuration is a task, and the result of each task is printed as soon as it finishes.
+# A configuration is written strategy[:heuristic[:action library]], e.g. 'astar:advanced' or 'bfs'.
+#
+# Usage (from the mavis-assignment directory):
+#   python searchclient/batch.py --configs astar:advanced greedy:advanced bfs --time-limit 60 --max-memory 2g \
+#       --output results.jsonl levels/*.lvl
+
+from __future__ import annotations
+import argparse
+import concurrent.futures
+import io
+import json
+import os
+import random
+import re
+import sys
+import time
+import traceback
+
+import memory
+import telemetry
+from configurations import create_action_library, create_frontier, create_heuristic, parse_config
+from domains.hospital import *
+from fake_server import load_level_lines
+from search_algorithms.graph_search import graph_search
+
+# The levels and preprocessed heuristics already built by this worker process, which tasks on the same level reuse
+# instead of parsing the level and computing its lookup tables again
+_levels = {}
+_heuristics = {}
+
+
+def _init_worker(max_usage, quiet):
+    memory.max_usage = max_usage
+    if quiet:
+        # The searches report their progress on stderr, which would be interleaved between the workers
+        sys.stderr = open(os.devnull, 'w')
+
+
+def _load_level(level_path) -> tuple[HospitalLevel, bool]:
+    """Returns the level of the file and whether it was already loaded by this worker"""
+    level = _levels.get(level_path)
+    if level is not None:
+        return level, True
+    # The indentation of the rows is part of the level, like in the lines which the server sends
+    level = HospitalLevel.parse_level_lines(load_level_lines(level_path))
+    _levels[level_path] = level
+    return level, False
+
+
+def _load_heuristic(level_path, level, heuristic_name):
+    """Returns the preprocessed heuristic of the level, which is only preprocessed once per worker"""
+    key = (level_path, heuristic_name)
+    if key not in _heuristics:
+        _heuristics[key] = create_heuristic(heuristic_name, level)
+    return _heuristics[key]
+
+
+def solve(level_path, strategy_name, heuristic_name, action_library_name, time_limit, operator_decomposition):
+    """Solves a level in the worker process and returns the record of the task"""
+    record = {'level': os.path.splitext(os.path.basename(level_path))[0], 'strategy': strategy_name,
+              'heuristic': heuristic_name, 'action_library': action_library_name, 'worker': os.getpid()}
+    start = time.perf_counter()
+    try:
+        level, cached = _load_level(level_path)
+        heuristic = _load_heuristic(level_path, level, heuristic_name)
+        initial_state = HospitalState(level, level.initial_agent_positions, level.initial_box_positions)
+        if operator_decomposition:
+            initial_state.use_operator_decomposition()
+        goal_description = HospitalGoalDescription(level, level.box_goals + level.agent_goals)
+        action_set = [create_action_library(action_library_name)] * level.num_agents
+        frontier = create_frontier(strategy_name, heuristic)
+        preprocess_time = time.perf_counter() - start
+
+        # The applicable actions are shuffled with the seed of a fresh searchclient process (see HospitalState), so a
+        # task finds the same plan as the searchclient, whichever tasks ran on the worker before
+        random.seed(a=0, version=2)
+        # Only the final telemetry record of the search is written, and it is kept in memory for its counts
+        telemetry.output = io.StringIO()
+        telemetry.interval = float('inf')
+        solved, plan = graph_search(initial_state, action_set, goal_description, frontier,
+                                    deadline=time.monotonic() + time_limit - preprocess_time)
+        end_record = json.loads(telemetry.output.getvalue().splitlines()[-1])
+        telemetry.output = None
+
+        if solved:
+            reached_goal, failed_actions = HospitalSimulator(level).validate(plan)
+            status = 'solved' if reached_goal and not failed_actions else 'invalid'
+        else:
+            status = {'time': 'timeout', 'memory': 'memory'}.get(end_record.get('stopped'), 'unsolved')
+        record.update(status=status, time=round(time.perf_counter() - start, 3),
+                      preprocess_time=round(preprocess_time, 3), cached=cached, expanded=end_record['expanded'],
+                      generated=end_record['generated'], rss=end_record['rss'],
+                      plan_length=len(plan) if solved else None)
+    except Exception:
+        record.update(status='error', time=round(time.perf_counter() - start, 3), error=traceback.format_exc())
+    return record
+
+
+def parse_memory(text):
+    match = re.fullmatch(r"([0-9]+)g", text)
+    if match is None:
+        raise argparse.ArgumentTypeError(f"Failed to parse max memory: {text}. Should be e.g. 8g to indicate 8 GB")
+    return int(match.group(1)) * 1024 * 1024 * 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Solve many levels in parallel without the server.')
+    parser.add_argument('levels', nargs='+', help='Level files to solve.')
+    parser.add_argument('--configs', nargs='+', type=parse_config, default=[('greedy', 'advanced', 'default')],
+                        help='Configurations as strategy[:heuristic[:action library]] (default greedy:advanced).')
+    parser.add_argument('--operator-decomposition', action='store_true', help='Use operator decomposition.')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Number of worker processes.')
+    parser.add_argument('--time-limit', type=float, default=60, help='Seconds per task (default 60).')
+    parser.add_argument('--max-memory', type=parse_memory, default='4g',
+                        help='Memory usage allowed per worker process in GB, e.g. 2g (default 4g).')
+    parser.add_argument('--max-tasks-per-worker', type=int, default=None,
+                        help='Replace each worker after this many tasks, which returns its memory to the system but '
+                             'also drops its loaded levels.')
+    parser.add_argument('--output', help='Append the record of each task as a JSON line to this file.')
+    parser.add_argument('--verbose', action='store_true', help='Show the output of the searches on stderr.')
+    args = parser.parse_args()
+
+    pool_arguments = {'max_workers': args.workers, 'initializer': _init_worker,
+                      'initargs': (args.max_memory, not args.verbose)}
+    if args.max_tasks_per_worker is not None:
+        pool_arguments['max_tasks_per_child'] = args.max_tasks_per_worker
+
+    output = open(args.output, 'a') if args.output else None
+    start = time.perf_counter()
+    num_solved = 0
+    with concurrent.futures.ProcessPoolExecutor(**pool_arguments) as executor:
+        # The tasks of a level are submitted together, so they are likely to run on workers which loaded the level
+        futures = {}
+        for level_path in args.levels:
+            for (strategy_name, heuristic_name, action_library_name) in args.configs:
+                task = (os.path.abspath(level_path), strategy_name, heuristic_name, action_library_name,
+                        args.time_limit, args.operator_decomposition)
+                futures[executor.submit(solve, *task)] = task
+
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                record = future.result()
+            except Exception as error:
+                # E.g. a worker which was killed by the system
+                (level_path, strategy_name, heuristic_name, action_library_name, _, _) = futures[future]
+                record = {'level': os.path.splitext(os.path.basename(level_path))[0], 'strategy': strategy_name,
+                          'heuristic': heuristic_name, 'action_library': action_library_name, 'status': 'error',
+                          'error': repr(error)}
+            num_solved += record['status'] == 'solved'
+            print(' '.join(f"{key}={value}" for (key, value) in record.items() if key != 'error'), flush=True)
+            if record['status'] == 'error':
+                print(record['error'], file=sys.stderr)
+            if output is not None:
+                output.write(json.dumps(record) + '\n')
+                output.flush()
+
+    if output is not None:
+        output.close()
+    print(f"Solved {num_solved} of {len(futures)} tasks in {time.perf_counter() - start:.1f} s")
+
+
+if __name__ == '__main__':
+    main()
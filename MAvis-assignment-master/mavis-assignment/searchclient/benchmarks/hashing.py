@@ -0,0 +1,132 @@
+# coding: utf-8
+#
+# Copyright 2021 The Technical University of Denmark
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#    http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Compares the cost of hashing a newly generated HospitalState using:
+# - legacy:      hashing the tuples of ((row, col), char) pairs, as the list based state representation did.
+# - packed:      hashing the packed cells of the state as bytes.
+# - zobrist:     computing the Zobrist hash from scratch, see HospitalState.compute_hash.
+# - incremental: updating the Zobrist hash of the parent by XOR for each moved agent and box, as result() does.
+# The states are generated by a breadth-first expansion from the initial state and all timings are per state.
+# The incremental hash of every generated state is also checked against the hash computed from scratch.
+#
+# Usage (from the mavis-assignment directory):
+#   python searchclient/benchmarks/hashing.py levels/SAsoko3_128.lvl levels/MAbispebjergHospital.lvl
+
+import argparse
+import os
+import sys
+import time
+from collections import deque
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from domains.hospital import *
+
+
+def generate_transitions(level, initial_state, max_states):
+    action_set = [DEFAULT_HOSPITAL_ACTION_LIBRARY] * level.num_agents
+    visited = {initial_state}
+    queue = deque([initial_state])
+    transitions = []
+    while queue and len(transitions) < max_states:
+        state = queue.popleft()
+        for joint_action in state.get_applicable_actions(action_set):
+            child = state.result(joint_action)
+            transitions.append((state, child))
+            if child not in visited:
+                visited.add(child)
+                queue.append(child)
+            if len(transitions) >= max_states:
+                break
+    return transitions
+
+
+def moved_entities(level, parent, child):
+    """Returns the (keys, old cell, new cell) triplets of the entities moved from parent to child"""
+    moves = []
+    num_agents = len(parent.agent_chars)
+    for (idx, agent_char) in enumerate(parent.agent_chars):
+        if parent.cells[idx] != child.cells[idx]:
+            moves.append((level.zobrist_keys[agent_char], parent.cells[idx], child.cells[idx]))
+    # Boxes of the same letter are indistinguishable, so pair up the vacated and newly occupied cells per letter
+    for box_char in set(parent.box_chars):
+        old_cells = {parent.cells[num_agents + idx] for (idx, char) in enumerate(parent.box_chars) if char == box_char}
+        new_cells = {child.cells[num_agents + idx] for (idx, char) in enumerate(child.box_chars) if char == box_char}
+        for (old_cell, new_cell) in zip(sorted(old_cells - new_cells), sorted(new_cells - old_cells)):
+            moves.append((level.zobrist_keys[box_char], old_cell, new_cell))
+    return moves
+
+
+def time_per_state(function, items, repeats):
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function(items)
+        best = min(best, time.perf_counter() - start)
+    return best / len(items) * 1e9
+
+
+def legacy_hash(items):
+    for (agent_positions, box_positions) in items:
+        hash((tuple(agent_positions), tuple(box_positions)))
+
+
+def packed_hash(items):
+    for state in items:
+        hash(state.cells.tobytes())
+
+
+def zobrist_hash(items):
+    for state in items:
+        state.compute_hash()
+
+
+def incremental_hash(items):
+    for (value, moves) in items:
+        for (keys, old_cell, new_cell) in moves:
+            value ^= keys[old_cell] ^ keys[new_cell]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the cost of hashing HospitalStates.')
+    parser.add_argument('levels', nargs='+', help='Level files to benchmark.')
+    parser.add_argument('--states', type=int, default=20000, help='Number of generated states per level.')
+    parser.add_argument('--repeats', type=int, default=5, help='Number of timing repetitions (best is reported).')
+    args = parser.parse_args()
+
+    print(f"{'Level':24s} {'Entities':>8s} {'legacy':>10s} {'packed':>10s} {'zobrist':>10s} {'incremental':>12s}"
+          f"   (ns per state)")
+    for path in args.levels:
+        with open(path, "r") as f:
+            level = HospitalLevel.parse_level_lines([line.strip() for line in f.readlines()])
+        initial_state = HospitalState(level, level.initial_agent_positions, level.initial_box_positions)
+        transitions = generate_transitions(level, initial_state, args.states)
+
+        for (_, child) in transitions:
+            assert hash(child) == child.compute_hash(), "Incremental hash differs from hash computed from scratch"
+
+        children = [child for (_, child) in transitions]
+        legacy_items = [(list(child.agent_positions), list(child.box_positions)) for child in children]
+        incremental_items = [(hash(parent), moved_entities(level, parent, child)) for (parent, child) in transitions]
+
+        legacy = time_per_state(legacy_hash, legacy_items, args.repeats)
+        packed = time_per_state(packed_hash, children, args.repeats)
+        zobrist = time_per_state(zobrist_hash, children, args.repeats)
+        incremental = time_per_state(incremental_hash, incremental_items, args.repeats)
+        num_entities = level.num_agents + level.num_boxes
+        print(f"{level.name:24s} {num_entities:8d} {legacy:10.0f} {packed:10.0f} {zobrist:10.0f} {incremental:12.0f}",
+              flush=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+# coding: utf-8
+#
+# Copyright 2021 The Technical University of Denmark
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#    http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Measures how HDA* (see search_algorithms/hda_star.py) scales with the number of worker processes, against the
+# sequential A* of graph_search with the same heuristic. For every level, the wall time of the search (excluding the
+# preprocessing of the heuristic), the number of expanded states and the plan length are measured for A* and for HDA*
+# with each of the given numbers of workers. The speedup is the time of A* divided by the time of HDA*.
+# The heuristic computes some of its tables lazily during the search, so an untimed A* search warms it up first, and
+# all measured searches (including the forked workers of HDA*) start with the same tables.
+#
+# Usage (from the mavis-assignment directory):
+#   python searchclient/benchmarks/hda_scaling.py --workers 1 2 4 8 --time-limit 120 levels/SAsoko2_32.lvl
+#   python searchclient/benchmarks/hda_scaling.py --markdown levels/SAsoko2_*.lvl levels/SAlabyrinth.lvl
+
+import argparse
+import io
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+import telemetry
+from domains.hospital import *
+from search_algorithms.graph_search import graph_search
+from strategies.bestfirst import FrontierAStar, FrontierHDAStar
+
+
+def load_level(path):
+    with open(path, "r") as f:
+        lines = [line.strip() for line in f.readlines()]
+    return HospitalLevel.parse_level_lines(lines)
+
+
+def measure(level, frontier, time_limit):
+    """Returns the wall time, the number of expanded states and the plan length (None if unsolved) of a search"""
+    initial_state = HospitalState(level, level.initial_agent_positions, level.initial_box_positions)
+    goal_description = HospitalGoalDescription(level, level.box_goals + level.agent_goals)
+    action_set = [DEFAULT_HOSPITAL_ACTION_LIBRARY] * level.num_agents
+
+    # The counts are read from the final telemetry record, while the progress of the search is not shown
+    telemetry.output = io.StringIO()
+    telemetry.interval = float('inf')
+    stderr = sys.stderr
+    sys.stderr = open(os.devnull, 'w')
+    try:
+        start = time.perf_counter()
+        solved, plan = graph_search(initial_state, action_set, goal_description, frontier,
+                                    deadline=time.monotonic() + time_limit)
+        elapsed = time.perf_counter() - start
+    finally:
+        sys.stderr.close()
+        sys.stderr = stderr
+    end_record = json.loads(telemetry.output.getvalue().splitlines()[-1])
+    telemetry.output = None
+    return elapsed, end_record['expanded'], len(plan) if solved else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure the scaling of HDA* with the number of worker processes.')
+    parser.add_argument('levels', nargs='+', help='Level files to search.')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, os.cpu_count()],
+                        help='Numbers of worker processes to measure (default 1 2 4 and the number of CPU cores).')
+    parser.add_argument('--heuristic', choices=['goalcount', 'advanced'], default='advanced',
+                        help='The heuristic of both searches (default advanced).')
+    parser.add_argument('--time-limit', type=float, default=60, help='Seconds per search (default 60).')
+    parser.add_argument('--markdown', action='store_true', help='Print the results as a markdown table.')
+    args = parser.parse_args()
+    worker_counts = sorted(set(args.workers))
+
+    print(f"CPU cores: {os.cpu_count()}", file=sys.stderr)
+    columns = ['Level', 'A* time (s)', 'A* expanded', 'Plan'] + \
+              [f"HDA* {num_workers} (s)" for num_workers in worker_counts]
+    if args.markdown:
+        print('| ' + ' | '.join(columns) + ' |')
+        print('|' + '|'.join(['-------'] + ['------:'] * (len(columns) - 1)) + '|')
+
+    for path in args.levels:
+        level = load_level(path)
+        heuristic = HospitalAdvancedHeuristics() if args.heuristic == 'advanced' else HospitalGoalCountHeuristics()
+        heuristic.preprocess(level)
+        measure(level, FrontierAStar(heuristic), args.time_limit)
+
+        (astar_time, astar_expanded, astar_length) = measure(level, FrontierAStar(heuristic), args.time_limit)
+        cells = [os.path.splitext(os.path.basename(path))[0], f"{astar_time:.2f}", str(astar_expanded),
+                 str(astar_length) if astar_length is not None else '-']
+        for num_workers in worker_counts:
+            (hda_time, hda_expanded, hda_length) = measure(level, FrontierHDAStar(heuristic, num_workers),
+                                                           args.time_limit)
+            if hda_length is None:
+                cells.append('-')
+            else:
+                # A plan longer than the one of A* is flagged, since both should be optimal
+                flag = '' if astar_length is None or hda_length == astar_length else f" (plan {hda_length})"
+                cells.append(f"{hda_time:.2f} ({astar_time / hda_time:.2f}x){flag}")
+
+        if args.markdown:
+            print('| ' + ' | '.join(cells) + ' |', flush=True)
+        else:
+            print('  '.join(f"{column}={cell}" for (column, cell) in zip(columns, cells)), flush=True)
+
+
+if __name__ == '__main__':
+    main()
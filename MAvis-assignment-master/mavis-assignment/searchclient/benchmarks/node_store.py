@@ -0,0 +1,115 @@
+# coding: utf-8
+#
+# Copyright 2021 The Technical University of Denmark
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#    http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Compares the memory needed per reached state, and the expansion speed, of a breadth-first search which keeps
+# HospitalState objects in a visited set and a FrontierBFS against one which keeps them in a HospitalNodeStore.
+# Memory is traced with tracemalloc and includes the containers of the search, i.e. everything that grows with the
+# number of reached states. The time is measured in a separate run without tracing.
+#
+# Usage (from the mavis-assignment directory):
+#   python searchclient/benchmarks/node_store.py levels/SACrunch.lvl levels/MAPF02.lvl
+#   python searchclient/benchmarks/node_store.py --states 200000 --markdown levels/*.lvl
+
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from domains.hospital import *
+from domains.hospital.node_store import HospitalNodeStore
+from strategies.bfs import FrontierBFS
+
+
+def load_level(path):
+    with open(path, "r") as f:
+        lines = [line.strip() for line in f.readlines()]
+    level = HospitalLevel.parse_level_lines(lines)
+    initial_state = HospitalState(level, level.initial_agent_positions, level.initial_box_positions)
+    goal_description = HospitalGoalDescription(level, level.box_goals + level.agent_goals)
+    initial_state.track_goals(goal_description)
+    return level, initial_state
+
+
+def search_objects(initial_state, action_set, max_states):
+    frontier = FrontierBFS()
+    frontier.add(initial_state)
+    visited = {initial_state}
+    while not frontier.is_empty() and len(visited) < max_states:
+        state = frontier.pop()
+        for joint_action in state.get_applicable_actions(action_set):
+            child = state.result(joint_action)
+            if child not in visited:
+                visited.add(child)
+                frontier.add(child)
+    return len(visited)
+
+
+def search_node_store(initial_state, action_set, max_states):
+    frontier = FrontierBFS()
+    nodes = HospitalNodeStore(initial_state)
+    frontier.add_node(nodes.add(initial_state, -1), initial_state)
+    while not frontier.is_empty() and len(nodes) < max_states:
+        node_id = frontier.pop_node()
+        nodes.closed[node_id] = 1
+        state = nodes.state(node_id)
+        for joint_action in state.get_applicable_actions(action_set):
+            child = state.result(joint_action)
+            if nodes.find(child) < 0:
+                frontier.add_node(nodes.add(child, node_id), child)
+    return len(nodes)
+
+
+def measure(path, search, max_states):
+    level, initial_state = load_level(path)
+    action_set = [DEFAULT_HOSPITAL_ACTION_LIBRARY] * level.num_agents
+
+    start = time.perf_counter()
+    num_states = search(initial_state, action_set, max_states)
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    search(initial_state, action_set, max_states)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return num_states, peak / num_states, num_states / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare state objects in sets against the node store per level.')
+    parser.add_argument('levels', nargs='+', help='Level files to measure.')
+    parser.add_argument('--states', type=int, default=100000, help='Number of states to reach per level.')
+    parser.add_argument('--markdown', action='store_true', help='Print the results as a markdown table.')
+    args = parser.parse_args()
+
+    if args.markdown:
+        print("| Level | States | Bytes/state (objects) | Bytes/state (node store) | States/s (objects) |"
+              " States/s (node store) |")
+        print("|-------|-------:|----------------------:|-------------------------:|-------------------:|"
+              "-----------------------:|")
+    for path in args.levels:
+        name = os.path.splitext(os.path.basename(path))[0]
+        num_states, object_bytes, object_rate = measure(path, search_objects, args.states)
+        _, node_bytes, node_rate = measure(path, search_node_store, args.states)
+        if args.markdown:
+            print(f"| {name} | {num_states} | {object_bytes:.0f} | {node_bytes:.0f} | {object_rate:.0f} |"
+                  f" {node_rate:.0f} |")
+        else:
+            print(f"{name}: {num_states} states, {object_bytes:.0f} vs {node_bytes:.0f} bytes/state, "
+                  f"{object_rate:.0f} vs {node_rate:.0f} states/s")
+
+
+if __name__ == '__main__':
+    main()
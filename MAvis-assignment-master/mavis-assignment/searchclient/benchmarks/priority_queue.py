@@ -0,0 +1,148 @@
+# coding: utf-8
+#
+# Copyright 2021 The Technical University of Denmark
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#    http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Compares the priority queues of the A* and greedy frontiers (see strategies/bestfirst.py): the binary heap
+# (PriorityQueue) and the BucketPriorityQueue with ties broken by the lowest h-value or LIFO.
+# - Without levels, the queues are measured alone, with the pushes and pops of a simulated A* search: every pop is
+#   followed by a few pushes of f-values at or slightly above the popped one. The time per operation is reported.
+# - With levels, each queue is measured in the search of graph_search with the same heuristic: the wall time of the
+#   search (excluding the preprocessing of the heuristic), the number of expanded states and the plan length. The
+#   tie-breaking decides which of the states with the same f-value is expanded first, so the number of expanded states
+#   and (for greedy search) the plan length may differ between the queues.
+#
+# Usage (from the mavis-assignment directory):
+#   python searchclient/benchmarks/priority_queue.py --operations 1000000
+#   python searchclient/benchmarks/priority_queue.py --strategy astar --markdown levels/SACrunch.lvl levels/SAsoko3_08.lvl
+
+import argparse
+import io
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+import telemetry
+import strategies.bestfirst as bestfirst
+from domains.hospital import *
+from search_algorithms.graph_search import graph_search
+from strategies.bestfirst import FrontierAStar, FrontierGreedy
+
+
+def load_level(path):
+    with open(path, "r") as f:
+        lines = [line.strip() for line in f.readlines()]
+    return HospitalLevel.parse_level_lines(lines)
+
+
+def measure_queue(queue_type, num_operations, seed):
+    """Returns the seconds per push or pop of the queue in a simulated A* search with 'num_operations' operations"""
+    bestfirst.queue_type = queue_type
+    priority_queue = bestfirst.create_integer_priority_queue()
+    rng = random.Random(seed)
+    # The f-value of a successor is the one of its parent or 2 more (one step further from or towards the goals), and
+    # its h-value decides the tie-breaking of the bucket queue
+    pushes = [(rng.choice((0, 0, 2)), rng.randrange(64)) for _ in range(1024)]
+
+    start = time.perf_counter()
+    priority_queue.push(0, 10, 10)
+    num_done = 1
+    element = 0
+    while num_done < num_operations:
+        f = priority_queue.peek_priority()
+        priority_queue.pop()
+        num_done += 1
+        for _ in range(3):
+            (step, h) = pushes[element & 1023]
+            element += 1
+            priority_queue.push(element, f + step, h)
+        num_done += 3
+    return (time.perf_counter() - start) / num_done
+
+
+def measure_search(level, frontier, time_limit):
+    """Returns the wall time, the number of expanded states and the plan length (None if unsolved) of a search"""
+    initial_state = HospitalState(level, level.initial_agent_positions, level.initial_box_positions)
+    goal_description = HospitalGoalDescription(level, level.box_goals + level.agent_goals)
+    action_set = [DEFAULT_HOSPITAL_ACTION_LIBRARY] * level.num_agents
+
+    # The counts are read from the final telemetry record, while the progress of the search is not shown
+    telemetry.output = io.StringIO()
+    telemetry.interval = float('inf')
+    stderr = sys.stderr
+    sys.stderr = open(os.devnull, 'w')
+    try:
+        start = time.perf_counter()
+        solved, plan = graph_search(initial_state, action_set, goal_description, frontier,
+                                    deadline=time.monotonic() + time_limit)
+        elapsed = time.perf_counter() - start
+    finally:
+        sys.stderr.close()
+        sys.stderr = stderr
+    end_record = json.loads(telemetry.output.getvalue().splitlines()[-1])
+    telemetry.output = None
+    return elapsed, end_record['expanded'], len(plan) if solved else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the heap and the bucket priority queues of the frontiers.')
+    parser.add_argument('levels', nargs='*', help='Level files to search. Without levels, the queues are measured alone.')
+    parser.add_argument('--queues', nargs='+', choices=bestfirst.QUEUE_TYPES, default=bestfirst.QUEUE_TYPES,
+                        help='The priority queues to compare (default all).')
+    parser.add_argument('--strategy', choices=['astar', 'greedy'], default='astar',
+                        help='The strategy of the searches (default astar).')
+    parser.add_argument('--heuristic', choices=['goalcount', 'advanced'], default='advanced',
+                        help='The heuristic of the searches (default advanced).')
+    parser.add_argument('--operations', type=int, default=1000000,
+                        help='Pushes and pops per queue without levels (default 1000000).')
+    parser.add_argument('--time-limit', type=float, default=60, help='Seconds per search (default 60).')
+    parser.add_argument('--markdown', action='store_true', help='Print the results as a markdown table.')
+    args = parser.parse_args()
+
+    if not args.levels:
+        for queue_type in args.queues:
+            seconds = measure_queue(queue_type, args.operations, seed=0)
+            print(f"queue={queue_type}  ns_per_operation={seconds * 1e9:.0f}", flush=True)
+        return
+
+    columns = ['Level'] + [f"{queue_type} {field}" for queue_type in args.queues
+                           for field in ('time (s)', 'expanded', 'plan')]
+    if args.markdown:
+        print('| ' + ' | '.join(columns) + ' |')
+        print('|' + '|'.join(['-------'] + ['------:'] * (len(columns) - 1)) + '|')
+
+    frontier_class = FrontierAStar if args.strategy == 'astar' else FrontierGreedy
+    for path in args.levels:
+        level = load_level(path)
+        heuristic = HospitalAdvancedHeuristics() if args.heuristic == 'advanced' else HospitalGoalCountHeuristics()
+        heuristic.preprocess(level)
+        # The heuristic computes some of its tables lazily during the search, so an untimed search warms it up first
+        measure_search(level, frontier_class(heuristic), args.time_limit)
+
+        cells = [os.path.splitext(os.path.basename(path))[0]]
+        for queue_type in args.queues:
+            # The frontier takes its priority queue from the module setting when it is constructed
+            bestfirst.queue_type = queue_type
+            (elapsed, expanded, length) = measure_search(level, frontier_class(heuristic), args.time_limit)
+            cells += [f"{elapsed:.2f}", str(expanded), str(length) if length is not None else '-']
+
+        if args.markdown:
+            print('| ' + ' | '.join(cells) + ' |', flush=True)
+        else:
+            print('  '.join(f"{column}={cell}" for (column, cell) in zip(columns, cells)), flush=True)
+
+
+if __name__ == '__main__':
+    main()
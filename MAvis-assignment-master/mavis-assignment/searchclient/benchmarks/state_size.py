@@ -0,0 +1,90 @@
+# coding: utf-8
+#
+# Copyright 2021 The Technical University of Denmark
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#    http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Measures how many bytes a HospitalState occupies once it is stored in the closed set.
+# The states are generated by a plain breadth-first expansion from the initial state and the memory is traced with
+# tracemalloc, so everything a state keeps alive (the state object, its packed cells, its joint action list, ...)
+# is included, while the static level information and the containers of the search itself are not.
+#
+# Usage (from the mavis-assignment directory):
+#   python searchclient/benchmarks/state_size.py levels/*.lvl
+#   python searchclient/benchmarks/state_size.py --states 20000 --markdown levels/SAD1.lvl
+
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+from collections import deque
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from domains.hospital import *
+
+
+def load_level(path):
+    with open(path, "r") as f:
+        lines = [line.strip() for line in f.readlines()]
+    level = HospitalLevel.parse_level_lines(lines)
+    initial_state = HospitalState(level, level.initial_agent_positions, level.initial_box_positions)
+    return level, initial_state
+
+
+def measure(path, max_states, time_limit):
+    level, initial_state = load_level(path)
+    action_set = [DEFAULT_HOSPITAL_ACTION_LIBRARY] * level.num_agents
+
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    visited = {initial_state}
+    queue = deque([initial_state])
+    deadline = time.time() + time_limit
+    while queue and len(visited) < max_states and time.time() < deadline:
+        state = queue.popleft()
+        for joint_action in state.get_applicable_actions(action_set):
+            child = state.result(joint_action)
+            if child not in visited:
+                visited.add(child)
+                queue.append(child)
+                if len(visited) >= max_states:
+                    break
+    after, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    containers = sys.getsizeof(visited) + sys.getsizeof(queue)
+    num_states = len(visited)
+    return level, num_states, (after - before - containers) / num_states
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure the memory footprint of a HospitalState per level.')
+    parser.add_argument('levels', nargs='+', help='Level files to measure.')
+    parser.add_argument('--states', type=int, default=5000, help='Number of states to generate per level.')
+    parser.add_argument('--time-limit', type=float, default=30.0, help='Maximum seconds spent generating per level.')
+    parser.add_argument('--markdown', action='store_true', help='Print the results as a markdown table.')
+    args = parser.parse_args()
+
+    if args.markdown:
+        print("| Level | Agents | Boxes | States | Bytes/state |")
+        print("|-------|-------:|------:|-------:|------------:|")
+    for path in args.levels:
+        level, num_states, bytes_per_state = measure(path, args.states, args.time_limit)
+        if args.markdown:
+            print(f"| {level.name} | {level.num_agents} | {level.num_boxes} | {num_states} | {bytes_per_state:.0f} |")
+        else:
+            print(f"{level.name:28s} agents: {level.num_agents:2d} boxes: {level.num_boxes:3d} "
+                  f"states: {num_states:6d} bytes/state: {bytes_per_state:7.1f}", flush=True)
+
+
+if __name__ == '__main__':
+    main()
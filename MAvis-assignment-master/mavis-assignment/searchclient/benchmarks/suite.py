@@ -0,0 +1,298 @@
+# coding: utf-8
+#
+# Copyright 2021 The Technical University of Denmark
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#    http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Solves a set of levels headlessly with every combination of the given strategies, heuristics and action libraries,
+# each in its own searchclient process, and records per run the wall time, the numbers of expanded and generated
+# states, the peak memory usage (RSS) and the plan length. The counts are read from the final record of
+# the search telemetry (see telemetry.py), and the peak RSS is sampled while the process runs. The suite sends the level
+# to the client and answers its joint actions like the server would (see fake_server.py), so every plan is also
+# validated.
+# Runs exceeding the timeout or the memory cap are killed. The results can be saved as CSV and/or JSON and compared
+# against a saved baseline, which flags runs that are no longer solved or got slower, bigger or longer.
+#
+# Usage (from the mavis-assignment directory):
+#   python searchclient/benchmarks/suite.py run --strategies bfs astar greedy --heuristics goalcount advanced \
+#       --timeout 60 --max-memory 2g --json baseline.json levels/SA*.lvl
+#   python searchclient/benchmarks/suite.py run --baseline baseline.json --json results.json levels/SA*.lvl
+#   python searchclient/benchmarks/suite.py compare results.json baseline.json
+
+import argparse
+import csv
+import glob
+import itertools
+import json
+import os
+import re
+import shlex
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import psutil
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from domains.hospital import HospitalLevel, HospitalSimulator
+from fake_server import load_level_lines, serve
+
+SEARCHCLIENT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+LEVELS_DIR = os.path.join(SEARCHCLIENT_DIR, os.pardir, 'levels')
+
+STRATEGIES = ['bfs', 'dfs', 'astar', 'greedy', 'hdastar', 'idastar', 'arastar']
+# The searchclient options of the heuristics and action libraries by name, where 'none' runs without a heuristic
+HEURISTIC_OPTIONS = {'none': [], 'goalcount': ['-goalcount'], 'advanced': ['-advancedheuristic']}
+ACTION_LIBRARY_OPTIONS = {'default': ['-defaultactions'], 'sticky': ['-sticky']}
+# Strategies which need a heuristic, and the strategies which ignore it and are therefore only run once per level
+INFORMED_STRATEGIES = {'astar', 'greedy', 'hdastar', 'idastar', 'arastar'}
+
+FIELDS = ['level', 'strategy', 'heuristic', 'action_library', 'status', 'wall_time', 'expanded', 'generated',
+          'peak_rss', 'plan_length']
+KEY_FIELDS = ('level', 'strategy', 'heuristic', 'action_library')
+
+# How often the memory usage of a run is sampled, and how often the run writes a telemetry record, in seconds
+POLL_INTERVAL = 0.05
+TELEMETRY_INTERVAL = 1.0
+
+
+def parse_memory(text: str) -> int:
+    match = re.fullmatch(r"([0-9]+)g", text)
+    if match is None:
+        raise argparse.ArgumentTypeError(f"Failed to parse max memory: {text}. Should be e.g. 8g to indicate 8 GB")
+    return int(match.group(1)) * 1024 * 1024 * 1024
+
+
+def configurations(strategies, heuristics, action_libraries):
+    """Yields the (strategy, heuristic, action library) combinations worth running"""
+    for (strategy, heuristic, action_library) in itertools.product(strategies, heuristics, action_libraries):
+        if strategy in INFORMED_STRATEGIES:
+            if heuristic != 'none':
+                yield strategy, heuristic, action_library
+        elif heuristic == heuristics[0]:
+            yield strategy, 'none', action_library
+
+
+def run_level(level_path, strategy, heuristic, action_library, timeout, max_memory, client_args):
+    """Solves a level in a searchclient process and returns the record of the run"""
+    record = dict.fromkeys(FIELDS)
+    record.update(level=os.path.splitext(os.path.basename(level_path))[0], strategy=strategy, heuristic=heuristic,
+                  action_library=action_library)
+
+    with tempfile.TemporaryDirectory() as directory:
+        telemetry_path = os.path.join(directory, 'telemetry.jsonl')
+        # The last telemetry record holds the counts of the run, also when it is killed before the search ends
+        command = [sys.executable, os.path.join(SEARCHCLIENT_DIR, 'searchclient.py'), f'-{strategy}',
+                   *HEURISTIC_OPTIONS[heuristic], *ACTION_LIBRARY_OPTIONS[action_library],
+                   '--max-memory', f'{max_memory // (1024 * 1024 * 1024)}g',
+                   '--telemetry', telemetry_path, '--telemetry-interval', str(TELEMETRY_INTERVAL),
+                   *client_args]
+
+        # The level is sent like the server sends it, with the indentation of its rows, which -level would strip
+        level_lines = load_level_lines(level_path)
+        simulator = HospitalSimulator(HospitalLevel.parse_level_lines(list(level_lines)))
+
+        start = time.perf_counter()
+        process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                   text=True, bufsize=1)
+        # The joint actions of the client are answered, and its stderr is read, on separate threads, such that the run
+        # never blocks on a full pipe
+        stderr_lines = []
+        reader = threading.Thread(target=lambda: stderr_lines.extend(process.stderr), daemon=True)
+        reader.start()
+        server = threading.Thread(target=serve, args=(process, simulator, level_lines), daemon=True)
+        server.start()
+        status = None
+        peak_rss = 0
+        try:
+            ps_process = psutil.Process(process.pid)
+            while process.poll() is None:
+                elapsed = time.perf_counter() - start
+                try:
+                    rss = ps_process.memory_info().rss
+                except psutil.NoSuchProcess:
+                    break
+                peak_rss = max(peak_rss, rss)
+                if elapsed > timeout:
+                    status = 'timeout'
+                    break
+                if rss > max_memory:
+                    status = 'memory'
+                    break
+                time.sleep(POLL_INTERVAL)
+        finally:
+            if process.poll() is None:
+                process.kill()
+            process.wait()
+            wall_time = time.perf_counter() - start
+        reader.join()
+        server.join()
+
+        last_record = None
+        if os.path.exists(telemetry_path):
+            with open(telemetry_path) as f:
+                for line in f:
+                    last_record = json.loads(line)
+
+    stderr = ''.join(stderr_lines)
+    plan_match = re.search(r"Found solution of length ([0-9]+)", stderr)
+    if status is None:
+        if plan_match is not None:
+            # The plan must also reach the goal in the simulator without any failed actions
+            status = 'solved' if simulator.solved_at is not None and simulator.num_failed_actions == 0 else 'invalid'
+        elif 'Stopping the search since the memory usage' in stderr:
+            status = 'memory'
+        elif last_record is not None and last_record['event'] == 'end':
+            status = 'unsolved'
+        else:
+            status = 'error'
+
+    record.update(status=status, wall_time=round(wall_time, 3), peak_rss=peak_rss)
+    if plan_match is not None:
+        record['plan_length'] = int(plan_match.group(1))
+    if last_record is not None:
+        record.update(expanded=last_record['expanded'], generated=last_record['generated'],
+                      peak_rss=max(peak_rss, last_record['rss']))
+    if status == 'error':
+        print(stderr, file=sys.stderr)
+    return record
+
+
+def write_results(records, csv_path, json_path):
+    if csv_path:
+        with open(csv_path, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=FIELDS)
+            writer.writeheader()
+            writer.writerows(records)
+    if json_path:
+        with open(json_path, 'w') as f:
+            json.dump(records, f, indent=1)
+
+
+def read_results(path):
+    """Reads the records of a run saved as JSON or CSV"""
+    if path.endswith('.csv'):
+        with open(path, newline='') as f:
+            records = list(csv.DictReader(f))
+        for record in records:
+            for field in ('wall_time', 'expanded', 'generated', 'peak_rss', 'plan_length'):
+                record[field] = None if record[field] == '' else float(record[field])
+        return records
+    with open(path) as f:
+        return json.load(f)
+
+
+def compare(records, baseline, tolerance, min_time):
+    """
+    Returns the regressions of the records against the baseline as (key, description) pairs. A run regressed if it
+    was solved in the baseline but is not anymore, or if its wall time, expanded states, peak RSS or plan length grew
+    by more than the tolerance (a fraction). Wall times below min_time seconds are too noisy to be compared.
+    """
+    baseline_by_key = {tuple(record[field] for field in KEY_FIELDS): record for record in baseline}
+    regressions = []
+    for record in records:
+        key = tuple(record[field] for field in KEY_FIELDS)
+        old = baseline_by_key.get(key)
+        if old is None or old['status'] != 'solved':
+            continue
+        if record['status'] != 'solved':
+            regressions.append((key, f"{record['status']}, was solved"))
+            continue
+        for field in ('wall_time', 'expanded', 'peak_rss', 'plan_length'):
+            (old_value, new_value) = (old[field], record[field])
+            if old_value is None or new_value is None:
+                continue
+            if field == 'wall_time' and max(old_value, new_value) < min_time:
+                continue
+            if new_value > old_value * (1 + tolerance):
+                regressions.append((key, f"{field} {new_value:g}, was {old_value:g} "
+                                         f"(+{100 * (new_value - old_value) / max(old_value, 1e-9):.0f}%)"))
+    return regressions
+
+
+def print_regressions(regressions):
+    for (key, description) in regressions:
+        print(f"REGRESSION {' '.join(key)}: {description}")
+    print(f"{len(regressions)} regression(s)")
+
+
+def format_record(record) -> str:
+    values = [record['level'], record['strategy'], record['heuristic'], record['action_library'], record['status'],
+              f"{record['wall_time']:.2f}s"]
+    for field in ('expanded', 'generated', 'peak_rss', 'plan_length'):
+        value = record[field]
+        if field == 'peak_rss' and value is not None:
+            value = f"{value / (1024 * 1024):.0f}MB"
+        values.append(f"{field}={'-' if value is None else value}")
+    return ' '.join(values)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the searchclient over a set of levels.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = subparsers.add_parser('run', help='Solve levels with a matrix of configurations.')
+    run_parser.add_argument('levels', nargs='*', help='Level files to solve (default: all levels).')
+    run_parser.add_argument('--strategies', nargs='+', choices=STRATEGIES, default=['astar', 'greedy'])
+    run_parser.add_argument('--heuristics', nargs='+', choices=list(HEURISTIC_OPTIONS), default=['advanced'],
+                            help='Heuristics of the informed strategies. Uninformed strategies run once per level.')
+    run_parser.add_argument('--action-libraries', nargs='+', choices=list(ACTION_LIBRARY_OPTIONS),
+                            default=['default'])
+    run_parser.add_argument('--timeout', type=float, default=60, help='Seconds per run (default 60).')
+    run_parser.add_argument('--max-memory', type=parse_memory, default='4g',
+                            help='Memory cap per run in GB, e.g. 2g (default 4g).')
+    run_parser.add_argument('--client-args', default='',
+                            help='Further searchclient options, e.g. "--operator-decomposition".')
+    run_parser.add_argument('--csv', help='Save the results as CSV to this file.')
+    run_parser.add_argument('--json', help='Save the results as JSON to this file.')
+    run_parser.add_argument('--baseline', help='Compare the results against these saved results (JSON or CSV).')
+    run_parser.add_argument('--tolerance', type=float, default=0.2,
+                            help='Relative growth flagged as a regression (default 0.2).')
+    run_parser.add_argument('--min-time', type=float, default=0.5,
+                            help='Wall times below this many seconds are not compared (default 0.5).')
+
+    compare_parser = subparsers.add_parser('compare', help='Compare saved results against a saved baseline.')
+    compare_parser.add_argument('results', help='Saved results (JSON or CSV).')
+    compare_parser.add_argument('baseline', help='Saved baseline (JSON or CSV).')
+    compare_parser.add_argument('--tolerance', type=float, default=0.2)
+    compare_parser.add_argument('--min-time', type=float, default=0.5)
+
+    args = parser.parse_args()
+
+    if args.command == 'compare':
+        regressions = compare(read_results(args.results), read_results(args.baseline), args.tolerance, args.min_time)
+        print_regressions(regressions)
+        sys.exit(1 if regressions else 0)
+
+    level_paths = args.levels or sorted(glob.glob(os.path.join(LEVELS_DIR, '*.lvl')))
+    client_args = shlex.split(args.client_args)
+    records = []
+    for level_path in level_paths:
+        for (strategy, heuristic, action_library) in configurations(args.strategies, args.heuristics,
+                                                                    args.action_libraries):
+            record = run_level(os.path.abspath(level_path), strategy, heuristic, action_library, args.timeout,
+                               args.max_memory, client_args)
+            print(format_record(record), flush=True)
+            records.append(record)
+    write_results(records, args.csv, args.json)
+
+    solved = sum(1 for record in records if record['status'] == 'solved')
+    print(f"Solved {solved} of {len(records)} runs")
+    if args.baseline:
+        regressions = compare(records, read_results(args.baseline), args.tolerance, args.min_time)
+        print_regressions(regressions)
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+# coding: utf-8
+#
+# Copyright 2021 The Technical University of Denmark
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#    http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import annotations
+import argparse
+import os
+import re
+import sys
+
+import search_algorithms.ara_star as ara_star
+import search_algorithms.hda_star as hda_star
+import search_algorithms.ida_star as ida_star
+from domains.hospital import *
+from strategies.bfs import FrontierBFS
+from strategies.dfs import FrontierDFS
+from strategies.bestfirst import FrontierARAStar, FrontierAStar, FrontierGreedy, FrontierHDAStar, FrontierIDAStar
+
+# A configuration of the searchclient, i.e. a strategy, a heuristic and an action library, can be written as
+# strategy[:heuristic[:action library]], e.g. 'astar:advanced' or 'bfs', see parse_config.
+# The functions below construct the parts of a configuration by name, like the options of searchclient.py.
+
+
+def create_action_library(action_library_name):
+    # Construct the requested action library
+    if action_library_name == 'default':
+        return DEFAULT_HOSPITAL_ACTION_LIBRARY
+    return None
+
+
+def create_heuristic(heuristic_name, level):
+    # Construct the requested heuristic
+    heuristic = None
+    if heuristic_name == 'goalcount':
+        heuristic = HospitalGoalCountHeuristics()
+    elif heuristic_name == 'advanced':
+        heuristic = HospitalAdvancedHeuristics()
+
+    # Some heuristics needs to preprocess the level to pre-compute distance lookup tables, matchings, etc.
+    if heuristic is not None:
+        heuristic.preprocess(level)
+    return heuristic
+
+
+def create_frontier(strategy_name, heuristic):
+    # If specific strategy is requested, construct the corresponding frontier
+    if strategy_name == 'bfs':
+        return FrontierBFS()
+    elif strategy_name == 'dfs':
+        return FrontierDFS()
+    elif strategy_name == 'astar':
+        return FrontierAStar(heuristic)
+    elif strategy_name == 'greedy':
+        return FrontierGreedy(heuristic)
+    elif strategy_name == 'hdastar':
+        return FrontierHDAStar(heuristic, hda_star.num_workers or os.cpu_count())
+    elif strategy_name == 'idastar':
+        return FrontierIDAStar(heuristic, ida_star.table_size)
+    elif strategy_name == 'arastar':
+        return FrontierARAStar(heuristic, ara_star.initial_weight, ara_star.weight_step)
+    print(f"Unrecognized strategy {strategy_name}", file=sys.stderr)
+    return None
+
+
+def parse_config(text):
+    # Returns the (strategy, heuristic, action library) names of a configuration written as e.g. 'astar:advanced'
+    match = re.fullmatch(r"(bfs|dfs|astar|greedy|hdastar|idastar|arastar)(?::(goalcount|advanced))?(?::(default))?", text)
+    if match is None:
+        raise argparse.ArgumentTypeError(f"Failed to parse configuration: {text}. Should be e.g. astar:advanced")
+    (strategy_name, heuristic_name, action_library_name) = match.groups()
+    if strategy_name in ('astar', 'greedy', 'hdastar', 'idastar', 'arastar') and heuristic_name is None:
+        raise argparse.ArgumentTypeError(f"The {strategy_name} strategy needs a heuristic, "
+                                         f"e.g. {strategy_name}:advanced")
+    return strategy_name, heuristic_name, action_library_name or 'default'
@@ -17,4 +17,5 @@ from domains.hospital.actions import *
 from domains.hospital.goal_description import HospitalGoalDescription
 from domains.hospital.heuristics import HospitalGoalCountHeuristics, HospitalAdvancedHeuristics
 from domains.hospital.level import HospitalLevel
+from domains.hospital.simulator import HospitalSimulator
 from domains.hospital.state import HospitalState
@@ -12,19 +12,11 @@
 # limitations under the License.
 from __future__ import annotations
 
-# pos_add and pos_sub are helper methods for performing element-wise addition and subtractions on positions
-# Ex: Given two positions A = (1, 2) and B = (3, 4), pos_add(A, B) == (4, 6) and pos_sub(B, A) == (2,2)
-from utils import pos_add, pos_sub
 from typing import Union, Tuple
 import domains.hospital.state as h_state
 
-# A dictionary mapping action names to the corresponding direction deltas2
-direction_deltas = {
-    'N': (-1, 0),
-    'S': (1, 0),
-    'E': (0, 1),
-    'W': (0, -1),
-}
+# The indices of the directions into the static lookup tables of the level, see HospitalLevel.compile_cell_graph
+from domains.hospital.level import direction_indices
 
 # An action class must implement three types be a valid action:
 # 1) is_applicable(self, agent_index, state) which return a boolean describing whether this action is valid for
@@ -43,6 +35,9 @@ direction_deltas = {
 #       a) destinations which contains all newly occupied cells.
 #       b) moved_boxes which contains the current position of boxes moved during the action, i.e. their position
 #          prior to being moved by the action.
+# Since walls never change, the actions do not compute positions or check walls themselves. Instead they look up the
+# cells involved from the agent's cell in the pre-computed tables of the level, which only contain the variants that
+# are geometrically possible. Cells are the integer cell IDs of HospitalLevel.
 # Note that 'agent_index' is the index of the agent in the state.agent_positions list which is often but *not always*
 # the same as the numerical value of the agent character.
 
@@ -56,14 +51,13 @@ class NoOpAction:
 
     def is_applicable(self, agent_index: int,  state: h_state.HospitalState) -> bool:
         # Optimization. NoOp can never change the state if we only have a single agent
-        return len(state.agent_positions) > 1
+        return len(state.agent_chars) > 1
 
     def result(self, agent_index: int, state: h_state.HospitalState):
         pass
 
     def conflicts(self, agent_index: int, state: h_state.HospitalState) -> tuple[list[Position], list[Position]]:
-        current_agent_position, _ = state.agent_positions[agent_index]
-        destinations = [current_agent_position]
+        destinations = [state.level.cell_positions[state.cells[agent_index]]]
         boxes_moved = []
         return destinations, boxes_moved
 
@@ -74,27 +68,25 @@ class NoOpAction:
 class MoveAction:
 
     def __init__(self, agent_direction):
-        self.agent_delta = direction_deltas.get(agent_direction)
+        self.agent_direction = direction_indices.get(agent_direction)
         self.name = "Move(%s)" % agent_direction
 
-    def calculate_positions(self, current_agent_position: Position) -> Position:
-        return pos_add(current_agent_position, self.agent_delta)
+    def calculate_cells(self, state: h_state.HospitalState, agent_index: int) -> int:
+        # Returns the new agent cell or -1 if the agent would move into a wall
+        return state.level.neighbours[self.agent_direction][state.cells[agent_index]]
 
     def is_applicable(self, agent_index: int,  state: h_state.HospitalState) -> bool:
-        current_agent_position, _ = state.agent_positions[agent_index]
-        new_agent_position = self.calculate_positions(current_agent_position)
-        return state.free_at(new_agent_position)
+        new_agent_cell = self.calculate_cells(state, agent_index)
+        return new_agent_cell >= 0 and state.entity_at(new_agent_cell) < 0
 
     def result(self, agent_index: int, state: h_state.HospitalState):
-        current_agent_position, agent_char = state.agent_positions[agent_index]
-        new_agent_position = self.calculate_positions(current_agent_position)
-        state.agent_positions[agent_index] = (new_agent_position, agent_char)
+        new_agent_cell = self.calculate_cells(state, agent_index)
+        state.move_agent(agent_index, new_agent_cell)
 
     def conflicts(self, agent_index: int, state: h_state.HospitalState) -> tuple[list[Position], list[Position]]:
-        current_agent_position, _ = state.agent_positions[agent_index]
-        new_agent_position = self.calculate_positions(current_agent_position)
+        new_agent_cell = self.calculate_cells(state, agent_index)
         # New agent position is a destination because it is unoccupied before the action and occupied after the action.
-        destinations = [new_agent_position]
+        destinations = [state.level.cell_positions[new_agent_cell]]
         # Since a Move action never moves a box, we can just return the empty value.
         boxes_moved = []
         return destinations, boxes_moved
@@ -102,40 +94,38 @@ class MoveAction:
     def __repr__(self):
         return self.name
 
-# Add your Push and Pull classes here.. Hint: follow the Move class as a template. 
 
 class PushAction:
 
     def __init__(self, agent_direction, box_direction):
-        self.agent_delta = direction_deltas.get(agent_direction)
-        self.box_delta = direction_deltas.get(box_direction)
+        self.agent_direction = direction_indices.get(agent_direction)
+        self.box_direction = direction_indices.get(box_direction)
         self.name = "Push(%s,%s)" % (agent_direction, box_direction)
 
-    def calculate_positions(self, current_agent_position):
-        new_agent_position = pos_add(current_agent_position, self.agent_delta)
-        new_box_position = pos_add(new_agent_position, self.box_delta)
-        return new_agent_position, new_box_position
+    def calculate_cells(self, state, agent_index):
+        # Returns the pair (box cell, new box cell), which is also the new agent cell, or None if impossible
+        return state.level.push_table[self.agent_direction][self.box_direction][state.cells[agent_index]]
 
     def is_applicable(self, agent_index, state):
-        current_agent_position, agent_char = state.agent_positions[agent_index]
-        new_agent_position, new_box_position = self.calculate_positions(current_agent_position)
-        box_index, box_char = state.box_at(new_agent_position)
-        return box_char \
-               and state.level.colors[box_char] == state.level.colors[agent_char] \
-               and state.free_at(new_box_position)
+        cells = self.calculate_cells(state, agent_index)
+        if cells is None:
+            return False
+        box_cell, new_box_cell = cells
+        box_index = state.entity_at(box_cell) - len(state.agent_chars)
+        return box_index >= 0 \
+               and state.level.colors[state.box_chars[box_index]] == state.level.colors[state.agent_chars[agent_index]] \
+               and state.entity_at(new_box_cell) < 0
 
     def result(self, agent_index, state):
-        current_agent_position, agent_char = state.agent_positions[agent_index]
-        new_agent_position, new_box_position = self.calculate_positions(current_agent_position)
-        box_index, box_char = state.box_at(new_agent_position)
-        state.agent_positions[agent_index] = (new_agent_position, agent_char)
-        state.box_positions[box_index] = (new_box_position, box_char)
+        box_cell, new_box_cell = self.calculate_cells(state, agent_index)
+        box_index = state.entity_at(box_cell) - len(state.agent_chars)
+        state.move_agent(agent_index, box_cell)
+        state.move_box(box_index, new_box_cell)
 
     def conflicts(self, agent_index, state):
-        current_agent_position, agent_char = state.agent_positions[agent_index]
-        old_box_position, new_box_position = self.calculate_positions(current_agent_position)
-        destinations = [new_box_position]
-        boxes_moved = [old_box_position]
+        box_cell, new_box_cell = self.calculate_cells(state, agent_index)
+        destinations = [state.level.cell_positions[new_box_cell]]
+        boxes_moved = [state.level.cell_positions[box_cell]]
         return destinations, boxes_moved
 
     def __repr__(self):
@@ -145,35 +135,35 @@ class PushAction:
 class PullAction:
 
     def __init__(self, agent_direction, box_direction):
-        self.agent_delta = direction_deltas.get(agent_direction)
-        self.box_delta = direction_deltas.get(box_direction)
+        self.agent_direction = direction_indices.get(agent_direction)
+        self.box_direction = direction_indices.get(box_direction)
         self.name = "Pull(%s,%s)" % (agent_direction, box_direction)
 
-    def calculate_positions(self, current_agent_position):
-        current_box_position = pos_sub(current_agent_position, self.box_delta)
-        new_agent_position = pos_add(current_agent_position, self.agent_delta)
-        return current_box_position, new_agent_position
+    def calculate_cells(self, state, agent_index):
+        # Returns the pair (box cell, new agent cell) or None if impossible
+        return state.level.pull_table[self.agent_direction][self.box_direction][state.cells[agent_index]]
 
     def is_applicable(self, agent_index,  state):
-        current_agent_position, agent_char = state.agent_positions[agent_index]
-        current_box_position, new_agent_position = self.calculate_positions(current_agent_position)
-        box_index, box_char = state.box_at(current_box_position)
-        return box_char \
-               and state.level.colors[box_char] == state.level.colors[agent_char] \
-               and state.free_at(new_agent_position)
+        cells = self.calculate_cells(state, agent_index)
+        if cells is None:
+            return False
+        box_cell, new_agent_cell = cells
+        box_index = state.entity_at(box_cell) - len(state.agent_chars)
+        return box_index >= 0 \
+               and state.level.colors[state.box_chars[box_index]] == state.level.colors[state.agent_chars[agent_index]] \
+               and state.entity_at(new_agent_cell) < 0
 
     def result(self, agent_index, state):
-        current_agent_position, agent_char = state.agent_positions[agent_index]
-        current_box_position, new_agent_position = self.calculate_positions(current_agent_position)
-        box_index, box_char = state.box_at(current_box_position)
-        state.agent_positions[agent_index] = (new_agent_position, agent_char)
-        state.box_positions[box_index] = (current_agent_position, box_char)
+        current_agent_cell = state.cells[agent_index]
+        box_cell, new_agent_cell = self.calculate_cells(state, agent_index)
+        box_index = state.entity_at(box_cell) - len(state.agent_chars)
+        state.move_agent(agent_index, new_agent_cell)
+        state.move_box(box_index, current_agent_cell)
 
     def conflicts(self, agent_index, state):
-        current_agent_position, _ = state.agent_positions[agent_index]
-        current_box_position, new_agent_position = self.calculate_positions(current_agent_position)
-        destinations = [new_agent_position]
-        boxes_moved = [current_box_position]
+        box_cell, new_agent_cell = self.calculate_cells(state, agent_index)
+        destinations = [state.level.cell_positions[new_agent_cell]]
+        boxes_moved = [state.level.cell_positions[box_cell]]
         return destinations, boxes_moved
 
     def __repr__(self):
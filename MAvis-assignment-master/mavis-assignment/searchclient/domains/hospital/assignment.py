@@ -0,0 +1,88 @@
+# coding: utf-8
+#
+# Copyright 2021 The Technical University of Denmark
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#    http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import annotations
+
+
+def min_cost_assignment(costs: list[list[int]]) -> tuple[int, list[int]]:
+    """
+    Solves the rectangular assignment problem for the given cost matrix with the Hungarian algorithm in O(n^2 m).
+    Each row is assigned to a distinct column (or each column to a distinct row, if there are more rows than columns)
+    such that the total cost is minimal.
+    Returns the total cost and a list with the assigned column of each row, or -1 for rows left unassigned.
+    """
+    num_rows = len(costs)
+    num_cols = len(costs[0]) if num_rows > 0 else 0
+    if num_rows == 0 or num_cols == 0:
+        return 0, [-1] * num_rows
+
+    if num_rows == 1:
+        row = costs[0]
+        col = min(range(num_cols), key=row.__getitem__)
+        return row[col], [col]
+
+    if num_rows > num_cols:
+        transposed = [list(col) for col in zip(*costs)]
+        total, col_assignment = min_cost_assignment(transposed)
+        assignment = [-1] * num_rows
+        for (col, row) in enumerate(col_assignment):
+            assignment[row] = col
+        return total, assignment
+
+    # Potentials u and v, with rows and columns 1-indexed and column 0 as a sentinel
+    infinity = float('inf')
+    u = [0] * (num_rows + 1)
+    v = [0] * (num_cols + 1)
+    row_of_col = [0] * (num_cols + 1)
+    way = [0] * (num_cols + 1)
+    for row in range(1, num_rows + 1):
+        row_of_col[0] = row
+        col0 = 0
+        min_slack = [infinity] * (num_cols + 1)
+        used = [False] * (num_cols + 1)
+        while True:
+            used[col0] = True
+            row0 = row_of_col[col0]
+            row_costs = costs[row0 - 1]
+            u_row0 = u[row0]
+            delta = infinity
+            col1 = 0
+            for col in range(1, num_cols + 1):
+                if not used[col]:
+                    slack = row_costs[col - 1] - u_row0 - v[col]
+                    if slack < min_slack[col]:
+                        min_slack[col] = slack
+                        way[col] = col0
+                    if min_slack[col] < delta:
+                        delta = min_slack[col]
+                        col1 = col
+            for col in range(num_cols + 1):
+                if used[col]:
+                    u[row_of_col[col]] += delta
+                    v[col] -= delta
+                else:
+                    min_slack[col] -= delta
+            col0 = col1
+            if row_of_col[col0] == 0:
+                break
+        # Augment along the alternating path
+        while col0 != 0:
+            col1 = way[col0]
+            row_of_col[col0] = row_of_col[col1]
+            col0 = col1
+
+    assignment = [-1] * num_rows
+    for col in range(1, num_cols + 1):
+        if row_of_col[col] != 0:
+            assignment[row_of_col[col] - 1] = col - 1
+    total = sum(costs[row][col] for (row, col) in enumerate(assignment))
+    return total, assignment
@@ -0,0 +1,103 @@
+# coding: utf-8
+#
+# Copyright 2021 The Technical University of Denmark
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#    http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import annotations
+import numpy as np
+
+import domains.hospital.level as h_level
+
+# Distance stored for cells which cannot be reached from the source cell
+UNREACHABLE = np.iinfo(np.uint16).max
+
+
+class HospitalDistanceTable:
+    """
+    Shortest-path distances between the free cells of a level, i.e. distances which take walls into account but
+    ignore agents and boxes.
+    The distances are computed by a breadth-first search over the compiled cell graph of the level (see
+    HospitalLevel.compile_cell_graph) from each source cell and stored in a dense NumPy array with one row per source
+    cell and one column per cell ID, using 2 bytes per entry.
+    The sources passed to the constructor (e.g. all goal cells, or None for every free cell) are computed up front.
+    Distances from any other source are computed the first time they are requested and kept afterwards, so lookups
+    are O(1) once a source has been seen.
+    """
+
+    def __init__(self, level: h_level.HospitalLevel, sources: list[int] = None):
+        self.level = level
+        self.num_cells = level.num_cells
+        self.adjacency = [[neighbours[cell] for neighbours in level.neighbours if neighbours[cell] >= 0]
+                          for cell in range(self.num_cells)]
+
+        if sources is None:
+            sources = range(self.num_cells)
+        sources = list(dict.fromkeys(sources))
+
+        # source_rows[cell] is the row of the table holding the distances from 'cell' or -1 if not yet computed
+        self.source_rows = np.full(self.num_cells, -1, dtype=np.int32)
+        self.table = np.empty((max(len(sources), 1), self.num_cells), dtype=np.uint16)
+        self.num_sources = 0
+        for source in sources:
+            self.add_source(source)
+
+    def add_source(self, source: int) -> np.ndarray:
+        """Computes the distances from the given source cell unless they are already known and returns them"""
+        row = self.source_rows[source]
+        if row >= 0:
+            return self.table[row]
+
+        if self.num_sources == len(self.table):
+            # Grow the table geometrically such that adding sources one at a time is amortised O(1)
+            grown_table = np.empty((2 * len(self.table), self.num_cells), dtype=np.uint16)
+            grown_table[:self.num_sources] = self.table[:self.num_sources]
+            self.table = grown_table
+
+        row = self.num_sources
+        self.table[row] = self._breadth_first_search(source)
+        self.source_rows[source] = row
+        self.num_sources += 1
+        return self.table[row]
+
+    def distances_from(self, source: int) -> np.ndarray:
+        """Returns the distances from the source cell to every cell, indexed by cell ID"""
+        return self.add_source(source)
+
+    def distance(self, source: int, target: int) -> int:
+        """Returns the shortest-path distance between two cells or UNREACHABLE if there is no path"""
+        row = self.source_rows[source]
+        if row < 0:
+            # Distances are symmetric, so a precomputed row for the target works just as well
+            row = self.source_rows[target]
+            if row >= 0:
+                return int(self.table[row, source])
+            return int(self.add_source(source)[target])
+        return int(self.table[row, target])
+
+    def nbytes(self) -> int:
+        """Returns the number of bytes used by the distance table"""
+        return self.table.nbytes + self.source_rows.nbytes
+
+    def _breadth_first_search(self, source: int) -> list[int]:
+        distances = [UNREACHABLE] * self.num_cells
+        distances[source] = 0
+        adjacency = self.adjacency
+        frontier = [source]
+        distance = 0
+        while frontier:
+            distance += 1
+            next_frontier = []
+            for cell in frontier:
+                for neighbour in adjacency[cell]:
+                    if distances[neighbour] == UNREACHABLE:
+                        distances[neighbour] = distance
+                        next_frontier.append(neighbour)
+            frontier = next_frontier
+        return distances
@@ -20,6 +20,10 @@ class HospitalGoalDescription:
     negative goal is satisfied when such an object is *not* at the goal position.
     The 'goal' member contains all goals (both agent and box goals) while 'agent_goal' and 'box_goal' only
     contains one kind. This double representation allows for quick and convenient lookup of goals of a specific kind
+    If all goals are positive, 'goal_chars' is additionally a lookup table from each cell ID to the character of the
+    goal at that cell (or None), which allows states to keep count of their satisfied goals as they are created.
+    See HospitalState.track_goals. 'box_goal_counts' then holds the number of goals of each box letter, i.e. how many
+    boxes of the letter are needed, see HospitalState.is_deadlocked.
     """
 
     def __init__(self, level, goals):
@@ -33,16 +37,38 @@ class HospitalGoalDescription:
             elif 'A' <= goal[1] <= 'Z':
                 self.box_goals.append(goal)
 
+        self.goal_chars = None
+        self.box_goal_counts = None
+        if all(is_positive_literal for (_, _, is_positive_literal) in self.goals):
+            self.goal_chars = [None] * level.num_cells
+            for (goal_position, goal_char, _) in self.goals:
+                self.goal_chars[level.cell_id(goal_position)] = goal_char
+            self.box_goal_counts = {}
+            for (_, goal_char, _) in self.box_goals:
+                self.box_goal_counts[goal_char] = self.box_goal_counts.get(goal_char, 0) + 1
+
     def is_goal(self, state):
         """Returns whether the given state satisfies all goals in the goal description"""
+        if state.pending_actions:
+            # Intermediate states of operator decomposition are never goals, see HospitalState
+            return False
+        if state.tracked_goals is self:
+            return state.num_satisfied_goals == len(self.goals)
+        return self.num_unsatisfied_goals(state) == 0
+
+    def num_unsatisfied_goals(self, state):
+        """Returns the number of goals in the goal description which the given state does not satisfy"""
+        if state.tracked_goals is self:
+            return len(self.goals) - state.num_satisfied_goals
+        num_unsatisfied = 0
         for (goal_position, goal_char, is_positive_literal) in self.goals:
             char = state.object_at(goal_position)
             if is_positive_literal and goal_char != char:
-                return False
+                num_unsatisfied += 1
             elif not is_positive_literal and goal_char == char:
-                return False
+                num_unsatisfied += 1
 
-        return True
+        return num_unsatisfied
 
     def color_filter(self, color):
         """Creates a copy of the goal descriptions where all entities of another color has been removed"""
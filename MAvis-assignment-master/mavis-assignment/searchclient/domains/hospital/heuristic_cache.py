@@ -0,0 +1,97 @@
+# coding: utf-8
+#
+# Copyright 2021 The Technical University of Denmark
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#    http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# A cache of the terms of a heuristic which only depend on the boxes (see BoxTermCache).
+#
+# Most states reached by a search differ from their parent by the position of an agent only, so the terms of the
+# heuristic which depend on the boxes, such as the matching of the boxes to their goals, are the same for many states.
+# A heuristic opts in by splitting its h-value into box terms and agent terms, and by creating a cache with
+# create_cache in its preprocess, which returns None unless the cache is enabled by --heuristic-cache.
+from __future__ import annotations
+from collections import OrderedDict
+
+import memory
+import domains.hospital.goal_description as h_goal_description
+import domains.hospital.level as h_level
+import domains.hospital.state as h_state
+
+# Whether the heuristics which support it cache their box terms, set by --heuristic-cache
+enabled = False
+
+# The fraction of --max-memory which a cache may take, and the number of entries of a cache without a memory limit
+MEMORY_FRACTION = 0.1
+DEFAULT_SIZE = 2**18
+
+# The estimated memory of an entry besides the cells of its boxes: the key, the node of the ordered dictionary and the
+# box terms of a heuristic with a few agents
+ENTRY_OVERHEAD = 300
+
+
+def create_cache(level: h_level.HospitalLevel) -> BoxTermCache:
+    """Returns a cache for the box terms of a heuristic preprocessing the level, or None if the cache is disabled"""
+    if not enabled:
+        return None
+    # The cells of the boxes take a few bytes each in the key, and a reference each in the box terms
+    entry_size = ENTRY_OVERHEAD + len(level.initial_box_positions) * 10
+    max_size = DEFAULT_SIZE if memory.max_usage == float('inf') else int(memory.max_usage * MEMORY_FRACTION / entry_size)
+    return BoxTermCache(max(max_size, 1))
+
+
+class BoxTermCache:
+    """
+    Remembers the box terms of a heuristic per configuration of the boxes, i.e. the cells of the boxes in a state,
+    and evicts the least recently used configuration once it holds 'max_size' of them. The box terms are only valid
+    for the goal description and the agents and boxes of the states they were computed for, so the cache is cleared
+    when those change.
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.goal_description = None
+        self.agent_chars = None
+        self.box_chars = None
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, state: h_state.HospitalState, goal_description: h_goal_description.HospitalGoalDescription,
+            compute_box_terms):
+        """Returns the box terms of the state, which are computed by compute_box_terms(state, goal_description) once"""
+        if (goal_description is not self.goal_description or state.agent_chars is not self.agent_chars
+                or state.box_chars is not self.box_chars):
+            self.entries.clear()
+            self.goal_description = goal_description
+            self.agent_chars = state.agent_chars
+            self.box_chars = state.box_chars
+
+        # The cells of the agents come first, see HospitalState
+        key = state.cells[len(state.agent_chars):].tobytes()
+        entries = self.entries
+        box_terms = entries.get(key)
+        if box_terms is not None:
+            entries.move_to_end(key)
+            self.hits += 1
+            return box_terms
+
+        self.misses += 1
+        box_terms = compute_box_terms(state, goal_description)
+        entries[key] = box_terms
+        if len(entries) > self.max_size:
+            entries.popitem(last=False)
+        return box_terms
+
+    def status_text(self) -> str:
+        lookups = self.hits + self.misses
+        hit_rate = 100 * self.hits / lookups if lookups > 0 else 0
+        return f"Heuristic cache: {self.hits} hits, {self.misses} misses ({hit_rate:.1f}% hits), " \
+               f"{len(self.entries)} of {self.max_size} entries"
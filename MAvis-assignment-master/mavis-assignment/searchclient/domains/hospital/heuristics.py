@@ -15,18 +15,28 @@ import sys
 import itertools
 import numpy as np
 from utils import pos_add, pos_sub, APPROX_INFINITY
-from collections import deque, defaultdict
+from collections import deque, defaultdict, OrderedDict
 
 import domains.hospital.state as h_state
 import domains.hospital.goal_description as h_goal_description
 import domains.hospital.level as h_level
+import domains.hospital.heuristic_cache as heuristic_cache
+from domains.hospital.assignment import min_cost_assignment
+from domains.hospital.distances import HospitalDistanceTable, UNREACHABLE
+
+# Levels with at most this many free cells get the distances between all pairs of cells computed up front.
+# On larger levels only the distances from the goal cells are, while the rest are computed on demand.
+ALL_PAIRS_MAX_CELLS = 2000
+
+# Maximum number of box-to-goal matchings remembered by the advanced heuristics
+MATCHING_CACHE_SIZE = 2**16
 
 class HospitalGoalCountHeuristics:
 
     # Remember that the goal count heuristics is simply the number of goals that are not satisfied in the current state. 
 
     def __init__(self):
-        self.num_goals_to_reach = 0
+        pass
 
     def preprocess(self, level: h_level.HospitalLevel):
         # This function will be called a single time prior to the search allowing us to preprocess the level such as
@@ -34,19 +44,8 @@ class HospitalGoalCountHeuristics:
         pass
 
     def h(self, state: h_state.HospitalState, goal_description: h_goal_description.HospitalGoalDescription) -> int:
-        # for (goal_position, goal_char, is_positive_literal) in goal_description.agent_goals: # goals has both agent_goals ad box_goals
-        #     char = state.object_at(goal_position)
-            
-        #     if is_positive_literal and goal_char != char:
-        #         self.num_goals_to_reach += 1 
-        #     elif not is_positive_literal and goal_char == char:
-        #         self.num_goals_to_reach += 1 
-    
-        for index in range(goal_description.num_sub_goals()):
-            sub_goal = goal_description.get_sub_goal(index)
-            if not sub_goal.is_goal(state): self.num_goals_to_reach += 1
-
-        return self.num_goals_to_reach
+        # States reached during the search keep count of their satisfied goals, so this is O(1) (see track_goals)
+        return goal_description.num_unsatisfied_goals(state)
 
 
 
@@ -55,57 +54,151 @@ class HospitalAdvancedHeuristics:
     # h-values should ideally always decrease when getting closer to the goal.
     # must be a greater improvement from goal count heuristic.
 
-    def __init__(self):
-        self.distances = {}
-        # self.agent_to_box = {}
-        # self.box_to_goal = {}
-        self.goal_chars = None
+    def __init__(self, matching_cache_size: int = MATCHING_CACHE_SIZE):
+        self.level = None
+        self.distances = None
+
+        # The goals of the goal description and the entities of the state last seen by h, grouped by character and
+        # color (see _group_entities). They only change when h is called for another goal description or kind of state.
+        self.goal_description = None
         self.agent_chars = None
-        self.goals = None
+        self.box_chars = None
+        self.box_goal_cells = None
+        self.box_ranges = None
+        self.agent_goal_cells = None
+        self.agent_letters = None
+
+        # Minimum-cost matchings keyed by (goal cells, box cells) of a letter in least recently used order
+        self.matching_cache = OrderedDict()
+        self.matching_cache_size = matching_cache_size
+        self.matching_cache_hits = 0
+        self.matching_cache_misses = 0
+
+        # The box terms of h per configuration of the boxes, with --heuristic-cache (see heuristic_cache.py)
+        self.box_cache = None
+
 
-    
     def preprocess(self, level: h_level.HospitalLevel):
         # This function will be called a single time prior to the search allowing us to preprocess the level such as
         # pre-computing lookup tables or other acceleration structures
         # initially compute all exact distances between pairs of cells in the level.
         # then look up distances in O(1) time when computing your heuristic values.
 
-        # Heuristic 1: Manhattan Distance
+        # Heuristic 1: Shortest-path distances around the walls, see distances.py
 
-        rows = len(level.walls)
-        cols = len(level.walls[0])
-        
-        for x1 in range(rows):
-            for y1 in range(cols):
-                for x2 in range(rows):
-                    for y2 in range(cols):
-                        self.distances[(x1, y1), (x2, y2)] = (abs(x2 - x1) + abs(y2 - y1))
-            
+        self.level = level
+        goal_cells = [level.cell_id(goal_position) for (goal_position, _, _) in level.box_goals + level.agent_goals]
+        sources = None if level.num_cells <= ALL_PAIRS_MAX_CELLS else goal_cells
+        self.distances = HospitalDistanceTable(level, sources)
 
-    def h(self, state: h_state.HospitalState, goal_description: h_goal_description.HospitalGoalDescription) -> int:
-        total_distance = 0
-        box_to_goal_distance = 0
-        agent_to_box_distance = 0
-
-        # for loop thru boxes and their corresponding goals
-        # find the distance from each box and add to total_distance
-
-        # heuristic 1
-        box_index = 0
-        for (goal_position, goal_char, is_positive_literal) in goal_description.box_goals:
-            box = state.box_positions[box_index]
-            box_to_goal_distance += self.distances[goal_position, box[0]]
-            box_index += 1
-
-        total_distance += box_to_goal_distance
+        # The matchings of heuristic 2 and the boxes which heuristic 3 lets the agents walk to only depend on the boxes
+        self.box_cache = heuristic_cache.create_cache(level)
 
-        # heuristic 2 -- goes with heuristic 1
-        box_index = 0
-        for (agent_coordinate, _) in state.agent_positions:
-            box = state.box_positions[box_index]
-            agent_to_box_distance += self.distances[agent_coordinate, box[0]]
-            box_index += 1
 
-        total_distance += agent_to_box_distance
+    def h(self, state: h_state.HospitalState, goal_description: h_goal_description.HospitalGoalDescription) -> int:
+        # Heuristic 2: The boxes of each letter are matched to the goals of that letter such that the sum of the
+        # distances from the boxes to their goals is minimal.
+        # Heuristic 3: Each agent must at least walk to the nearest box of its color which is not yet on its goal,
+        # and agents with a goal of their own must also reach it.
+        if (goal_description is not self.goal_description or state.agent_chars is not self.agent_chars
+                or state.box_chars is not self.box_chars):
+            self._group_entities(state, goal_description)
+
+        if self.box_cache is not None:
+            (total_distance, agent_box_cells) = self.box_cache.get(state, goal_description, self._box_terms)
+        else:
+            (total_distance, agent_box_cells) = self._box_terms(state, goal_description)
+
+        cells = state.cells
+        distance = self.distances.distance
+        for (agent_index, box_cells) in enumerate(agent_box_cells):
+            agent_cell = cells[agent_index]
+            agent_to_box_distance = UNREACHABLE
+            for box_cell in box_cells:
+                agent_to_box_distance = min(agent_to_box_distance, distance(box_cell, agent_cell))
+            if agent_to_box_distance != UNREACHABLE:
+                # Being next to the box is enough to move it
+                total_distance += max(agent_to_box_distance - 1, 0)
+
+            goal_cell = self.agent_goal_cells[agent_index]
+            if goal_cell is not None:
+                total_distance += distance(goal_cell, agent_cell)
 
         return total_distance
+
+    def _box_terms(self, state: h_state.HospitalState,
+                   goal_description: h_goal_description.HospitalGoalDescription) -> tuple[int, tuple[tuple[int, ...]]]:
+        """
+        Returns the sum of the costs of the matchings of heuristic 2, together with the cells of the boxes that each
+        agent may have to move, i.e. the matched boxes of its color which are not on their goal yet.
+        """
+        cells = state.cells
+        total_distance = 0
+        unfinished_boxes = {}
+        for (letter, goal_cells) in self.box_goal_cells.items():
+            (start, end) = self.box_ranges.get(letter, (0, 0))
+            (box_to_goal_distance, unfinished_box_cells) = self._match(goal_cells, tuple(cells[start:end]))
+            total_distance += box_to_goal_distance
+            unfinished_boxes[letter] = unfinished_box_cells
+
+        agent_box_cells = tuple(tuple(itertools.chain.from_iterable(unfinished_boxes[letter] for letter in letters))
+                                for letters in self.agent_letters)
+        return total_distance, agent_box_cells
+
+    def _match(self, goal_cells: tuple[int, ...], box_cells: tuple[int, ...]) -> tuple[int, tuple[int, ...]]:
+        """
+        Returns the cost of a minimum-cost matching between the goal cells and the box cells of a letter, together
+        with the cells of the matched boxes that are not on their goal yet.
+        """
+        key = (goal_cells, box_cells)
+        cache = self.matching_cache
+        matching = cache.get(key)
+        if matching is not None:
+            cache.move_to_end(key)
+            self.matching_cache_hits += 1
+            return matching
+
+        self.matching_cache_misses += 1
+        box_cell_list = list(box_cells)
+        costs = [self.distances.distances_from(goal_cell)[box_cell_list].tolist() for goal_cell in goal_cells]
+        (cost, assignment) = min_cost_assignment(costs)
+        unfinished_box_cells = tuple(box_cells[box] for (goal, box) in enumerate(assignment)
+                                     if box >= 0 and costs[goal][box] > 0)
+        matching = (cost, unfinished_box_cells)
+
+        cache[key] = matching
+        if len(cache) > self.matching_cache_size:
+            cache.popitem(last=False)
+        return matching
+
+    def _group_entities(self, state: h_state.HospitalState,
+                        goal_description: h_goal_description.HospitalGoalDescription):
+        # Negative goals are not taken into account
+        level = self.level
+        box_goal_cells = defaultdict(list)
+        for (goal_position, goal_char, is_positive_literal) in goal_description.box_goals:
+            if is_positive_literal:
+                box_goal_cells[goal_char].append(level.cell_id(goal_position))
+        agent_goal_cells = {}
+        for (goal_position, goal_char, is_positive_literal) in goal_description.agent_goals:
+            if is_positive_literal:
+                agent_goal_cells[goal_char] = level.cell_id(goal_position)
+
+        # Boxes are sorted by letter, so the boxes of each letter occupy a contiguous range of the packed cells
+        num_agents = len(state.agent_chars)
+        box_ranges = {}
+        for (box_index, box_char) in enumerate(state.box_chars):
+            (start, _) = box_ranges.get(box_char, (num_agents + box_index, 0))
+            box_ranges[box_char] = (start, num_agents + box_index + 1)
+
+        # The level of the state may leave agents and boxes without a color, see HospitalLevel.restrict
+        colors = state.level.colors
+        self.goal_description = goal_description
+        self.agent_chars = state.agent_chars
+        self.box_chars = state.box_chars
+        self.box_goal_cells = {letter: tuple(cells) for (letter, cells) in box_goal_cells.items()}
+        self.box_ranges = box_ranges
+        self.agent_goal_cells = [agent_goal_cells.get(agent_char) for agent_char in state.agent_chars]
+        self.agent_letters = [[letter for letter in self.box_goal_cells
+                               if colors.get(agent_char) is not None and colors[letter] == colors[agent_char]]
+                              for agent_char in state.agent_chars]
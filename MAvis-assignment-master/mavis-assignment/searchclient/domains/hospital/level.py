@@ -11,7 +11,24 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import copy
+import random
 import sys
+from collections import defaultdict
+from utils import pos_add
+
+# Fixed seed for the Zobrist keys, such that the hash of a state is the same across runs and processes
+ZOBRIST_SEED = 0x5EED
+
+# A dictionary mapping action names to the corresponding direction deltas. The order of the directions is also the
+# order of the per-direction neighbour tables of the level, see HospitalLevel.compile_cell_graph
+direction_deltas = {
+    'N': (-1, 0),
+    'S': (1, 0),
+    'E': (0, 1),
+    'W': (0, -1),
+}
+direction_indices = {direction: index for (index, direction) in enumerate(direction_deltas)}
 
 
 class HospitalLevel:
@@ -25,6 +42,15 @@ class HospitalLevel:
       See goal_description.py for further detail
     - initial_agent_positions and initial_box_positions are lists of the initial positions of agents and boxes in
       the format (position, character).
+    - Every free (non-wall) cell is also identified by a dense integer ID, which is what HospitalState uses
+      internally. cell_id and cell_positions convert between the two representations.
+    - Since walls never change, the level also holds a compiled cell graph over the free cells: neighbour tables and
+      tables of the cells involved in every Move/Push/Pull variant from each cell. See compile_cell_graph.
+    - zobrist_keys maps each agent and box character to a list of random keys, one per cell. The hash of a state is
+      the XOR of the keys of all its (character, cell) pairs, see HospitalState.compute_hash.
+    - dead_cells maps each box letter with goals to a table over the cell IDs which is 1 for the cells from where a
+      box of that letter can never reach any of its goals, see compute_dead_cells. movable_letters are the box
+      letters which at least one agent has the color to move.
     """
 
     def __init__(self, name, walls, colors, agent_goals, box_goals, initial_agent_positions, initial_box_positions):
@@ -44,6 +70,105 @@ class HospitalLevel:
         self.num_agent_goals = len(self.agent_goals)
         self.num_box_goals = len(self.box_goals)
 
+        self.num_rows = len(self.walls)
+        self.num_cols = max((len(row) for row in self.walls), default=0)
+
+        self.compile_cell_graph()
+        self.compute_dead_cells()
+
+        rng = random.Random(ZOBRIST_SEED)
+        self.zobrist_keys = {char: [rng.getrandbits(60) for _ in range(self.num_cells)] for char in sorted(self.colors)}
+
+    def compile_cell_graph(self):
+        """
+        Assigns dense IDs to the free cells and pre-computes the static lookup tables used by the actions:
+        - neighbours[direction][cell] is the free cell next to 'cell' in the given direction or -1 if it is a wall.
+          This is also the destination of a Move.
+        - push_table[agent_direction][box_direction][cell] is the pair (box cell, new box cell) of a Push from 'cell'
+          or None if the push is geometrically impossible, i.e. if either cell is a wall or the box would be pushed
+          back into the agent.
+        - pull_table[agent_direction][box_direction][cell] is the pair (box cell, new agent cell) of a Pull from
+          'cell' or None if the pull is geometrically impossible.
+        Directions are indices into direction_deltas, which are ordered such that 'direction ^ 1' is the opposite
+        direction.
+        """
+        # The typecode is the smallest unsigned array type able to hold every cell ID of the level
+        self.cell_positions = [(row, col) for row in range(self.num_rows) for col in range(self.num_cols)
+                               if not self.walls[row][col]]
+        self.cell_ids = {position: cell for (cell, position) in enumerate(self.cell_positions)}
+        self.num_cells = len(self.cell_positions)
+        self.cell_typecode = 'H' if self.num_cells <= 0xFFFF else 'I'
+
+        deltas = list(direction_deltas.values())
+        self.neighbours = [[self.cell_ids.get(pos_add(position, delta), -1) for position in self.cell_positions]
+                           for delta in deltas]
+
+        self.push_table = [[[None] * self.num_cells for _ in deltas] for _ in deltas]
+        self.pull_table = [[[None] * self.num_cells for _ in deltas] for _ in deltas]
+        for agent_direction in range(len(deltas)):
+            for box_direction in range(len(deltas)):
+                push_cells = self.push_table[agent_direction][box_direction]
+                pull_cells = self.pull_table[agent_direction][box_direction]
+                opposite_box_direction = self.neighbours[box_direction ^ 1]
+                for cell in range(self.num_cells):
+                    # Push: the agent moves into the box cell while the box moves on in the box direction
+                    box_cell = self.neighbours[agent_direction][cell]
+                    if box_cell >= 0:
+                        new_box_cell = self.neighbours[box_direction][box_cell]
+                        if new_box_cell >= 0 and new_box_cell != cell:
+                            push_cells[cell] = (box_cell, new_box_cell)
+                    # Pull: the box follows the agent into the agent cell from the opposite side of the box direction
+                    box_cell = opposite_box_direction[cell]
+                    new_agent_cell = self.neighbours[agent_direction][cell]
+                    if box_cell >= 0 and new_agent_cell >= 0 and new_agent_cell != box_cell:
+                        pull_cells[cell] = (box_cell, new_agent_cell)
+
+    def compute_dead_cells(self):
+        """
+        Computes the static dead cells of each box letter, i.e. the cells from where a box of that letter can never be
+        moved onto any goal of the letter, regardless of where the agents and the other boxes are.
+        A box can move into a free neighbouring cell if either the cell behind the box is free, such that an agent can
+        push it, or the cell beyond the neighbouring cell is free, such that an agent can pull it. The cells from where
+        a goal can be reached are found by a breadth-first search backwards along such moves from the goal cells.
+        Boxes which no agent can move are treated as walls.
+        """
+        agent_colors = {self.colors[agent_char] for (_, agent_char) in self.initial_agent_positions}
+        self.movable_letters = frozenset(char for (char, color) in self.colors.items()
+                                         if 'A' <= char <= 'Z' and color in agent_colors)
+
+        blocked = bytearray(self.num_cells)
+        for (box_position, box_char) in self.initial_box_positions:
+            if box_char not in self.movable_letters:
+                blocked[self.cell_ids[box_position]] = 1
+
+        goal_cells = defaultdict(list)
+        for (goal_position, goal_char, is_positive_literal) in self.box_goals:
+            if is_positive_literal:
+                goal_cells[goal_char].append(self.cell_ids[goal_position])
+
+        neighbours = self.neighbours
+        self.dead_cells = {}
+        for (letter, cells) in goal_cells.items():
+            live = bytearray(self.num_cells)
+            frontier = []
+            for cell in cells:
+                live[cell] = 1
+                if letter in self.movable_letters and not blocked[cell]:
+                    frontier.append(cell)
+            while frontier:
+                cell = frontier.pop()
+                for direction in range(len(neighbours)):
+                    # A box moving in 'direction' into 'cell' comes from the opposite neighbour
+                    box_cell = neighbours[direction ^ 1][cell]
+                    if box_cell < 0 or live[box_cell] or blocked[box_cell]:
+                        continue
+                    behind_cell = neighbours[direction ^ 1][box_cell]
+                    beyond_cell = neighbours[direction][cell]
+                    if (behind_cell >= 0 and not blocked[behind_cell]) or (beyond_cell >= 0 and not blocked[beyond_cell]):
+                        live[box_cell] = 1
+                        frontier.append(box_cell)
+            self.dead_cells[letter] = bytes(1 - is_live for is_live in live)
+
     @staticmethod
     def parse_level_lines(level_lines):
         # Reverse the lines in the level file such that we can efficiently read the next line using 'pop'
@@ -125,9 +250,28 @@ class HospitalLevel:
 
         return HospitalLevel(level_name, walls, colors, agent_goals, box_goals, initial_agent_positions, initial_box_positions)
 
+    def restrict(self, chars):
+        """
+        Returns a copy of the level in which only the agents and box letters of the given characters have a color, so
+        only those agents can move boxes and only the boxes of those letters can be moved, while the other boxes stay
+        where they are, like walls. The copy shares all tables with this level, and since removing boxes from the
+        movable ones only adds dead cells, the dead cells of this level remain valid for it.
+        """
+        level = copy.copy(self)
+        level.colors = {char: color if char in chars else None for (char, color) in self.colors.items()}
+        level.movable_letters = self.movable_letters.intersection(chars)
+        return level
+
+    def cell_id(self, position):
+        """Returns the integer ID of the free cell at the requested position or -1 if there is a wall"""
+        return self.cell_ids.get(position, -1)
+
     def wall_at(self, position):
-        """Returns True if there is a wall at the requested position and False otherwise"""
-        return self.walls[position[0]][position[1]]
+        """
+        Returns True if there is a wall at the requested position and False otherwise.
+        Positions outside the level are treated as walls, since some levels are not fully enclosed by walls.
+        """
+        return position not in self.cell_ids
 
     def agent_goal_at(self, position):
         """If there is an agent goal at the requested position, its letter is returned and None otherwise"""
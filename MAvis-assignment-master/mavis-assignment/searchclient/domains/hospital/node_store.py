@@ -0,0 +1,167 @@
+# coding: utf-8
+#
+# Copyright 2021 The Technical University of Denmark
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#    http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import annotations
+from array import array
+
+import domains.hospital.actions as actions
+import domains.hospital.state as h_state
+
+# Number of slots in the hash index of a new store. The index doubles whenever it becomes half full.
+INITIAL_INDEX_SIZE = 1 << 12
+
+
+class HospitalNodeStore:
+    """
+    The node store holds every state reached during a search in contiguous arrays instead of HospitalState objects.
+    Each state is identified by an integer node ID, and the store keeps per node:
+    - its packed cells (see HospitalState.cells) in a single flat array, num_entities cells per node,
+    - its hash value, the node ID of its parent, its path cost, its number of satisfied goals (see
+      HospitalState.track_goals) and the ID of the joint action leading to it, where the distinct joint actions are
+      stored once in 'joint_actions',
+    - whether it has been expanded, i.e. is closed, and whether it is an intermediate state of operator decomposition.
+    An open-addressing hash index over the node IDs finds the node of a state, whether it is open or closed, such
+    that the store replaces the closed set of the search as well as the membership index of the frontier.
+    This costs around 50 bytes per node plus 2 bytes per entity, against several hundred bytes for a HospitalState
+    object with its cells in a set and a frontier.
+    All states must descend from the same initial state, i.e. share its level and agent and box characters.
+    """
+
+    def __init__(self, initial_state: h_state.HospitalState):
+        self.initial_state = initial_state
+        self.num_entities = len(initial_state.cells)
+
+        self.cells = array(initial_state.cells.typecode)
+        self.hashes = array('q')
+        self.parents = array('i')
+        self.path_costs = array('i')
+        self.action_ids = array('i')
+        self.num_satisfied_goals = array('i')
+        self.closed = bytearray()
+        self.intermediate = bytearray()
+
+        self.joint_actions = []
+        self.joint_action_ids = {}
+
+        self.index = array('i', [-1]) * INITIAL_INDEX_SIZE
+        self.index_mask = INITIAL_INDEX_SIZE - 1
+
+    def __len__(self) -> int:
+        return len(self.parents)
+
+    def find(self, state: h_state.HospitalState) -> int:
+        """Returns the node ID of the given state or -1 if the state is not in the store"""
+        state_hash = state._hash
+        hashes = self.hashes
+        index = self.index
+        mask = self.index_mask
+        slot = state_hash & mask
+        while True:
+            node_id = index[slot]
+            if node_id < 0:
+                return -1
+            if hashes[node_id] == state_hash and self._is_state_of(node_id, state):
+                return node_id
+            slot = (slot + 1) & mask
+
+    def add(self, state: h_state.HospitalState, parent_id: int) -> int:
+        """Adds a state which is not yet in the store as an open node with the given parent and returns its node ID"""
+        node_id = len(self.parents)
+        self.cells.extend(state.cells)
+        self.hashes.append(state._hash)
+        self.parents.append(parent_id)
+        self.path_costs.append(state.path_cost)
+        self.num_satisfied_goals.append(state.num_satisfied_goals)
+        self.closed.append(0)
+        if state.pending_actions:
+            self.intermediate.append(1)
+            self.action_ids.append(self._joint_action_id(state.pending_actions))
+        else:
+            self.intermediate.append(0)
+            self.action_ids.append(-1 if state.action is None else self._joint_action_id(state.action))
+
+        if 2 * len(self.parents) > len(self.index):
+            self._grow_index()
+        else:
+            self._insert_into_index(node_id)
+        return node_id
+
+    def update(self, node_id: int, state: h_state.HospitalState, parent_id: int):
+        """Lets the node of the state be reached through the given (cheaper) path instead and opens the node again"""
+        self.parents[node_id] = parent_id
+        self.path_costs[node_id] = state.path_cost
+        if not state.pending_actions and state.action is not None:
+            self.action_ids[node_id] = self._joint_action_id(state.action)
+        self.closed[node_id] = 0
+
+    def state(self, node_id: int) -> h_state.HospitalState:
+        """
+        Creates the state of the node, which has the correct path cost and goal count but no parent or action,
+        except for intermediate states which need their parent for their expansion
+        """
+        start = node_id * self.num_entities
+        template = self.initial_state
+        state = template._successor(self.cells[start:start + self.num_entities], None, None)
+        state.path_cost = self.path_costs[node_id]
+        state._hash = self.hashes[node_id]
+        state.num_satisfied_goals = self.num_satisfied_goals[node_id]
+        if self.intermediate[node_id]:
+            state.pending_actions = self.joint_actions[self.action_ids[node_id]]
+            state.parent = self.state(self.parents[node_id])
+        return state
+
+    def extract_plan(self, node_id: int) -> list[list[actions.AnyAction]]:
+        """Extracts the plan leading to the node by walking backwards through the parent IDs"""
+        reverse_plan = []
+        while self.parents[node_id] >= 0:
+            reverse_plan.append(self.joint_actions[self.action_ids[node_id]])
+            node_id = self.parents[node_id]
+        reverse_plan.reverse()
+        return reverse_plan
+
+    def nbytes(self) -> int:
+        """Returns the number of bytes used by the arrays of the store, i.e. excluding the joint actions"""
+        arrays = (self.cells, self.hashes, self.parents, self.path_costs, self.action_ids, self.num_satisfied_goals,
+                  self.index)
+        return sum(a.itemsize * a.buffer_info()[1] for a in arrays) + len(self.closed) + len(self.intermediate)
+
+    def _is_state_of(self, node_id: int, state: h_state.HospitalState) -> bool:
+        start = node_id * self.num_entities
+        if self.cells[start:start + self.num_entities] != state.cells:
+            return False
+        if self.intermediate[node_id]:
+            return self.joint_actions[self.action_ids[node_id]] == state.pending_actions
+        return not state.pending_actions
+
+    def _joint_action_id(self, joint_action) -> int:
+        joint_action = tuple(joint_action)
+        action_id = self.joint_action_ids.get(joint_action)
+        if action_id is None:
+            action_id = len(self.joint_actions)
+            self.joint_actions.append(joint_action)
+            self.joint_action_ids[joint_action] = action_id
+        return action_id
+
+    def _insert_into_index(self, node_id: int):
+        index = self.index
+        mask = self.index_mask
+        slot = self.hashes[node_id] & mask
+        while index[slot] >= 0:
+            slot = (slot + 1) & mask
+        index[slot] = node_id
+
+    def _grow_index(self):
+        size = 2 * len(self.index)
+        self.index = array('i', [-1]) * size
+        self.index_mask = size - 1
+        for node_id in range(len(self.parents)):
+            self._insert_into_index(node_id)
@@ -0,0 +1,120 @@
+# coding: utf-8
+#
+# Copyright 2021 The Technical University of Denmark
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#    http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import annotations
+
+import domains.hospital.actions as actions
+import domains.hospital.goal_description as h_goal_description
+import domains.hospital.level as h_level
+import domains.hospital.state as h_state
+
+
+class HospitalSimulator:
+    """
+    Executes joint actions on a level the way the MAvis server does, such that plans can be checked without it.
+    Each joint action is executed in a single step in which:
+    1) every action which is not applicable in the state before the step fails,
+    2) every applicable action which conflicts with another applicable action fails, i.e. when two actions have the
+       same destination or move the same box, both fail (see the conflicts method of the actions),
+    3) the remaining actions are applied together, while the agents with failed actions stand still.
+    Unlike during search, NoOp is always applicable, also in single-agent levels.
+    The state starts as the initial state of the level and 'num_steps' counts the executed joint actions, while
+    'solved_at' is the number of joint actions after which the goal was first reached (or None) and
+    'num_failed_actions' counts the actions which failed.
+    """
+
+    def __init__(self, level: h_level.HospitalLevel, action_library: list[actions.AnyAction] = None):
+        if action_library is None:
+            action_library = actions.DEFAULT_HOSPITAL_ACTION_LIBRARY
+        self.level = level
+        self.goal_description = h_goal_description.HospitalGoalDescription(level, level.box_goals + level.agent_goals)
+        self.actions_by_name = {action.name: action for action in action_library}
+        self.no_op = actions.NoOpAction()
+        self.state = None
+        self.num_steps = 0
+        self.solved_at = None
+        self.num_failed_actions = 0
+        self.reset()
+
+    def reset(self):
+        """Returns to the initial state of the level"""
+        level = self.level
+        self.state = h_state.HospitalState(level, level.initial_agent_positions, level.initial_box_positions)
+        self.state.track_goals(self.goal_description)
+        self.num_steps = 0
+        self.solved_at = 0 if self.is_solved() else None
+        self.num_failed_actions = 0
+
+    def is_solved(self) -> bool:
+        return self.goal_description.is_goal(self.state)
+
+    def parse_joint_action(self, line: str) -> list[actions.AnyAction]:
+        """
+        Parses a joint action in the format of the server protocol, e.g. 'Move(E)|NoOp', and raises a ValueError if it
+        is malformed
+        """
+        names = line.strip().split('|')
+        if len(names) != len(self.state.agent_chars):
+            raise ValueError(f"Expected {len(self.state.agent_chars)} actions but got {len(names)}: {line.strip()}")
+        joint_action = []
+        for name in names:
+            action = self.actions_by_name.get(name.strip())
+            if action is None:
+                raise ValueError(f"Unknown action: {name.strip()}")
+            joint_action.append(action)
+        return joint_action
+
+    def step(self, joint_action: list[actions.AnyAction]) -> list[bool]:
+        """Executes a joint action and returns for each agent whether its action succeeded"""
+        state = self.state
+        state._occupancy = state._build_occupancy()
+        successes = [isinstance(action, actions.NoOpAction) or action.is_applicable(agent_index, state)
+                     for (agent_index, action) in enumerate(joint_action)]
+
+        # Actions which share a destination or a moved box with another action fail together
+        destination_agents = {}
+        box_agents = {}
+        for (agent_index, action) in enumerate(joint_action):
+            if successes[agent_index] and not isinstance(action, actions.NoOpAction):
+                (destinations, boxes_moved) = action.conflicts(agent_index, state)
+                for destination in destinations:
+                    destination_agents.setdefault(destination, []).append(agent_index)
+                for box in boxes_moved:
+                    box_agents.setdefault(box, []).append(agent_index)
+        for agent_indices in list(destination_agents.values()) + list(box_agents.values()):
+            if len(agent_indices) > 1:
+                for agent_index in agent_indices:
+                    successes[agent_index] = False
+        state._occupancy = None
+
+        executed = [action if success else self.no_op for (action, success) in zip(joint_action, successes)]
+        self.state = state.result(executed)
+        # The states of the plan are not kept alive through their parents
+        self.state.parent = None
+        self.num_steps += 1
+        self.num_failed_actions += successes.count(False)
+        if self.solved_at is None and self.is_solved():
+            self.solved_at = self.num_steps
+        return successes
+
+    def validate(self, plan: list[list[actions.AnyAction]]) -> tuple[bool, list[tuple[int, int]]]:
+        """
+        Executes a plan from the initial state and returns whether the goal was reached, together with the failed
+        actions as (step, agent index) pairs. A plan is valid if it reaches the goal without any failed actions.
+        """
+        self.reset()
+        failed_actions = []
+        for (step, joint_action) in enumerate(plan):
+            for (agent_index, success) in enumerate(self.step(joint_action)):
+                if not success:
+                    failed_actions.append((step, agent_index))
+        return self.solved_at is not None, failed_actions
@@ -12,9 +12,8 @@
 # limitations under the License.
 from __future__ import annotations
 
-import copy
-import itertools
 import random
+from array import array
 
 # Set fixed seed for random shuffle (ensures deterministic runs)
 random.seed(a=0, version=2)
@@ -27,13 +26,38 @@ class HospitalState:
     """
     HospitalState stores all *dynamic* information regarding a state in the hospital state,
     that is, it only contains the agent positions and the box positions.
-    Both agent and box positions are stored in the format (position, character).
+    Both agent and box positions are exposed in the format (position, character).
     Note that the index of a particular agents and boxes is *not* necessarily fixed across states.
     The *static* information is instead stored in the HospitalLevel class in the level.py file.
     This separation greatly reduces the memory usage since we only store static information once.
+
+    Internally the state is packed as compactly as possible, since the closed set holds every state generated:
+    - 'cells' is an array of cell IDs (see HospitalLevel.cell_id), first one per agent and then one per box.
+    - 'agent_chars' and 'box_chars' are the characters of the entities in the same order. They never change during
+      a search and are therefore shared by reference between a state and all of its successors.
+    - Boxes are kept sorted by (character, cell) which makes boxes of the same letter indistinguishable.
+    - The hash value is a Zobrist hash (see HospitalLevel.zobrist_keys). It is computed from scratch only for states
+      created through the constructor and is otherwise updated incrementally by XOR as the actions move agents and
+      boxes in result(). Since boxes of the same letter share keys, their order does not affect the hash.
+
+    A state can also keep count of how many goals of a goal description it satisfies, see track_goals. The count is
+    inherited by the successors and updated as the actions move agents and boxes, which makes goal tests O(1).
+
+    With operator decomposition (see use_operator_decomposition), the agents commit to their actions one at a time.
+    The state reached after some but not all agents have committed is an intermediate state: its parent is the state
+    in which the joint action started, 'pending_actions' holds the actions committed so far, and the committed actions
+    have already been applied to its cells such that heuristics can tell them apart. Applicability and conflicts are
+    still determined in the parent. Only the state reached once the last agent commits is a regular state, which is
+    never a goal before then.
+
+    While a state is being expanded, it additionally holds an occupancy index mapping each occupied cell to the index
+    of the entity occupying it, such that agent_at, box_at, object_at and free_at are O(1) for the many applicability
+    checks of an expansion. The index is released again afterwards to keep the states in the closed set small;
+    outside of an expansion, the lookups fall back to a scan of the packed cells.
     """
 
-    level = None
+    __slots__ = ('level', 'agent_chars', 'box_chars', 'cells', 'parent', 'action', 'path_cost', '_hash',
+                 '_occupancy', 'tracked_goals', 'num_satisfied_goals', 'pending_actions')
 
     def __init__(
         self,
@@ -43,23 +67,129 @@ class HospitalState:
         parent = None,
         action: actions.AnyAction = None
     ):
+        box_positions = sorted(box_positions, key=lambda box: (box[1], box[0]))
         self.level = level
-        self.agent_positions = agent_positions
-        self.box_positions = box_positions
+        self.agent_chars = tuple(agent_char for (_, agent_char) in agent_positions)
+        self.box_chars = tuple(box_char for (_, box_char) in box_positions)
+        self.cells = array(level.cell_typecode, [level.cell_id(position) for (position, _) in agent_positions] +
+                                                [level.cell_id(position) for (position, _) in box_positions])
         self.parent = parent
         self.action = action
         self.path_cost = 0 if parent is None else parent.path_cost + 1
+        self._hash = self.compute_hash()
+        self._occupancy = None
+        self.tracked_goals = None
+        self.num_satisfied_goals = 0
+        self.pending_actions = None
+
+    @property
+    def agent_positions(self) -> list[tuple[tuple[int, int], str]]:
+        cell_positions = self.level.cell_positions
+        return [(cell_positions[cell], agent_char) for (cell, agent_char) in zip(self.cells, self.agent_chars)]
+
+    @property
+    def box_positions(self) -> list[tuple[tuple[int, int], str]]:
+        cell_positions = self.level.cell_positions
+        num_agents = len(self.agent_chars)
+        return [(cell_positions[self.cells[num_agents + idx]], box_char) for (idx, box_char) in enumerate(self.box_chars)]
+
+    def agent_position(self, agent_index: int) -> tuple[int, int]:
+        """Returns the position of the agent with the given index"""
+        return self.level.cell_positions[self.cells[agent_index]]
+
+    def compute_hash(self) -> int:
+        """Computes the Zobrist hash of the state from scratch"""
+        zobrist_keys = self.level.zobrist_keys
+        value = 0
+        for (cell, char) in zip(self.cells, self.agent_chars + self.box_chars):
+            if char != '':
+                value ^= zobrist_keys[char][cell]
+        return value
+
+    def track_goals(self, goal_description):
+        """
+        Makes the state, and all states subsequently reached from it, keep count of how many goals of the goal
+        description they satisfy. The goal description must only consist of positive goals, otherwise this is a no-op.
+        """
+        # Count from scratch, i.e. without any previously tracked goal description
+        self.tracked_goals = None
+        self.num_satisfied_goals = 0
+        if goal_description.goal_chars is not None:
+            self.num_satisfied_goals = len(goal_description.goals) - goal_description.num_unsatisfied_goals(self)
+            self.tracked_goals = goal_description
+
+    def use_operator_decomposition(self):
+        """
+        Makes the state, and all states subsequently reached from it, expand joint actions one agent at a time, such
+        that a multi-agent state has at most as many successors as a single agent has applicable actions instead of
+        the product of all of them. This is a no-op for single-agent states.
+        """
+        if len(self.agent_chars) > 1:
+            self.pending_actions = ()
+
+    def move_agent(self, agent_index: int, cell: int):
+        """Moves the agent with the given index. Only meant to be used by actions while a successor is constructed"""
+        agent_char = self.agent_chars[agent_index]
+        old_cell = self.cells[agent_index]
+        keys = self.level.zobrist_keys[agent_char]
+        self._hash ^= keys[old_cell] ^ keys[cell]
+        if self.tracked_goals is not None:
+            goal_chars = self.tracked_goals.goal_chars
+            self.num_satisfied_goals += (goal_chars[cell] == agent_char) - (goal_chars[old_cell] == agent_char)
+        self.cells[agent_index] = cell
+
+    def move_box(self, box_index: int, cell: int):
+        """
+        Moves the box with the given index. Only meant to be used by actions while a successor is constructed.
+        The box is immediately moved to its sorted place among the boxes of the same letter, so box indices obtained
+        before the call should not be reused afterwards.
+        """
+        cells = self.cells
+        box_chars = self.box_chars
+        num_agents = len(self.agent_chars)
+        idx = box_index
+        box_char = box_chars[idx]
+        old_cell = cells[num_agents + idx]
+        keys = self.level.zobrist_keys[box_char]
+        self._hash ^= keys[old_cell] ^ keys[cell]
+        if self.tracked_goals is not None:
+            goal_chars = self.tracked_goals.goal_chars
+            self.num_satisfied_goals += (goal_chars[cell] == box_char) - (goal_chars[old_cell] == box_char)
+        while idx > 0 and box_chars[idx - 1] == box_char and cells[num_agents + idx - 1] > cell:
+            cells[num_agents + idx] = cells[num_agents + idx - 1]
+            idx -= 1
+        while idx < len(box_chars) - 1 and box_chars[idx + 1] == box_char and cells[num_agents + idx + 1] < cell:
+            cells[num_agents + idx] = cells[num_agents + idx + 1]
+            idx += 1
+        cells[num_agents + idx] = cell
+
+    def entity_at(self, cell: int) -> int:
+        """
+        Returns the index into 'cells' of the entity at the given cell ID or -1 if the cell is not occupied.
+        Indices below len(agent_chars) are agents, the remaining are boxes.
+        """
+        occupancy = self._occupancy
+        if occupancy is not None:
+            return occupancy.get(cell, -1)
+        cells = self.cells
+        return cells.index(cell) if cell in cells else -1
+
+    def _build_occupancy(self) -> dict[int, int]:
+        occupancy = dict(zip(self.cells, range(len(self.cells))))
+        # Agents filtered away by e.g. a color filter do not occupy any cell
+        for (idx, agent_char) in enumerate(self.agent_chars):
+            if agent_char == '' and occupancy.get(self.cells[idx]) == idx:
+                del occupancy[self.cells[idx]]
+        return occupancy
 
     def agent_at(self, position: tuple[int, int]) -> tuple[int, str]:
         """
         Returns the index and character of the agent at the given position.
         If there is no agent at the position, -1,'' is returned instead.
         """
-        for (idx, (agent_position, agent_char)) in enumerate(self.agent_positions):
-            if agent_char == '':
-                continue
-            if agent_position == position:
-                return idx, agent_char
+        idx = self.entity_at(self.level.cell_id(position))
+        if 0 <= idx < len(self.agent_chars) and self.agent_chars[idx] != '':
+            return idx, self.agent_chars[idx]
         return -1, ''
 
     def box_at(self, position: tuple[int, int]) -> tuple[int, str]:
@@ -67,11 +197,9 @@ class HospitalState:
         Returns the index and character of the box at the given position.
         If there is no box at the position, -1,'' is returned instead.
         """
-        for (idx, (box_position, box_char)) in enumerate(self.box_positions):
-            if box_char == '':
-                continue
-            if box_position == position:
-                return idx, box_char
+        idx = self.entity_at(self.level.cell_id(position)) - len(self.agent_chars)
+        if idx >= 0:
+            return idx, self.box_chars[idx]
         return -1, ''
 
     def object_at(self, position: tuple[int, int]) -> str:
@@ -80,18 +208,98 @@ class HospitalState:
         It can be used for checks where we do not care whether it is an agent or a box, e.g. when checking
         for obstacles. If there is no object at the position, -1,'' is returned instead.
         """
-        idx, agent_char = self.agent_at(position)
-        if agent_char != '':
-            return agent_char
-        else:
-            idx, box_char = self.box_at(position)
-            return box_char
+        idx = self.entity_at(self.level.cell_id(position))
+        if idx < 0:
+            return ''
+        num_agents = len(self.agent_chars)
+        return self.agent_chars[idx] if idx < num_agents else self.box_chars[idx - num_agents]
 
     def free_at(self, position: tuple[int, int]) -> bool:
         """Returns True iff there are no objects at the requested location"""
-        return not self.level.wall_at(position) and \
-               self.agent_at(position)[1] == '' and \
-               self.box_at(position)[1] == ''
+        cell = self.level.cell_id(position)
+        return cell >= 0 and self.entity_at(cell) < 0
+
+    def is_deadlocked(self, goal_description) -> bool:
+        """
+        Returns True if a box moved into place by the action leading to this state provably prevents the goal
+        description from ever being satisfied. That is the case if the box is needed for a goal of its letter but it is
+        on a static dead cell (see HospitalLevel.compute_dead_cells) or frozen, and too few other boxes of the letter
+        are left to satisfy the goals. It is also the case if the box is frozen on a goal of another character.
+        A box is frozen if it can neither be pushed nor pulled along any axis because of walls and other frozen boxes.
+        Only the moved boxes are examined, since a state inherits the deadlocks of its parent. Goal descriptions with
+        negative goals are never considered deadlocked.
+        """
+        parent = self.parent
+        goal_chars = goal_description.goal_chars
+        # Boxes of intermediate states may still be freed by the actions of the agents which have yet to commit
+        if parent is None or goal_chars is None or self.pending_actions:
+            return False
+        num_agents = len(self.agent_chars)
+        packed_box_cells = self.cells[num_agents:]
+        parent_box_cells = parent.cells[num_agents:]
+        if packed_box_cells == parent_box_cells:
+            return False
+
+        dead_cells = self.level.dead_cells
+        box_goal_counts = goal_description.box_goal_counts
+        box_cells = dict(zip(packed_box_cells, self.box_chars))
+        parent_box_cells = set(parent_box_cells)
+        frozen = {}
+        for (cell, box_char) in box_cells.items():
+            if cell in parent_box_cells or goal_chars[cell] == box_char:
+                continue
+            if goal_chars[cell] is not None and self._is_frozen(cell, box_cells, frozen):
+                return True
+            num_needed = box_goal_counts.get(box_char, 0)
+            if num_needed > 0 and (dead_cells[box_char][cell] or self._is_frozen(cell, box_cells, frozen)):
+                num_usable = 0
+                for (other_cell, other_char) in box_cells.items():
+                    if other_char == box_char and (goal_chars[other_cell] == box_char or
+                                                   not (dead_cells[box_char][other_cell] or
+                                                        self._is_frozen(other_cell, box_cells, frozen))):
+                        num_usable += 1
+                if num_usable < num_needed:
+                    return True
+        return False
+
+    def _is_frozen(self, cell: int, box_cells: dict[int, str], frozen: dict[int, bool], assumed: set[int] = None):
+        """
+        Returns whether the box at the cell is frozen, treating the boxes at the 'assumed' cells as frozen.
+        'frozen' memoizes the results found without any assumptions, as well as the boxes found not to be frozen, since
+        those can also move when fewer boxes are assumed to be frozen.
+        """
+        if cell in frozen:
+            return frozen[cell]
+        if box_cells[cell] not in self.level.movable_letters:
+            frozen[cell] = True
+            return True
+
+        is_top_level = assumed is None
+        if is_top_level:
+            assumed = set()
+        assumed.add(cell)
+
+        def blocked(neighbour):
+            if neighbour < 0 or neighbour in assumed:
+                return True
+            return neighbour in box_cells and self._is_frozen(neighbour, box_cells, frozen, assumed)
+
+        # Along each axis, the box can move in a direction if the cell in that direction is free and either the cell
+        # behind the box (push) or the cell beyond the one it moves into (pull) is free for the agent
+        neighbours = self.level.neighbours
+        is_frozen = True
+        for direction in range(len(neighbours)):
+            next_cell = neighbours[direction][cell]
+            if blocked(next_cell):
+                continue
+            if not blocked(neighbours[direction ^ 1][cell]) or not blocked(neighbours[direction][next_cell]):
+                is_frozen = False
+                break
+
+        assumed.discard(cell)
+        if is_top_level or not is_frozen:
+            frozen[cell] = is_frozen
+        return is_frozen
 
     def extract_plan(self) -> list[actions.AnyAction]:
         """Extracts a plan from the search tree by walking backwards through the search tree"""
@@ -112,7 +320,7 @@ class HospitalState:
 
         for agent_index, action in enumerate(joint_action):
             # We ignore actions for filtered agents
-            if self.agent_positions[agent_index][1] == '':
+            if self.agent_chars[agent_index] == '':
                 continue
             # Compute destinations and moved boxes for action
             action_destinations, action_boxes = action.conflicts(agent_index, self)
@@ -130,16 +338,29 @@ class HospitalState:
         return False
 
     def result(self, joint_action: list[actions.AnyAction]):
-        """Computes the state resulting from applying a joint action to this state"""
-        new_state = HospitalState(self.level, copy.copy(self.agent_positions), copy.copy(self.box_positions),
-                                  self, joint_action)
+        """
+        Computes the state resulting from applying a joint action to this state.
+        With operator decomposition, the joint action can also be partial, i.e. hold the actions of the first agents
+        only, which results in an intermediate state.
+        """
+        if self.pending_actions:
+            # The joint action (including the pending actions) is applied to the state where it started
+            return self.parent.result(joint_action)
+
+        new_state = self._successor(self.cells[:], self, joint_action)
 
+        # The actions move the boxes into their sorted place, see move_box. Keeping the box positions sorted ensures
+        # that the boxes are indistinguishable which significantly reduces the search space size.
+        # The actions also update the hash of the new state as they move agents and boxes.
         for (agent_index, action) in enumerate(joint_action):
             action.result(agent_index, new_state)
 
-        # Sorting the box positions ensures that the boxes are indistinguishable which significantly
-        # reduces the search space size.
-        new_state.box_positions.sort()
+        if self.pending_actions is not None and len(joint_action) < len(self.agent_chars):
+            # An intermediate state does not take a step yet, see use_operator_decomposition
+            new_state.action = None
+            new_state.path_cost = self.path_cost
+            new_state.pending_actions = tuple(joint_action)
+            new_state._hash ^= hash(new_state.pending_actions)
 
         return new_state
 
@@ -147,13 +368,30 @@ class HospitalState:
         """Computes the state resulting from applying a sequence of joint actions (a plan) to this state"""
         # If the plan is empty, just return a new copy of the current state
         if len(plan) == 0:
-            return HospitalState(self.level, copy.copy(self.agent_positions), copy.copy(self.box_positions))
+            return self._successor(self.cells[:], None, None)
         # Otherwise, result each action in the plan
         new_state = self.result(plan[0])
         for joint_action in plan[1:]:
             new_state = new_state.result(joint_action)
         return new_state
 
+    def _successor(self, cells: array, parent, action):
+        """Creates a state sharing the static fields of this state without going through the (slower) constructor"""
+        new_state = HospitalState.__new__(HospitalState)
+        new_state.level = self.level
+        new_state.agent_chars = self.agent_chars
+        new_state.box_chars = self.box_chars
+        new_state.cells = cells
+        new_state.parent = parent
+        new_state.action = action
+        new_state.path_cost = 0 if parent is None else parent.path_cost + 1
+        new_state._hash = self._hash
+        new_state._occupancy = None
+        new_state.tracked_goals = self.tracked_goals
+        new_state.num_satisfied_goals = self.num_satisfied_goals
+        new_state.pending_actions = None if self.pending_actions is None else ()
+        return new_state
+
     def is_applicable(self, joint_action: list[actions.AnyAction]) -> bool:
         """Returns whether all individual actions in the joint_action is applicable in this state"""
         for agent_index, action in enumerate(joint_action):
@@ -163,30 +401,81 @@ class HospitalState:
 
     def get_applicable_actions(self, action_set: list[list[actions.AnyAction]]):
         """Returns a list of all applicable joint_action in this state"""
-        num_agents = len(self.agent_positions)
+        num_agents = len(self.agent_chars)
+        pending_actions = self.pending_actions
+        # With operator decomposition, only the next agent to commit to an action is considered, in the state where
+        # the joint action started
+        agent_indices = range(num_agents) if pending_actions is None else [len(pending_actions)]
+        state = self.parent if pending_actions else self
 
         # Determine all applicable actions for each individual agent, i.e. without consideration of conflicts.
-        applicable_actions = [[] for _ in range(num_agents)]
+        # The occupancy index makes each of the many object lookups of the applicability checks O(1).
+        applicable_actions = []
 
-        for agent_index in range(num_agents):
-            for action in action_set[agent_index]:
-                if action.is_applicable(agent_index, self):
-                    applicable_actions[agent_index].append(action)
+        state._occupancy = state._build_occupancy()
+        for agent_index in agent_indices:
+            applicable_actions.append([action for action in action_set[agent_index]
+                                       if action.is_applicable(agent_index, state)])
+        state._occupancy = None
 
-        # Determine all applicable joint actions, but checking all combinations of the individual applicable actions
-        # We can skip this step if there only is one agent
-        applicable_joint_actions = []
+        # Determine all applicable joint actions, i.e. the combinations of the individual applicable actions which do
+        # not conflict. We can skip this step if there only is one agent
         if num_agents == 1:
-            for action in applicable_actions[0]:
-                applicable_joint_actions.append([action])
+            applicable_joint_actions = [[action] for action in applicable_actions[0]]
         else:
-            for joint_action in itertools.product(*applicable_actions):
-                if not self.is_conflicting(joint_action):
-                    applicable_joint_actions.append(joint_action)
+            applicable_joint_actions = state._conflict_free_joint_actions(pending_actions or (), applicable_actions)
 
         random.shuffle(applicable_joint_actions)
         return applicable_joint_actions
 
+    def _conflict_free_joint_actions(self, committed_actions: tuple[actions.AnyAction, ...],
+                                     applicable_actions: list[list[actions.AnyAction]]) -> list[tuple]:
+        """
+        Returns every extension of the committed actions of the first agents with one applicable action per
+        subsequent agent such that no two actions conflict (see is_conflicting).
+        The combinations are built one agent at a time and a partial combination is abandoned as soon as it conflicts,
+        so conflicting combinations are never enumerated in full.
+        """
+        agent_chars = self.agent_chars
+        destinations = set()
+        active_boxes = set()
+        for (agent_index, action) in enumerate(committed_actions):
+            if agent_chars[agent_index] != '':
+                action_destinations, action_boxes = action.conflicts(agent_index, self)
+                destinations.update(action_destinations)
+                active_boxes.update(action_boxes)
+
+        # The destinations and moved boxes of each applicable action, computed once instead of once per combination
+        first_agent_index = len(committed_actions)
+        options = []
+        for (agent_index, agent_actions) in enumerate(applicable_actions, first_agent_index):
+            if agent_chars[agent_index] == '':
+                # We ignore conflicts of filtered agents
+                options.append([(action, (), ()) for action in agent_actions])
+            else:
+                options.append([(action, *action.conflicts(agent_index, self)) for action in agent_actions])
+
+        joint_actions = []
+        joint_action = list(committed_actions)
+
+        def extend(option_index):
+            if option_index == len(options):
+                joint_actions.append(tuple(joint_action))
+                return
+            for (action, action_destinations, action_boxes) in options[option_index]:
+                if destinations.intersection(action_destinations) or active_boxes.intersection(action_boxes):
+                    continue
+                destinations.update(action_destinations)
+                active_boxes.update(action_boxes)
+                joint_action.append(action)
+                extend(option_index + 1)
+                joint_action.pop()
+                destinations.difference_update(action_destinations)
+                active_boxes.difference_update(action_boxes)
+
+        extend(0)
+        return joint_actions
+
     def color_filter(self, color: str):
         """
         Returns a copy of the current state where all entities, of another color than the color passed as an argument,
@@ -232,7 +521,9 @@ class HospitalState:
         That means that two states with identical positions but e.g. different parent will be seen as equal.
         """
         if isinstance(other, self.__class__):
-            return self.agent_positions == other.agent_positions and self.box_positions == other.box_positions
+            return self._hash == other._hash and self.cells == other.cells and \
+                   self.agent_chars == other.agent_chars and self.box_chars == other.box_chars and \
+                   self.pending_actions == other.pending_actions
         else:
             return False
 
@@ -245,4 +536,4 @@ class HospitalState:
         Notice that we here only hash the agent positions and box positions, but ignore all other fields.
         That means that two states with identical positions but e.g. different parent will map to the same hash value.
         """
-        return hash((tuple(self.agent_positions), tuple(self.box_positions)))
+        return self._hash
@@ -0,0 +1,140 @@
+# coding: utf-8
+#
+# Copyright 2021 The Technical University of Denmark
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#    http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# A local stand-in for the MAvis server (server.jar) using HospitalSimulator. It either runs a client and talks the
+# server protocol with it over the client's stdin and stdout, or validates a plan saved in a file.
+#
+# Usage (from the mavis-assignment directory):
+#   python searchclient/fake_server.py -c "python searchclient/searchclient.py -greedy -advancedheuristic" -l levels/SAD1.lvl
+#   python searchclient/fake_server.py --plan plan.txt -l levels/SAD1.lvl
+
+from __future__ import annotations
+import argparse
+import shlex
+import subprocess
+import sys
+import threading
+import time
+
+from domains.hospital import *
+
+
+def load_level_lines(path):
+    with open(path, "r") as f:
+        return [line.rstrip('\r\n') for line in f.readlines()]
+
+
+def serve(process, simulator, level_lines=None) -> tuple[str, list[str]]:
+    """
+    Talks the server protocol with a running client process, which must have been started with text mode pipes as its
+    stdin and stdout: the client sends its name, receives the level (unless level_lines is None, e.g. for clients
+    started with -level) and then sends joint actions, each of which is executed by the simulator and answered with
+    the successes of the actions, e.g. 'true|false'. Lines starting with '#' are comments printed to stderr.
+    Returns the client name and the joint actions sent by the client once it closes its stdout.
+    """
+    client_name = process.stdout.readline().strip()
+    if level_lines is not None:
+        process.stdin.write(''.join(line + '\n' for line in level_lines))
+        process.stdin.flush()
+
+    plan = []
+    for line in process.stdout:
+        line = line.strip()
+        if line.startswith('#'):
+            print(line, file=sys.stderr)
+            continue
+        if not line:
+            continue
+        try:
+            successes = simulator.step(simulator.parse_joint_action(line))
+        except ValueError as error:
+            # The server regards a malformed joint action as a failure of all actions of the step
+            print(f"Malformed joint action: {error}", file=sys.stderr)
+            successes = [False] * len(simulator.state.agent_chars)
+            simulator.num_failed_actions += len(successes)
+        plan.append(line)
+        try:
+            process.stdin.write('|'.join('true' if success else 'false' for success in successes) + '\n')
+            process.stdin.flush()
+        except BrokenPipeError:
+            break
+    return client_name, plan
+
+
+def run_client(command, level_path, timeout) -> tuple[bool, int, float]:
+    """Runs a client on a level and returns whether it solved the level, after how many joint actions and how fast"""
+    level_lines = load_level_lines(level_path)
+    # The simulator parses the lines which the client receives, where the indentation of the rows is part of the level.
+    # The parsing consumes the list, hence the copy.
+    simulator = HospitalSimulator(HospitalLevel.parse_level_lines(list(level_lines)))
+
+    start = time.perf_counter()
+    process = subprocess.Popen(shlex.split(command), stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True,
+                               bufsize=1)
+    # The client is killed once the timeout runs out, like the server does
+    timer = threading.Timer(timeout, process.kill)
+    timer.start()
+    try:
+        client_name, plan = serve(process, simulator, level_lines)
+    finally:
+        timer.cancel()
+        if process.poll() is None:
+            process.kill()
+        process.wait()
+    elapsed = time.perf_counter() - start
+
+    print(f"Client: {client_name}", file=sys.stderr)
+    print(f"Actions sent: {len(plan)}", file=sys.stderr)
+    return simulator.solved_at is not None, simulator.solved_at, elapsed
+
+
+def validate_plan_file(plan_path, level_path) -> tuple[bool, int]:
+    """Validates a plan with one joint action per line and returns whether it is valid and how long it is"""
+    level_lines = load_level_lines(level_path)
+    simulator = HospitalSimulator(HospitalLevel.parse_level_lines(level_lines))
+    with (sys.stdin if plan_path == '-' else open(plan_path, "r")) as f:
+        lines = [line.strip() for line in f if line.strip() and not line.startswith('#')]
+    plan = [simulator.parse_joint_action(line) for line in lines]
+    solved, failed_actions = simulator.validate(plan)
+    for (step, agent_index) in failed_actions:
+        print(f"Action {lines[step].split('|')[agent_index]} of agent {agent_index} failed in step {step + 1}",
+              file=sys.stderr)
+    return solved and not failed_actions, len(plan)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run a client or validate a plan without the MAvis server.')
+    parser.add_argument('-l', dest='level', required=True, help='The level file.')
+    parser.add_argument('-c', dest='command', help='The command starting the client.')
+    parser.add_argument('-t', dest='timeout', type=float, default=180, help='Seconds before the client is killed.')
+    parser.add_argument('--plan', metavar='<file>',
+                        help='Validate the plan in the file (- for stdin), one joint action per line, instead.')
+    args = parser.parse_args()
+
+    if args.plan is not None:
+        valid, length = validate_plan_file(args.plan, args.level)
+        print(f"Plan valid: {'Yes' if valid else 'No'}, length {length}")
+        sys.exit(0 if valid else 1)
+    if args.command is None:
+        parser.error('either -c or --plan is required')
+
+    solved, num_actions, elapsed = run_client(args.command, args.level, args.timeout)
+    print(f"Level solved: {'Yes' if solved else 'No'}", file=sys.stderr)
+    if solved:
+        print(f"Actions used: {num_actions}", file=sys.stderr)
+    print(f"Time: {elapsed:.3f} s", file=sys.stderr)
+    sys.exit(0 if solved else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -16,9 +16,58 @@ import os
 import psutil
 
 max_usage = inf
-_process_id = psutil.Process
+
+# What the search does once the memory usage gets close to max_usage, see MemoryWatchdog
+FALLBACKS = ['stop', 'greedy', 'weighted']
+fallback = 'stop'
+# The fraction of max_usage at which the fallback is applied
+fallback_threshold = 0.9
+# The weight of the heuristic of the 'weighted' fallback, i.e. f(n) = g(n) + weight * h(n)
+fallback_weight = 5
+
+# The memory usage is only sampled once per this many expansions, since sampling costs a system call
+sample_interval = 1000
+
+# Sampling statuses of MemoryWatchdog
+OK = 0
+NEAR_LIMIT = 1
+OVER_LIMIT = 2
+
+_process = None
 
 
 def get_usage():
-    process = psutil.Process(os.getpid())
-    return process.memory_info().rss
\ No newline at end of file
+    # The process handle is created once per process, also when the module has been inherited by a forked process
+    global _process
+    if _process is None or _process.pid != os.getpid():
+        _process = psutil.Process(os.getpid())
+    return _process.memory_info().rss
+
+
+class MemoryWatchdog:
+    """
+    Keeps an eye on the memory usage of a search. 'check' is meant to be called once per expansion and samples the
+    memory usage every 'sample_interval' calls. 'status' then tells whether the usage is fine, close to max_usage (at
+    least fallback_threshold of it) or over max_usage.
+    """
+
+    def __init__(self):
+        self.max_usage = max_usage
+        self.sample_interval = sample_interval
+        self.calls = 0
+        self.usage = 0
+        self.status = OK
+
+    def check(self) -> bool:
+        """Counts a call and returns True if the memory usage was sampled by the call"""
+        self.calls += 1
+        if self.max_usage == inf or self.calls % self.sample_interval != 0:
+            return False
+        self.usage = get_usage()
+        if self.usage >= self.max_usage:
+            self.status = OVER_LIMIT
+        elif self.usage >= fallback_threshold * self.max_usage:
+            self.status = NEAR_LIMIT
+        else:
+            self.status = OK
+        return True
\ No newline at end of file
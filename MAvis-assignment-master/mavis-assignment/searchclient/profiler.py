@@ -0,0 +1,174 @@
+# coding: utf-8
+#
+# Copyright 2021 The Technical University of Denmark
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#    http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import annotations
+import functools
+import sys
+import time
+
+import domains.hospital.actions as h_actions
+import domains.hospital.goal_description as h_goal_description
+import domains.hospital.node_store as h_node_store
+import domains.hospital.state as h_state
+
+# Whether graph_search breaks its time down by phase, see PhaseProfiler
+enabled = False
+
+# The profiler of the running search, if any
+current = None
+
+
+class PhaseProfiler:
+    """
+    Measures the time spent in each phase of a search, e.g. the applicability checks or the heuristic.
+    A phase consists of one or more methods, which the profiler replaces by timing wrappers on their classes while it is
+    active, i.e. within a 'with' block. Nothing is measured, and nothing costs anything, outside of the block.
+    The time of a phase excludes the time of the (profiled) phases it calls, e.g. the time of 'result' excludes the
+    time spent sorting the boxes in 'move_box', so the times of all phases add up to at most the total time.
+    The summary table is printed to stderr when the block ends.
+    """
+
+    def __init__(self, phases: list[tuple[str, list[tuple[type, str]]]]):
+        # The phases by name, each with the (class, method name) pairs making it up
+        self.phases = phases
+        self.calls = {name: 0 for (name, _) in phases}
+        self.times = {name: 0.0 for (name, _) in phases}
+        # The time spent in profiled phases called by each of the running phases, innermost last
+        self.child_times = []
+        self.installed = []
+        self.start_time = 0.0
+        self.total_time = 0.0
+
+    def __enter__(self):
+        global current
+        for (name, methods) in self.phases:
+            for (owner, method_name) in methods:
+                self._install(name, owner, method_name)
+        current = self
+        self.start_time = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        global current
+        self.total_time = time.perf_counter() - self.start_time
+        current = None
+        # Put the original methods back
+        for (owner, method_name, original) in reversed(self.installed):
+            setattr(owner, method_name, original)
+        self.installed.clear()
+        self.print_summary()
+        return False
+
+    def _install(self, name: str, owner: type, method_name: str):
+        # Methods are wrapped on the class defining them, such that all subclasses are profiled as well
+        for cls in owner.__mro__:
+            if method_name in cls.__dict__:
+                owner = cls
+                break
+        else:
+            return
+        original = owner.__dict__[method_name]
+        if any(installed[0] is owner and installed[1] == method_name for installed in self.installed):
+            return
+
+        calls = self.calls
+        times = self.times
+        child_times = self.child_times
+        perf_counter = time.perf_counter
+
+        @functools.wraps(original)
+        def timed(*args, **kwargs):
+            child_times.append(0.0)
+            start = perf_counter()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                elapsed = perf_counter() - start
+                own_time = elapsed - child_times.pop()
+                calls[name] += 1
+                times[name] += own_time
+                if child_times:
+                    child_times[-1] += elapsed
+
+        setattr(owner, method_name, timed)
+        self.installed.append((owner, method_name, original))
+
+    def print_summary(self):
+        total_time = max(self.total_time, 1e-9)
+        rows = [(name, self.calls[name], self.times[name]) for (name, _) in self.phases if self.calls[name] > 0]
+        rows.sort(key=lambda row: row[2], reverse=True)
+        other_time = total_time - sum(row[2] for row in rows)
+
+        name_width = max([len(row[0]) for row in rows] + [len('Phase'), len('other')])
+        print(f"{'Phase':<{name_width}} {'Calls':>12} {'Time (s)':>10} {'%':>6} {'us/call':>9}", file=sys.stderr)
+        for (name, calls, phase_time) in rows:
+            print(f"{name:<{name_width}} {calls:>12,d} {phase_time:>10.3f} {100 * phase_time / total_time:>6.1f} "
+                  f"{1e6 * phase_time / calls:>9.2f}", file=sys.stderr)
+        print(f"{'other':<{name_width}} {'':>12} {other_time:>10.3f} {100 * other_time / total_time:>6.1f}",
+              file=sys.stderr)
+        print(f"{'total':<{name_width}} {'':>12} {total_time:>10.3f} {100.0:>6.1f}", file=sys.stderr)
+        print(f"The times include the overhead of the profiler of about {1e6 * measure_overhead():.2f} us per call",
+              file=sys.stderr)
+
+
+def search_phases(frontier) -> list[tuple[str, list[tuple[type, str]]]]:
+    """Returns the phases of graph_search for the given frontier, see PhaseProfiler"""
+    state_class = h_state.HospitalState
+    node_store_class = h_node_store.HospitalNodeStore
+    phases = [(f"applicable: {action_class.__name__}", [(action_class, 'is_applicable')])
+              for action_class in (h_actions.NoOpAction, h_actions.MoveAction, h_actions.PushAction,
+                                   h_actions.PullAction)]
+    phases += [
+        ("occupancy index", [(state_class, '_build_occupancy')]),
+        ("object lookups", [(state_class, 'entity_at'), (state_class, 'agent_at'), (state_class, 'box_at'),
+                            (state_class, 'object_at'), (state_class, 'free_at')]),
+        ("conflicts", [(state_class, '_conflict_free_joint_actions'), (state_class, 'is_conflicting')]),
+        ("result", [(state_class, 'result'), (state_class, '_successor')]),
+        ("result: move agent", [(state_class, 'move_agent')]),
+        ("result: move box (sorting)", [(state_class, 'move_box')]),
+        ("hashing and equality", [(node_store_class, 'find'), (state_class, '__eq__'), (state_class, '__hash__')]),
+        ("node store add/update", [(node_store_class, 'add'), (node_store_class, 'update')]),
+        ("node store state", [(node_store_class, 'state')]),
+        ("extract plan", [(node_store_class, 'extract_plan'), (state_class, 'extract_plan')]),
+        ("goal test", [(h_goal_description.HospitalGoalDescription, 'is_goal')]),
+        ("deadlock check", [(state_class, 'is_deadlocked')]),
+        ("frontier push", [(type(frontier), 'add_node'), (type(frontier), 'add')]),
+        ("frontier pop", [(type(frontier), 'pop_node'), (type(frontier), 'pop')]),
+    ]
+    heuristic = getattr(frontier, 'heuristic', None)
+    if heuristic is not None:
+        phases.append(("heuristic h", [(type(heuristic), 'h')]))
+    return phases
+
+
+def measure_overhead(num_calls: int = 10000) -> float:
+    """Returns the time in seconds which the timing wrapper of PhaseProfiler adds to a single call"""
+
+    class Probe:
+        def method(self):
+            pass
+
+    probe = Probe()
+    start = time.perf_counter()
+    for _ in range(num_calls):
+        probe.method()
+    plain_time = time.perf_counter() - start
+
+    profiler = PhaseProfiler([])
+    profiler.calls['probe'] = 0
+    profiler.times['probe'] = 0.0
+    profiler._install('probe', Probe, 'method')
+    start = time.perf_counter()
+    for _ in range(num_calls):
+        probe.method()
+    timed_time = time.perf_counter() - start
+    return max(timed_time - plain_time, 0.0) / num_calls
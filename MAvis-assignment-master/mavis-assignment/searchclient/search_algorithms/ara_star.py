@@ -0,0 +1,205 @@
+# coding: utf-8
+#
+# Copyright 2021 The Technical University of Denmark
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#    http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Anytime repairing A* (ARA*, Likhachev, Gordon and Thrun 2003), which graph_search runs for FrontierARAStar.
+#
+# ARA* runs weighted A* with f = g + w * h for a decreasing series of weights w, which starts at the initial weight of
+# the frontier and ends with 1, i.e. A*. With a high weight, the first plan is found about as fast as with greedy
+# search, and every next search improves it until the last one finds an optimal plan (given an admissible heuristic).
+# Instead of starting over, every search continues with the nodes reached by the previous ones:
+# - a node is expanded at most once per search. A node whose path cost drops after it was expanded is set aside as
+#   inconsistent, and is queued again for the next search,
+# - the next search starts from the queued and the inconsistent nodes with their priorities under the new weight,
+#   while the other expanded nodes keep their paths.
+# A search ends once the cheapest plan found so far costs no more than the lowest priority in the queue, which bounds
+# the cost of the plan to at most w times the optimal cost.
+# The cheapest plan found so far is returned once the deadline has passed or the memory runs out, so the searchclient
+# always has a plan to send as soon as the first search has found one.
+
+from __future__ import annotations
+import sys
+import time
+from array import array
+
+import memory
+import telemetry
+import domains.hospital.actions as actions
+import domains.hospital.goal_description as goal_description
+import domains.hospital.node_store as node_store
+import domains.hospital.state as state
+import search_algorithms.graph_search as graph_search
+from strategies.bestfirst import FrontierARAStar
+
+# The initial weight of -arastar and the amount subtracted from it after each search
+initial_weight = 5.0
+weight_step = 0.5
+
+# The values of HospitalNodeStore.closed during ARA*: queued, expanded by the current search, expanded by an earlier
+# search (and not queued again since)
+OPEN = 0
+CLOSED = 1
+EXPANDED_BEFORE = 2
+
+
+def ara_star_search(
+        initial_state:      state.HospitalState,
+        action_set:         list[list[actions.AnyAction]],
+        goal_description:   goal_description.HospitalGoalDescription,
+        frontier:           FrontierARAStar,
+        prune_deadlocks:    bool = True,
+        deadline:           float = None
+    ) -> tuple[bool, list[list[actions.AnyAction]]]:
+    """
+    Searches like graph_search with a series of weighted A* frontiers of decreasing weight, and returns the cheapest
+    plan found once the search with weight 1 is over or the deadline has passed
+    """
+    heuristic = frontier.heuristic
+    frontier.weight = frontier.initial_weight
+    watchdog = memory.MemoryWatchdog()
+    progress = telemetry.create_telemetry()
+
+    nodes = node_store.HospitalNodeStore(initial_state)
+    # The h-value of every node, which only has to be computed once since the states never change
+    h_values = array('i')
+    # The nodes which were expanded by the current search and reached through a cheaper path afterwards
+    inconsistent = set()
+    # The goal node with the cheapest plan found so far, or -1
+    goal_id = -1
+
+    num_expanded = 0
+    num_generated = 0
+    num_duplicates = 0
+    num_pruned = 0
+    num_searches = 0
+
+    def add(next_state: state.HospitalState, parent_id: int):
+        nonlocal goal_id, num_pruned, num_duplicates
+        next_id = nodes.find(next_state)
+        if next_id < 0:
+            if prune_deadlocks and next_state.is_deadlocked(goal_description):
+                num_pruned += 1
+                return
+            next_id = nodes.add(next_state, parent_id)
+            h_values.append(heuristic.h(next_state, goal_description))
+        elif next_state.path_cost < nodes.path_costs[next_id]:
+            status = nodes.closed[next_id]
+            nodes.update(next_id, next_state, parent_id)
+            if status == CLOSED:
+                # Not expanded again by this search, but by the next one
+                nodes.closed[next_id] = CLOSED
+                inconsistent.add(next_id)
+                return
+        else:
+            num_duplicates += 1
+            return
+
+        nodes.closed[next_id] = OPEN
+        frontier.push_node(next_id, next_state.path_cost, h_values[next_id])
+        if progress is not None:
+            progress.observe(frontier.last_f, frontier.last_h)
+        if goal_description.is_goal(next_state) and (goal_id < 0 or next_state.path_cost < nodes.path_costs[goal_id]):
+            goal_id = next_id
+
+    def goal_cost() -> float:
+        return nodes.path_costs[goal_id] if goal_id >= 0 else float('inf')
+
+    def end_search(stopped: str = None) -> tuple[bool, list[list[actions.AnyAction]]]:
+        solved = goal_id >= 0
+        graph_search.print_search_status(num_expanded, len(nodes), frontier)
+        if progress is not None:
+            end_fields = {'solved': solved} if stopped is None else {'solved': solved, 'stopped': stopped}
+            progress.report(num_expanded, num_generated, num_duplicates, len(nodes), frontier.size(), event='end',
+                            weight=frontier.weight, **end_fields)
+            progress.close()
+        if prune_deadlocks:
+            print(f"Pruned deadlocked states: {num_pruned}", file=sys.stderr)
+        if not solved:
+            return False, []
+        plan = nodes.extract_plan(goal_id)
+        if stopped is not None:
+            print(f"Using the cheapest plan found so far, of length {len(plan)}", file=sys.stderr)
+        return True, plan
+
+    frontier.prepare(goal_description)
+    add(initial_state, -1)
+    if goal_id >= 0:
+        print("Goal reached!", file=sys.stderr)
+        return end_search()
+
+    while True:
+        # One weighted A* search, which ends once no queued node can lead to a plan cheaper than the current one
+        num_searches += 1
+        while frontier.min_f() < goal_cost():
+            if progress is not None and progress.due():
+                progress.report(num_expanded, num_generated, num_duplicates, len(nodes), frontier.size(),
+                                weight=frontier.weight)
+
+            if deadline is not None and time.monotonic() >= deadline:
+                print("Stopping the search since the time limit has been reached.", file=sys.stderr)
+                return end_search('time')
+
+            if watchdog.check() and watchdog.status == memory.OVER_LIMIT:
+                usage = f"{watchdog.usage / (1024*1024):.0f} MB of {watchdog.max_usage / (1024*1024):.0f} MB"
+                print(f"Stopping the search since the memory usage is {usage}.", file=sys.stderr)
+                return end_search('memory')
+
+            node_id = frontier.pop_node()
+            # A node queued again through a cheaper path leaves an outdated entry
+            if nodes.closed[node_id] != OPEN:
+                continue
+            nodes.closed[node_id] = CLOSED
+            current_state = nodes.state(node_id)
+            num_expanded += 1
+
+            # The successors of intermediate states of operator decomposition are successors of their parent
+            parent_id = nodes.parents[node_id] if nodes.intermediate[node_id] else node_id
+            for joint_action in current_state.get_applicable_actions(action_set):
+                if deadline is not None and num_generated & 1023 == 0 and time.monotonic() >= deadline:
+                    break
+                num_generated += 1
+                add(current_state.result(joint_action), parent_id)
+
+        # Without a plan, the search only ends once the queue is empty
+        if goal_id < 0:
+            print("Search finished without finding a solution", file=sys.stderr)
+            return end_search()
+
+        # The plan costs at most its cost divided by the lowest f-value (with weight 1) of the remaining nodes times
+        # the optimal cost
+        lower_bound = min((nodes.path_costs[node_id] + h_values[node_id]
+                           for node_id in range(len(nodes)) if nodes.closed[node_id] == OPEN),
+                          default=float('inf'))
+        lower_bound = min(lower_bound, min((nodes.path_costs[node_id] + h_values[node_id]
+                                            for node_id in inconsistent), default=float('inf')))
+        suboptimality = min(frontier.weight, goal_cost() / lower_bound) if lower_bound > 0 else frontier.weight
+        # The path costs of the nodes below a node whose path cost dropped are only lowered once they are reached
+        # again, so the plan through the parents of the goal node may be shorter than its path cost
+        plan_length = len(nodes.extract_plan(goal_id))
+        print(f"ARA* search {num_searches} with weight {frontier.weight:g} found a plan of length {plan_length} "
+              f"(at most {max(suboptimality, 1):.2f} times the optimal length)", file=sys.stderr)
+        if frontier.weight <= 1 or suboptimality <= 1:
+            print("Goal reached!", file=sys.stderr)
+            return end_search()
+
+        # The next search starts from the queued and the inconsistent nodes, with their priorities under the new weight
+        frontier.weight = max(frontier.weight - frontier.weight_step, 1)
+        frontier.priority_queue.clear()
+        for node_id in inconsistent:
+            nodes.closed[node_id] = OPEN
+        inconsistent.clear()
+        for node_id in range(len(nodes)):
+            status = nodes.closed[node_id]
+            if status == OPEN:
+                frontier.push_node(node_id, nodes.path_costs[node_id], h_values[node_id])
+            elif status == CLOSED:
+                nodes.closed[node_id] = EXPANDED_BEFORE
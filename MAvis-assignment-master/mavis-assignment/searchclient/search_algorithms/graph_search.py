@@ -14,12 +14,19 @@ from __future__ import annotations
 import sys
 import time
 import memory
+import profiler
+import telemetry
 from typing import Union
 
 import domains.hospital.actions as actions
 import domains.hospital.state as state
 import domains.hospital.goal_description as goal_description
+import domains.hospital.node_store as node_store
+import search_algorithms.ara_star as ara_star
+import search_algorithms.hda_star as hda_star
+import search_algorithms.ida_star as ida_star
 import strategies.bfs as bfs
+from strategies.bestfirst import FrontierARAStar, FrontierGreedy, FrontierHDAStar, FrontierIDAStar, FrontierWeightedAStar
 
 from domains.hospital.actions import MoveAction
 
@@ -30,9 +37,16 @@ def graph_search(
         initial_state:      state.HospitalState,
         action_set:         list[list[actions.AnyAction]],
         goal_description:   goal_description.HospitalGoalDescription,
-        frontier:           bfs.FrontierBFS
+        frontier:           bfs.FrontierBFS,
+        prune_deadlocks:    bool = True,
+        deadline:           float = None
     ) -> tuple[bool, list[list[actions.AnyAction]]]:
 
+    # With --profile, the search runs with the time of each of its phases measured (see profiler.py)
+    if profiler.enabled and profiler.current is None:
+        with profiler.PhaseProfiler(profiler.search_phases(frontier)):
+            return graph_search(initial_state, action_set, goal_description, frontier, prune_deadlocks, deadline)
+
     global start_time
 
     # Set start time
@@ -43,6 +57,21 @@ def graph_search(
     # Clear the parent pointer and cost in order make sure that the initial state is a root node
     initial_state.parent = None
     initial_state.path_cost = 0
+    # Let the initial state, and thereby every state reached from it, keep count of the goals it satisfies
+    initial_state.track_goals(goal_description)
+
+    # HDA* runs the search on several processes instead (see hda_star.py)
+    if isinstance(frontier, FrontierHDAStar):
+        return hda_star.hda_star_search(initial_state, action_set, goal_description, frontier, prune_deadlocks,
+                                        deadline)
+    # IDA* only keeps the current path and a bounded transposition table instead (see ida_star.py)
+    if isinstance(frontier, FrontierIDAStar):
+        return ida_star.ida_star_search(initial_state, action_set, goal_description, frontier, prune_deadlocks,
+                                        deadline)
+    # ARA* runs a series of weighted A* searches which keep improving the plan until the deadline (see ara_star.py)
+    if isinstance(frontier, FrontierARAStar):
+        return ara_star.ara_star_search(initial_state, action_set, goal_description, frontier, prune_deadlocks,
+                                        deadline)
     
     # Here, you should implement the Graph-Search algorithm from R&N figure 3.7
     # The algorithm should here return a (boolean, list) pair where the boolean denotes
@@ -64,17 +93,87 @@ def graph_search(
     
     # added: our implementation of graph search
 
-    frontier.add(initial_state)           # start node
-    visited = set()                       # a set to keep track of visited nodes
-    visited.add(initial_state)
+    # All reached states, both in the frontier and expanded, are kept in a node store which identifies them by
+    # integer node IDs (see HospitalNodeStore). The frontier only holds node IDs, and a state object is only created
+    # again for a node when it is expanded.
+    # Frontiers such as A* require the cheapest path to each state. For those, a cheaper path to a state updates its
+    # node and queues it again, which either replaces the queued node (decrease-key) or reopens an already expanded
+    # node (needed when the heuristic is inconsistent).
+    reopen_nodes = getattr(frontier, 'reopen_nodes', False)
+    num_reopened = 0
+    num_decrease_keys = 0
+
+    # With deferred evaluation, the h-value of a state is only computed once it is popped, and A* queues a popped state
+    # again when its f-value turns out to be higher than the priority it was queued with (see FrontierBestFirst)
+    deferred_evaluation = getattr(frontier, 'deferred_evaluation', False)
+    num_requeued = 0
+
+    # With --heuristic-cache, the heuristic remembers its terms which only depend on the boxes (see heuristic_cache.py)
+    box_cache = getattr(getattr(frontier, 'heuristic', None), 'box_cache', None)
+
+    # States in which a box can provably never reach the goals it is needed for are discarded when generated
+    num_pruned = 0
+
+    # Once the memory usage gets close to --max-memory, the search switches to the configured fallback (see memory.py)
+    watchdog = memory.MemoryWatchdog()
+    applied_memory_fallback = False
 
-    states_generated = 0
+    # With --telemetry, the progress of the search is written as JSON lines every few seconds (see telemetry.py)
+    progress = telemetry.create_telemetry()
+
+    nodes = node_store.HospitalNodeStore(initial_state)
+    frontier.add_node(nodes.add(initial_state, -1), initial_state)           # start node
+
+    num_expanded = 0
+    num_generated = 0
+    num_duplicates = 0
 
     while (True):
 
         if (frontier.is_empty()): break
-        currNode = frontier.pop()
-        states_generated += 1
+
+        if progress is not None and progress.due():
+            progress.report(num_expanded, num_generated, num_duplicates, len(nodes), frontier.size())
+
+        # The search gives up once the deadline, a time.monotonic() value, has passed
+        if deadline is not None and time.monotonic() >= deadline:
+            print("Stopping the search since the time limit has been reached.", file=sys.stderr)
+            print_search_status(num_expanded, len(nodes), frontier)
+            if progress is not None:
+                progress.report(num_expanded, num_generated, num_duplicates, len(nodes), frontier.size(),
+                                event='end', solved=False, stopped='time')
+                progress.close()
+            return False, []
+
+        if watchdog.check() and watchdog.status != memory.OK:
+            usage = f"{watchdog.usage / (1024*1024):.0f} MB of {watchdog.max_usage / (1024*1024):.0f} MB"
+            if watchdog.status == memory.OVER_LIMIT or memory.fallback == 'stop':
+                print(f"Stopping the search since the memory usage is {usage}.", file=sys.stderr)
+                print_search_status(num_expanded, len(nodes), frontier)
+                if progress is not None:
+                    progress.report(num_expanded, num_generated, num_duplicates, len(nodes), frontier.size(),
+                                    event='end', solved=False, stopped='memory')
+                    progress.close()
+                return False, []
+            if not applied_memory_fallback:
+                frontier = _apply_memory_fallback(frontier, nodes, goal_description)
+                reopen_nodes = getattr(frontier, 'reopen_nodes', False)
+                print(f"Memory usage is {usage}, continuing with {type(frontier).__name__}", file=sys.stderr)
+            applied_memory_fallback = True
+
+        node_id = frontier.pop_node()
+        # A node queued again through a cheaper path leaves an outdated entry, which is popped after the node has been
+        # expanded
+        if nodes.closed[node_id]:
+            continue
+        currNode = nodes.state(node_id)
+        if deferred_evaluation and not frontier.evaluate(node_id, currNode):
+            num_requeued += 1
+            continue
+        nodes.closed[node_id] = 1
+        if deferred_evaluation:
+            frontier.forget(node_id)
+        num_expanded += 1
             
         # check if each state is the goal.
         # if we reached goal state -> end the search so there's a possibility 
@@ -82,43 +181,118 @@ def graph_search(
         # print("agents", currNode.agent_positions)
         # print("boxes", currNode.box_positions)
         if (goal_description.is_goal(currNode)):
-            print("goal", goal_description)
-            # print("curr", currNode)
-            print("Goal Reached! States generated: ", states_generated)
-            # print(currNode.extract_plan())
-            return True, currNode.extract_plan()
+            # Only the plan may be written to stdout, which is the channel to the server
+            print("Goal reached!", file=sys.stderr)
+            print_search_status(num_expanded, len(nodes), frontier)
+            if progress is not None:
+                progress.report(num_expanded, num_generated, num_duplicates, len(nodes), frontier.size(),
+                                event='end', solved=True)
+                progress.close()
+            if reopen_nodes:
+                print(f"Reopened: {num_reopened}, Decrease-key: {num_decrease_keys}", file=sys.stderr)
+            if deferred_evaluation:
+                print(f"Heuristic evaluations: {frontier.num_evaluations}, Requeued: {num_requeued}", file=sys.stderr)
+            if box_cache is not None:
+                print(box_cache.status_text(), file=sys.stderr)
+            if prune_deadlocks:
+                print(f"Pruned deadlocked states: {num_pruned}", file=sys.stderr)
+            return True, nodes.extract_plan(node_id)
+
+        # The successors of intermediate states of operator decomposition are successors of their parent
+        parent_id = nodes.parents[node_id] if nodes.intermediate[node_id] else node_id
 
         # returns list of next actions
         next_actions = currNode.get_applicable_actions(action_set)
         for action in next_actions:
+            # Expanding a state of a level with many agents can take long enough to overrun the deadline, so it is also
+            # checked once in a while during an expansion
+            if deadline is not None and num_generated & 1023 == 0 and time.monotonic() >= deadline:
+                break
             nextNode = currNode.result(action)
-            
-            if (not frontier.contains(nextNode) and nextNode not in visited):
+            num_generated += 1
+
+            # a single lookup in the node store tells whether the state is new, queued or expanded
+            next_id = nodes.find(nextNode)
+            if (next_id < 0):
+                if prune_deadlocks and nextNode.is_deadlocked(goal_description):
+                    num_pruned += 1
+                    continue
                 # follow each action to the next node and add to our queue
-                frontier.add(nextNode) 
-                visited.add(nextNode)
+                frontier.add_node(nodes.add(nextNode, parent_id), nextNode)
+
+            elif reopen_nodes and nextNode.path_cost < nodes.path_costs[next_id]:
+                if nodes.closed[next_id]:
+                    num_reopened += 1
+                else:
+                    num_decrease_keys += 1
+                nodes.update(next_id, nextNode, parent_id)
+                if deferred_evaluation:
+                    frontier.forget(next_id)
+                frontier.add_node(next_id, nextNode)
+
+            else:
+                num_duplicates += 1
+                continue
 
-    print("Search Finished without finding a solution")
+            # The f- and h-value of the queued state, which only best-first frontiers compute
+            if progress is not None and getattr(frontier, 'last_h', None) is not None:
+                progress.observe(frontier.last_f, frontier.last_h)
+
+    print("Search finished without finding a solution", file=sys.stderr)
+    print_search_status(num_expanded, len(nodes), frontier)
+    if progress is not None:
+        progress.report(num_expanded, num_generated, num_duplicates, len(nodes), frontier.size(), event='end',
+                        solved=False)
+        progress.close()
+    if reopen_nodes:
+        print(f"Reopened: {num_reopened}, Decrease-key: {num_decrease_keys}", file=sys.stderr)
+    if deferred_evaluation:
+        print(f"Heuristic evaluations: {frontier.num_evaluations}, Requeued: {num_requeued}", file=sys.stderr)
+    if box_cache is not None:
+        print(box_cache.status_text(), file=sys.stderr)
+    if prune_deadlocks:
+        print(f"Pruned deadlocked states: {num_pruned}", file=sys.stderr)
 
     return False, []
 
 
+def _apply_memory_fallback(frontier, nodes, goal_description):
+    """
+    Moves the queued nodes into a greedy or weighted A* frontier using the heuristic of the given frontier, which
+    expands fewer states before reaching a goal. Frontiers without a heuristic are kept as they are.
+    """
+    heuristic = getattr(frontier, 'heuristic', None)
+    if heuristic is None:
+        return frontier
+    if memory.fallback == 'greedy':
+        fallback_frontier = FrontierGreedy(heuristic)
+    else:
+        fallback_frontier = FrontierWeightedAStar(heuristic, memory.fallback_weight)
+    fallback_frontier.prepare(goal_description)
+
+    queued = set()
+    while not frontier.is_empty():
+        node_id = frontier.pop_node()
+        if not nodes.closed[node_id] and node_id not in queued:
+            queued.add(node_id)
+            fallback_frontier.add_node(node_id, nodes.state(node_id))
+    return fallback_frontier
+
+
 # A global variable used to keep track of the start time of the current search
 start_time = 0
 
 
-def print_search_status(expanded, frontier):
-    global start_time
-    if len(expanded) == 0:
-        start_time = time.time()
+def print_search_status(num_expanded: int, num_reached: int, frontier):
+    # Prints a human-readable summary of the search started at 'start_time' to stderr
     memory_usage_bytes = memory.get_usage()
     # Replacing the generated comma thousands separators with dots is neither pretty nor locale aware but none of
     # Pythons four different formatting facilities seems to handle this correctly!
-    num_expanded = f"{len(expanded):8,d}".replace(',', '.')
+    num_expanded = f"{num_expanded:8,d}".replace(',', '.')
     num_frontier = f"{frontier.size():8,d}".replace(',', '.')
-    num_generated = f"{len(expanded) + frontier.size():8,d}".replace(',', '.')
+    num_reached = f"{num_reached:8,d}".replace(',', '.')
     elapsed_time = f"{time.time() - start_time:3.3f}".replace('.', ',')
     memory_usage_mb = f"{memory_usage_bytes / (1024*1024):3.2f}".replace('.', ',')
-    status_text = f"#Expanded: {num_expanded}, #Frontier: {num_frontier}, #Generated: {num_generated}," \
+    status_text = f"#Expanded: {num_expanded}, #Frontier: {num_frontier}, #Generated: {num_reached}," \
                   f" Time: {elapsed_time} s, Memory: {memory_usage_mb} MB"
-    print(status_text, file=sys.stderr)
\ No newline at end of file
+    print(status_text, file=sys.stderr)
@@ -0,0 +1,404 @@
+# coding: utf-8
+#
+# Copyright 2021 The Technical University of Denmark
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#    http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Hash distributed A* (HDA*, Kishimoto, Fukunaga and Botea 2009), which graph_search runs for FrontierHDAStar.
+#
+# The states are partitioned over the worker processes by their Zobrist hash: each state is owned by worker
+# 'hash % num_workers', which alone keeps it in its node store (its open and closed list) and queues it in its A*
+# frontier. A worker expands the best states it owns and sends every generated state owned by another worker to that
+# worker, in batches of up to BATCH_SIZE states per message. Nodes are identified across the workers by global node
+# IDs, 'node ID * num_workers + worker', which is also how the node store of a worker refers to a parent owned by
+# another worker.
+#
+# The worker which expands a goal state reports its cost to the coordinator, i.e. the calling process, which then
+# broadcasts it to all workers as the bound of the search: from then on, the workers only expand states with an
+# f-value below the bound, which are the only states that can still lead to a cheaper plan.
+# The search is over once no worker has a state below the bound left and no states are in transit. The coordinator
+# detects this by requesting the status of all workers in waves, where each worker answers with whether it is idle
+# and the number of messages it has sent and received. Once two consecutive waves find all workers idle with the
+# same counts, and as many messages received as sent, no worker can have become active in between, so the search has
+# terminated (the four counter method of Mattern 1987). The plan is then reconstructed by following the parent IDs
+# from the goal node, asking the owner of each node for its parent and joint action.
+# As with A*, the plan is optimal if the heuristic is admissible.
+
+from __future__ import annotations
+import multiprocessing
+import queue
+import sys
+import time
+import traceback
+
+import memory
+import telemetry
+import domains.hospital.actions as actions
+import domains.hospital.goal_description as goal_description
+import domains.hospital.node_store as node_store
+import domains.hospital.state as state
+import search_algorithms.graph_search as graph_search
+from strategies.bestfirst import FrontierAStar, FrontierHDAStar
+from utils import exit_with_parent
+
+# The number of worker processes of -hdastar, where None uses one per CPU core
+num_workers = None
+
+# The maximum number of states sent to another worker in a single message
+BATCH_SIZE = 256
+# The number of expansions after which a worker sends the states it buffered and handles its incoming messages
+EXPANSIONS_PER_SLICE = 8
+# The number of seconds between two waves of status requests of the coordinator
+PROBE_INTERVAL = 0.01
+
+
+def hda_star_search(
+        initial_state:      state.HospitalState,
+        action_set:         list[list[actions.AnyAction]],
+        goal_description:   goal_description.HospitalGoalDescription,
+        frontier:           FrontierHDAStar,
+        prune_deadlocks:    bool = True,
+        deadline:           float = None
+    ) -> tuple[bool, list[list[actions.AnyAction]]]:
+    """Searches like graph_search with an A* frontier, but distributed over frontier.num_workers processes"""
+    num_workers = frontier.num_workers
+    if initial_state.pending_actions is not None:
+        # An intermediate state is expanded through its parent, which may be owned by another worker
+        print("HDA* expands whole joint actions, so operator decomposition is not used", file=sys.stderr)
+        initial_state.pending_actions = None
+
+    context = multiprocessing.get_context()
+    inboxes = [context.Queue() for _ in range(num_workers)]
+    results = context.Queue()
+    workers = [context.Process(target=_run_worker, daemon=True,
+                               args=(index, inboxes, results, initial_state, action_set, goal_description,
+                                     frontier.heuristic, prune_deadlocks, memory.max_usage / num_workers))
+               for index in range(num_workers)]
+    for worker in workers:
+        worker.start()
+
+    progress = telemetry.create_telemetry()
+    solution = None
+    stopped = None
+    # The counts of the last complete wave of statuses, summed over the workers
+    totals = {'expanded': 0, 'generated': 0, 'duplicates': 0, 'reached': 0, 'queued': 0, 'reopened': 0,
+              'pruned': 0}
+    try:
+        # The initial state is the only message sent by the coordinator, which the termination detection counts
+        inboxes[initial_state._hash % num_workers].put(('states', [_encode(initial_state, -1, None)]))
+        num_sent = 1
+
+        wave = -1
+        statuses = {}
+        previous_snapshot = None
+        next_probe = 0
+        while True:
+            now = time.monotonic()
+            if deadline is not None and now >= deadline:
+                print("Stopping the search since the time limit has been reached.", file=sys.stderr)
+                stopped = 'time'
+                break
+            if not statuses and now >= next_probe:
+                wave += 1
+                for inbox in inboxes:
+                    inbox.put(('probe', wave))
+                statuses = {index: None for index in range(num_workers)}
+
+            try:
+                message = results.get(timeout=PROBE_INTERVAL)
+            except queue.Empty:
+                # A worker killed by e.g. the system never answers
+                dead_workers = [index for (index, worker) in enumerate(workers) if worker.exitcode is not None]
+                if dead_workers:
+                    print(f"Stopping the search since worker {dead_workers[0]} died with exit code "
+                          f"{workers[dead_workers[0]].exitcode}", file=sys.stderr)
+                    stopped = 'error'
+                    break
+                continue
+
+            kind = message[0]
+            if kind == 'solution':
+                (_, cost, worker_index, node_id) = message
+                if solution is None or cost < solution[0]:
+                    solution = (cost, worker_index, node_id)
+                    for inbox in inboxes:
+                        inbox.put(('bound', cost))
+
+            elif kind == 'status':
+                (_, status_wave, worker_index, idle, sent, received, counts) = message
+                if status_wave != wave:
+                    continue
+                statuses[worker_index] = (idle, sent, received, counts)
+                if any(status is None for status in statuses.values()):
+                    continue
+
+                for key in totals:
+                    totals[key] = sum(status[3][key] for status in statuses.values())
+                frontier.num_queued = totals['queued']
+                if progress is not None and progress.due():
+                    progress.report(totals['expanded'], totals['generated'], totals['duplicates'], totals['reached'],
+                                    totals['queued'], workers=num_workers)
+
+                snapshot = [statuses[index][:3] for index in range(num_workers)]
+                all_idle = all(idle for (idle, _, _) in snapshot)
+                in_transit = num_sent + sum(sent for (_, sent, _) in snapshot) - \
+                    sum(received for (_, _, received) in snapshot)
+                if all_idle and in_transit == 0 and snapshot == previous_snapshot:
+                    break
+                previous_snapshot = snapshot
+                statuses = {}
+                next_probe = now + PROBE_INTERVAL
+
+            elif kind == 'memory':
+                usage = f"{message[2] / (1024*1024):.0f} MB of {memory.max_usage / num_workers / (1024*1024):.0f} MB"
+                print(f"Stopping the search since the memory usage of worker {message[1]} is {usage}.",
+                      file=sys.stderr)
+                stopped = 'memory'
+                break
+
+            elif kind == 'error':
+                print(f"Stopping the search since worker {message[1]} failed:\n{message[2]}", file=sys.stderr)
+                stopped = 'error'
+                break
+
+        plan = []
+        if stopped is None and solution is not None:
+            plan = _reconstruct_plan(solution, inboxes, results, action_set)
+    finally:
+        _stop_workers(workers, inboxes, results)
+
+    solved = stopped is None and solution is not None
+    if solved:
+        print("Goal reached!", file=sys.stderr)
+    elif stopped is None:
+        print("Search finished without finding a solution", file=sys.stderr)
+    graph_search.print_search_status(totals['expanded'], totals['reached'], frontier)
+    if progress is not None:
+        end_fields = {'solved': solved} if stopped is None else {'solved': False, 'stopped': stopped}
+        progress.report(totals['expanded'], totals['generated'], totals['duplicates'], totals['reached'],
+                        totals['queued'], event='end', workers=num_workers, **end_fields)
+        progress.close()
+    if stopped is None:
+        print(f"Workers: {num_workers}, Reopened: {totals['reopened']}", file=sys.stderr)
+        if prune_deadlocks:
+            print(f"Pruned deadlocked states: {totals['pruned']}", file=sys.stderr)
+    return solved, plan
+
+
+def _encode(node_state: state.HospitalState, parent: int, action_code: tuple[int, ...]) -> tuple:
+    # The fields of a state sent to the worker owning it, see _HDAStarWorker.receive
+    return node_state._hash, node_state.cells, node_state.path_cost, node_state.num_satisfied_goals, parent, action_code
+
+
+def _reconstruct_plan(solution, inboxes, results, action_set) -> list[list[actions.AnyAction]]:
+    """Follows the parents of the goal node through the workers owning them, back to the initial state"""
+    num_workers = len(inboxes)
+    (_, worker_index, node_id) = solution
+    reverse_plan = []
+    while True:
+        inboxes[worker_index].put(('trace', node_id))
+        message = results.get()
+        while message[0] != 'trace':
+            message = results.get()
+        (_, parent, action_code) = message
+        if parent < 0:
+            break
+        reverse_plan.append(tuple(action_set[agent_index][action_index]
+                                  for (agent_index, action_index) in enumerate(action_code)))
+        (node_id, worker_index) = divmod(parent, num_workers)
+    reverse_plan.reverse()
+    return reverse_plan
+
+
+def _stop_workers(workers, inboxes, results):
+    for inbox in inboxes:
+        inbox.put(('stop',))
+    for worker in workers:
+        worker.join(timeout=1)
+        if worker.is_alive():
+            worker.kill()
+            worker.join()
+    # Messages which were never read must not keep this process from exiting
+    for inbox in inboxes + [results]:
+        inbox.cancel_join_thread()
+        inbox.close()
+
+
+def _run_worker(index, inboxes, results, initial_state, action_set, goal_description, heuristic, prune_deadlocks,
+                max_usage):
+    memory.max_usage = max_usage
+    exit_with_parent()
+    try:
+        _HDAStarWorker(index, inboxes, results, initial_state, action_set, goal_description, heuristic,
+                       prune_deadlocks).run()
+    except Exception:
+        results.put(('error', index, traceback.format_exc()))
+    # The coordinator stops all workers at once, so the messages still queued for the other workers can be dropped
+    for inbox in inboxes + [results]:
+        inbox.cancel_join_thread()
+
+
+class _HDAStarWorker:
+    """The search of a single worker, which owns the states whose hash modulo the number of workers is its index"""
+
+    def __init__(self, index, inboxes, results, initial_state, action_set, goal_description, heuristic,
+                 prune_deadlocks):
+        self.index = index
+        self.num_workers = len(inboxes)
+        self.inboxes = inboxes
+        self.results = results
+        self.action_set = action_set
+        self.goal_description = goal_description
+        self.prune_deadlocks = prune_deadlocks
+        self.template = initial_state
+        self.nodes = node_store.HospitalNodeStore(initial_state)
+        self.frontier = FrontierAStar(heuristic)
+        self.frontier.prepare(goal_description)
+        self.watchdog = memory.MemoryWatchdog()
+        self.out_of_memory = False
+
+        # Joint actions are sent as the indices of their actions in the action set, which are decoded to the same
+        # joint action objects in every worker
+        self.action_indices = [{action: action_index for (action_index, action) in enumerate(library)}
+                               for library in action_set]
+        self.joint_actions = {}
+
+        self.bound = float('inf')
+        self.buffers = [[] for _ in range(self.num_workers)]
+        self.num_sent = 0
+        self.num_received = 0
+        self.counts = {'expanded': 0, 'generated': 0, 'duplicates': 0, 'reached': 0, 'queued': 0, 'reopened': 0,
+                       'pruned': 0}
+
+    def run(self):
+        inbox = self.inboxes[self.index]
+        while True:
+            for _ in range(EXPANSIONS_PER_SLICE):
+                if not self.has_work():
+                    break
+                self.expand_next()
+            for worker_index in range(self.num_workers):
+                self.flush(worker_index)
+
+            # An idle worker waits for its next message, while a busy one only takes the messages already there
+            block = not self.has_work()
+            while True:
+                try:
+                    message = inbox.get(block)
+                except queue.Empty:
+                    break
+                if not self.handle(message):
+                    return
+                block = False
+
+    def has_work(self) -> bool:
+        # Outdated entries of nodes which were queued again through a cheaper path count as work, until they are popped
+        return not self.out_of_memory and self.frontier.priority_queue.peek_priority() < self.bound
+
+    def handle(self, message) -> bool:
+        """Handles a message from the coordinator or another worker and returns False once the worker must stop"""
+        kind = message[0]
+        if kind == 'states':
+            self.num_received += 1
+            for fields in message[1]:
+                self.receive(*fields)
+        elif kind == 'bound':
+            self.bound = min(self.bound, message[1])
+        elif kind == 'probe':
+            self.counts['reached'] = len(self.nodes)
+            self.counts['queued'] = self.frontier.size()
+            self.results.put(('status', message[1], self.index, not self.has_work(), self.num_sent,
+                              self.num_received, self.counts))
+        elif kind == 'trace':
+            node_id = message[1]
+            parent = self.nodes.parents[node_id]
+            action_code = None if parent < 0 else \
+                self.encode_joint_action(self.nodes.joint_actions[self.nodes.action_ids[node_id]])
+            self.results.put(('trace', parent, action_code))
+        elif kind == 'stop':
+            return False
+        return True
+
+    def expand_next(self):
+        nodes = self.nodes
+        node_id = self.frontier.pop_node()
+        if nodes.closed[node_id]:
+            return
+        nodes.closed[node_id] = 1
+        current_state = nodes.state(node_id)
+        self.counts['expanded'] += 1
+
+        if self.watchdog.check() and self.watchdog.status == memory.OVER_LIMIT:
+            self.out_of_memory = True
+            self.results.put(('memory', self.index, self.watchdog.usage))
+            return
+
+        if self.goal_description.is_goal(current_state):
+            # Only states below the new bound are expanded from now on, which this worker knows right away
+            self.bound = current_state.path_cost
+            self.results.put(('solution', current_state.path_cost, self.index, node_id))
+            return
+
+        global_id = node_id * self.num_workers + self.index
+        for joint_action in current_state.get_applicable_actions(self.action_set):
+            next_state = current_state.result(joint_action)
+            self.counts['generated'] += 1
+            if self.prune_deadlocks and next_state.is_deadlocked(self.goal_description):
+                self.counts['pruned'] += 1
+                continue
+            owner = next_state._hash % self.num_workers
+            if owner == self.index:
+                self.add(next_state, global_id)
+                continue
+            buffer = self.buffers[owner]
+            buffer.append(_encode(next_state, global_id, self.encode_joint_action(joint_action)))
+            if len(buffer) >= BATCH_SIZE:
+                self.flush(owner)
+
+    def receive(self, state_hash, cells, path_cost, num_satisfied_goals, parent, action_code):
+        """Adds a state generated by another worker, or the initial state sent by the coordinator"""
+        action = None if action_code is None else self.decode_joint_action(action_code)
+        received_state = self.template._successor(cells, None, action)
+        received_state._hash = state_hash
+        received_state.path_cost = path_cost
+        received_state.num_satisfied_goals = num_satisfied_goals
+        self.add(received_state, parent)
+
+    def add(self, next_state: state.HospitalState, parent: int):
+        # Like graph_search with an A* frontier, a cheaper path to a known state updates and queues its node again
+        nodes = self.nodes
+        node_id = nodes.find(next_state)
+        if node_id < 0:
+            self.frontier.add_node(nodes.add(next_state, parent), next_state)
+        elif next_state.path_cost < nodes.path_costs[node_id]:
+            if nodes.closed[node_id]:
+                self.counts['reopened'] += 1
+            nodes.update(node_id, next_state, parent)
+            self.frontier.add_node(node_id, next_state)
+        else:
+            self.counts['duplicates'] += 1
+
+    def flush(self, worker_index: int):
+        buffer = self.buffers[worker_index]
+        if buffer:
+            self.inboxes[worker_index].put(('states', buffer))
+            self.buffers[worker_index] = []
+            self.num_sent += 1
+
+    def encode_joint_action(self, joint_action) -> tuple[int, ...]:
+        return tuple(self.action_indices[agent_index][action] for (agent_index, action) in enumerate(joint_action))
+
+    def decode_joint_action(self, action_code: tuple[int, ...]) -> tuple[actions.AnyAction, ...]:
+        joint_action = self.joint_actions.get(action_code)
+        if joint_action is None:
+            joint_action = tuple(self.action_set[agent_index][action_index]
+                                 for (agent_index, action_index) in enumerate(action_code))
+            self.joint_actions[action_code] = joint_action
+        return joint_action
@@ -0,0 +1,212 @@
+# coding: utf-8
+#
+# Copyright 2021 The Technical University of Denmark
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#    http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Iterative deepening A* (IDA*, Korf 1985), which graph_search runs for FrontierIDAStar.
+#
+# IDA* runs a series of depth-first searches, each of which only follows states with an f-value, g + h, of at most its
+# bound. The first bound is the h-value of the initial state, and every next bound is the lowest f-value which
+# exceeded the previous one. A goal found within a bound is therefore reached by a cheapest plan if the heuristic is
+# admissible, like with A*. Only the current path and the unexplored successors of its states are kept, so the memory
+# of the search grows linearly with the depth instead of with the number of reached states.
+#
+# Since the depth-first searches do not know the states they reached before, they would explore every state once for
+# each path leading to it. A transposition table of at most 'table_size' states therefore remembers per state
+# (Reinefeld and Marsland 1994):
+# - the lowest path cost it was reached with, such that a state reached again through a path which is more expensive,
+#   or equally expensive within the same depth-first search, is not explored again,
+# - the lowest f-value exceeding the bound below it, minus its path cost, which is a better h-value for the next
+#   depth-first searches than the one of the heuristic, once all of its successors have been explored (rather than
+#   skipped for being known already).
+# The table evicts its least recently used state once it is full.
+
+from __future__ import annotations
+import sys
+import time
+from collections import OrderedDict
+
+import memory
+import telemetry
+import domains.hospital.actions as actions
+import domains.hospital.goal_description as goal_description
+import domains.hospital.state as state
+import search_algorithms.graph_search as graph_search
+from strategies.bestfirst import FrontierIDAStar
+
+# The number of states in the transposition table of -idastar
+table_size = 1 << 18
+
+
+class _PathEntry:
+    """A state on the current path of the depth-first search, together with its successors still to be explored"""
+
+    __slots__ = ('state', 'key', 'successors', 'next_successor', 'min_exceeded', 'complete')
+
+    def __init__(self, path_state: state.HospitalState, key: tuple, successors: list[tuple]):
+        self.state = path_state
+        self.key = key
+        # (f, h, state, key) of each successor, ordered by f such that the most promising successor is explored first
+        self.successors = successors
+        self.next_successor = 0
+        # The lowest f-value of a state below this one which exceeded the bound
+        self.min_exceeded = float('inf')
+        # Whether no state below this one was skipped because the transposition table knew it, in which case
+        # 'min_exceeded' may miss the f-values below the skipped state and cannot improve the h-value of this state
+        self.complete = True
+
+
+def ida_star_search(
+        initial_state:      state.HospitalState,
+        action_set:         list[list[actions.AnyAction]],
+        goal_description:   goal_description.HospitalGoalDescription,
+        frontier:           FrontierIDAStar,
+        prune_deadlocks:    bool = True,
+        deadline:           float = None
+    ) -> tuple[bool, list[list[actions.AnyAction]]]:
+    """Searches like graph_search with an A* frontier, but with memory that grows with the depth of the search only"""
+    heuristic = frontier.heuristic
+    # The table maps the key of a state to [lowest path cost, improved h-value, depth-first search it was reached in]
+    table = OrderedDict()
+    watchdog = memory.MemoryWatchdog()
+    progress = telemetry.create_telemetry()
+
+    num_expanded = 0
+    num_generated = 0
+    num_duplicates = 0
+    num_pruned = 0
+
+    def key_of(key_state: state.HospitalState) -> tuple:
+        return key_state._hash, key_state.cells.tobytes(), key_state.pending_actions
+
+    def remember(key: tuple, g: int, h: int):
+        table[key] = [g, h, iteration]
+        table.move_to_end(key)
+        while len(table) > frontier.table_size:
+            table.popitem(last=False)
+
+    def successors_of(parent: state.HospitalState) -> list[tuple]:
+        nonlocal num_generated, num_pruned
+        successors = []
+        for joint_action in parent.get_applicable_actions(action_set):
+            successor = parent.result(joint_action)
+            num_generated += 1
+            if prune_deadlocks and successor.is_deadlocked(goal_description):
+                num_pruned += 1
+                continue
+            key = key_of(successor)
+            h = heuristic.h(successor, goal_description)
+            entry = table.get(key)
+            if entry is not None and entry[1] > h:
+                h = entry[1]
+            successors.append((successor.path_cost + h, h, successor, key))
+            if progress is not None:
+                progress.observe(successor.path_cost + h, h)
+        successors.sort(key=lambda successor: successor[0])
+        return successors
+
+    def end_search(solved: bool, stopped: str = None):
+        graph_search.print_search_status(num_expanded, len(table), frontier)
+        if progress is not None:
+            end_fields = {'solved': solved} if stopped is None else {'solved': False, 'stopped': stopped}
+            progress.report(num_expanded, num_generated, num_duplicates, len(table), frontier.size(), event='end',
+                            **end_fields)
+            progress.close()
+        if stopped is None:
+            print(f"Iterations: {iteration + 1}", file=sys.stderr)
+            if prune_deadlocks:
+                print(f"Pruned deadlocked states: {num_pruned}", file=sys.stderr)
+
+    root_key = key_of(initial_state)
+    bound = heuristic.h(initial_state, goal_description)
+    iteration = 0
+    while True:
+        print(f"IDA* iteration {iteration + 1} with bound {bound}", file=sys.stderr)
+        remember(root_key, 0, 0)
+        if goal_description.is_goal(initial_state):
+            print("Goal reached!", file=sys.stderr)
+            end_search(True)
+            return True, []
+
+        root = _PathEntry(initial_state, root_key, successors_of(initial_state))
+        path = [root]
+        on_path = {root_key}
+        num_expanded += 1
+        while path:
+            entry = path[-1]
+            frontier.num_queued = len(path)
+
+            if entry.next_successor == len(entry.successors):
+                # All successors are explored, so the f-value exceeding the bound below the state improves its h-value
+                path.pop()
+                on_path.discard(entry.key)
+                table_entry = table.get(entry.key)
+                if entry.complete and table_entry is not None and entry.min_exceeded != float('inf'):
+                    table_entry[1] = max(table_entry[1], entry.min_exceeded - entry.state.path_cost)
+                if path:
+                    path[-1].min_exceeded = min(path[-1].min_exceeded, entry.min_exceeded)
+                    path[-1].complete = path[-1].complete and entry.complete
+                continue
+
+            (f, h, successor, key) = entry.successors[entry.next_successor]
+            entry.next_successor += 1
+            if f > bound:
+                # The successors are ordered by f, so none of the remaining ones is within the bound either
+                entry.next_successor = len(entry.successors)
+                entry.min_exceeded = min(entry.min_exceeded, f)
+                continue
+            if key in on_path:
+                num_duplicates += 1
+                continue
+
+            table_entry = table.get(key)
+            g = successor.path_cost
+            if table_entry is not None:
+                if table_entry[0] < g or (table_entry[0] == g and table_entry[2] == iteration):
+                    num_duplicates += 1
+                    entry.complete = False
+                    continue
+                table_entry[0] = g
+                table_entry[2] = iteration
+                table.move_to_end(key)
+            else:
+                remember(key, g, h)
+
+            if goal_description.is_goal(successor):
+                print("Goal reached!", file=sys.stderr)
+                end_search(True)
+                plan = [path_entry.state.action for path_entry in path[1:] if not path_entry.state.pending_actions]
+                return True, plan + [successor.action]
+
+            if progress is not None and progress.due():
+                progress.report(num_expanded, num_generated, num_duplicates, len(table), frontier.size(),
+                                iteration=iteration + 1, bound=bound)
+            if deadline is not None and time.monotonic() >= deadline:
+                print("Stopping the search since the time limit has been reached.", file=sys.stderr)
+                end_search(False, 'time')
+                return False, []
+            if watchdog.check() and watchdog.status == memory.OVER_LIMIT:
+                usage = f"{watchdog.usage / (1024*1024):.0f} MB of {watchdog.max_usage / (1024*1024):.0f} MB"
+                print(f"Stopping the search since the memory usage is {usage}.", file=sys.stderr)
+                end_search(False, 'memory')
+                return False, []
+
+            path.append(_PathEntry(successor, key, successors_of(successor)))
+            on_path.add(key)
+            num_expanded += 1
+
+        # The next bound is the lowest f-value which exceeded this one, unless no state exceeded it
+        if root.min_exceeded == float('inf'):
+            print("Search finished without finding a solution", file=sys.stderr)
+            end_search(False)
+            return False, []
+        bound = root.min_exceeded
+        iteration += 1
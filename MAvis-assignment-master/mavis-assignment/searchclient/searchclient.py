@@ -12,14 +12,22 @@
 # limitations under the License.
 
 import argparse
+import domains.hospital.heuristic_cache as heuristic_cache
 import memory
+import profiler
 import re
+import search_algorithms.ara_star as ara_star
+import search_algorithms.hda_star as hda_star
+import search_algorithms.ida_star as ida_star
+import strategies.bestfirst as bestfirst
 import sys
+import telemetry
+import time
+import agent_types.decomposed as decomposed
 from agent_types.classic import classic_agent_type
+from agent_types.portfolio import DEFAULT_PORTFOLIO, portfolio_agent_type
+from configurations import create_action_library, create_frontier, create_heuristic, parse_config
 from domains.hospital import *
-from strategies.bfs import FrontierBFS
-from strategies.dfs import FrontierDFS
-from strategies.bestfirst import FrontierAStar, FrontierGreedy
 
 from utils import read_line
 
@@ -48,8 +56,31 @@ def parse_command_line_arguments():
     parser.add_argument('--max-memory', metavar='<GB>', type=str, default="4g",
                         help='The maximum memory usage allowed in GB (soft limit, default 4g).')
 
+    parser.add_argument('--memory-fallback', choices=memory.FALLBACKS, default=memory.fallback,
+                        help='What to do once the memory usage gets close to --max-memory: stop the search (default), '
+                             'or continue with greedy or weighted A* search.')
+
+    parser.add_argument('--telemetry', metavar='<file>', nargs='?', const='-', default=None,
+                        help='Write the progress of the search as JSON lines to the given file, or to stderr if no '
+                             'file is given.')
+
+    parser.add_argument('--telemetry-interval', metavar='<seconds>', type=float, default=telemetry.interval,
+                        help=f'The number of seconds between two telemetry records (default {telemetry.interval}).')
+
+    parser.add_argument('--profile', action='store_true',
+                        help='Measure the time spent in each phase of the search, e.g. the applicability checks and '
+                             'the heuristic, and print a summary table when the search ends.')
+
+    parser.add_argument('--time-limit', metavar='<seconds>', type=float, default=None,
+                        help='The number of seconds after the start of the client at which the search stops, and '
+                             '-arastar sends the best plan found so far (default: no limit).')
+
     parser.add_argument('-level', type=str, default="", help="Load level file directly from the file system instead of readback from the server")
 
+    parser.add_argument('--operator-decomposition', action='store_true',
+                        help='Let the agents commit to their actions one at a time instead of expanding all joint '
+                             'actions at once. Reduces the branching factor of levels with many agents.')
+
     strategy_group = parser.add_mutually_exclusive_group()
     strategy_group.add_argument('-bfs', action='store_const', dest='strategy', const='bfs',
                                 help='Use the BFS strategy.')
@@ -59,6 +90,33 @@ def parse_command_line_arguments():
                                 help='Use the A* strategy.')
     strategy_group.add_argument('-greedy', action='store_const', dest='strategy', const='greedy',
                                 help='Use the Greedy strategy.')
+    strategy_group.add_argument('-hdastar', action='store_const', dest='strategy', const='hdastar',
+                                help='Use the A* strategy distributed over several processes (HDA*).')
+    parser.add_argument('--hda-workers', metavar='<N>', type=int, default=None,
+                        help='The number of worker processes of -hdastar (default: one per CPU core).')
+    strategy_group.add_argument('-idastar', action='store_const', dest='strategy', const='idastar',
+                                help='Use the memory-bounded IDA* strategy.')
+    parser.add_argument('--ida-table-size', metavar='<states>', type=int, default=ida_star.table_size,
+                        help=f'The number of states remembered by -idastar (default {ida_star.table_size}).')
+    strategy_group.add_argument('-arastar', action='store_const', dest='strategy', const='arastar',
+                                help='Use the anytime ARA* strategy, which keeps improving its plan until the time limit.')
+    parser.add_argument('--ara-weight', metavar='<w>', type=float, default=ara_star.initial_weight,
+                        help=f'The weight of the first plan of -arastar, which is lowered by {ara_star.weight_step} '
+                             f'after each plan (default {ara_star.initial_weight:g}).')
+
+    parser.add_argument('--priority-queue', choices=bestfirst.QUEUE_TYPES, default=bestfirst.queue_type,
+                        help='The priority queue of -astar and -greedy: a binary heap (default), or buckets per f-value '
+                             'which break ties by the lowest h-value or LIFO.')
+
+    parser.add_argument('--deferred-evaluation', action='store_true',
+                        help='Queue states with the h-value of their parent and compute their own h-value only once '
+                             'they are expanded, which saves the heuristic of the states that are never expanded.')
+    parser.add_argument('--preferred-successors', action='store_true',
+                        help='Let -greedy take turns between all states and the states in which a box was moved.')
+
+    parser.add_argument('--heuristic-cache', action='store_true',
+                        help='Let the advanced heuristic remember its terms which only depend on the boxes, for states '
+                             'with the same boxes. The cache takes at most a tenth of --max-memory.')
 
     heuristic_group = parser.add_mutually_exclusive_group()
     heuristic_group.add_argument('-goalcount', action='store_const', dest='heuristic', const='goalcount',
@@ -76,6 +134,18 @@ def parse_command_line_arguments():
 
     agent_type_group.add_argument('-classic', action='store_const', dest='agent_type', const='classic',
                                   help='Use a classic centralized agent type.')
+    agent_type_group.add_argument('-portfolio', action='store_const', dest='agent_type', const='portfolio',
+                                  help='Race several configurations in parallel processes and use the first plan found.')
+    agent_type_group.add_argument('-decomposed', action='store_const', dest='agent_type', const='decomposed',
+                                  help='Plan groups of agents independently and merge their plans, replanning a group '
+                                       'whose plan conflicts with the others.')
+    parser.add_argument('--decomposition', choices=decomposed.DECOMPOSITIONS, default=decomposed.decomposition,
+                        help='How -decomposed groups the agents: by color, or each agent on its own with its share of '
+                             f'the goals reached one sub-goal at a time (default {decomposed.decomposition}).')
+    parser.add_argument('--portfolio-configs', metavar='<config>', nargs='+', type=parse_config,
+                        default=[parse_config(config) for config in DEFAULT_PORTFOLIO],
+                        help='The configurations raced by -portfolio as strategy[:heuristic[:action library]] '
+                             f'(default {" ".join(DEFAULT_PORTFOLIO)}).')
 
 
     args = parser.parse_args()
@@ -90,14 +160,35 @@ def parse_command_line_arguments():
     max_memory_gb = int(max_memory_gb_match.group(1))
 
     memory.max_usage = max_memory_gb * 1024 * 1024 * 1024
+    memory.fallback = args.memory_fallback
+
+    telemetry.output = args.telemetry
+    telemetry.interval = args.telemetry_interval
+
+    profiler.enabled = args.profile
+
+    hda_star.num_workers = args.hda_workers
+    ida_star.table_size = args.ida_table_size
+    ara_star.initial_weight = args.ara_weight
+    bestfirst.queue_type = args.priority_queue
+    bestfirst.deferred_evaluation = args.deferred_evaluation
+    bestfirst.preferred_successors = args.preferred_successors
+    heuristic_cache.enabled = args.heuristic_cache
+    decomposed.decomposition = args.decomposition
 
-    return args.strategy, args.heuristic, args.action_library, args.agent_type, args.level
+    return args.strategy, args.heuristic, args.action_library, args.agent_type, args.level, args.operator_decomposition, \
+        args.portfolio_configs, args.time_limit
 
 
 if __name__ == '__main__':
 
+    # The time limit counts from the start of the client, such that it includes the preprocessing of the heuristic
+    client_start_time = time.monotonic()
+
     # Parse command line arguments i.e. strategy, heuristic, action library, agent type and level path
-    strategy_name, heuristic_name, action_library_name, agent_type_name, level_path = parse_command_line_arguments()
+    strategy_name, heuristic_name, action_library_name, agent_type_name, level_path, operator_decomposition, \
+        portfolio_configs, time_limit = parse_command_line_arguments()
+    deadline = client_start_time + time_limit if time_limit is not None else None
 
     # Construct client name by removing all missing arguments and joining them together into a single string
     name_components = [agent_type_name, strategy_name, heuristic_name, action_library_name]
@@ -126,40 +217,18 @@ if __name__ == '__main__':
     if domain_name == 'hospital':
         level = HospitalLevel.parse_level_lines(level_lines)
         initial_state = HospitalState(level, level.initial_agent_positions, level.initial_box_positions)
+        if operator_decomposition:
+            initial_state.use_operator_decomposition()
         goal_description = HospitalGoalDescription(level, level.box_goals + level.agent_goals)
-
-        # Construct the requested action library
-        if action_library_name == 'default':
-            action_library = DEFAULT_HOSPITAL_ACTION_LIBRARY
-
-        # Construct the requested heuristic
-        if heuristic_name == 'goalcount':
-            heuristic = HospitalGoalCountHeuristics()
-        elif heuristic_name == 'advanced':
-            heuristic = HospitalAdvancedHeuristics()
-
-    # Some heuristics needs to preprocess the level to pre-compute distance lookup tables, matchings, etc.
-    if heuristic is not None:
-        heuristic.preprocess(level)
-
-    # Construct the requested frontier
-    frontier = None
+        action_library = create_action_library(action_library_name)
+        heuristic = create_heuristic(heuristic_name, level)
 
     # If no specific strategy is requested, we implicitly assume it to be a BFS
     if strategy_name is None:
         strategy_name = 'bfs'
 
-    # If specific strategy is requested, construct the corresponding frontier
-    if strategy_name == 'bfs':
-        frontier = FrontierBFS()
-    elif strategy_name == 'dfs':
-        frontier = FrontierDFS()
-    elif strategy_name == 'astar':
-        frontier = FrontierAStar(heuristic)
-    elif strategy_name == 'greedy':
-        frontier = FrontierGreedy(heuristic)
-    else:
-        print(f"Unrecognized strategy {strategy_name}", file=sys.stderr)
+    # Construct the requested frontier
+    frontier = create_frontier(strategy_name, heuristic)
 
     # If no specific agent type is requested, we implicitly assume it to be the "classic" type
     if agent_type_name is None:
@@ -167,7 +236,11 @@ if __name__ == '__main__':
 
     # Run the requested agent type
     if agent_type_name == 'classic':
-        classic_agent_type(level, initial_state, action_library, goal_description, frontier)
+        classic_agent_type(level, initial_state, action_library, goal_description, frontier, deadline)
+    elif agent_type_name == 'decomposed':
+        decomposed.decomposed_agent_type(level, initial_state, action_library, goal_description, frontier, deadline)
+    elif agent_type_name == 'portfolio':
+        portfolio_agent_type(level, initial_state, goal_description, portfolio_configs, deadline)
 
     # Print error
     else:
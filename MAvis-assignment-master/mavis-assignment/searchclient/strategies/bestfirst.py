@@ -15,9 +15,23 @@ from __future__ import annotations
 import heapq
 import itertools
 
+import domains.hospital.actions as h_actions
 import domains.hospital.goal_description as h_goal_description
 import domains.hospital.state as h_state
 
+# The priority queue of the A* and greedy frontiers, set by --priority-queue: a binary heap (PriorityQueue), or a
+# BucketPriorityQueue which breaks ties by the lowest h-value or LIFO
+QUEUE_TYPES = ['heap', 'bucket-h', 'bucket-lifo']
+queue_type = 'heap'
+
+# With deferred evaluation (--deferred-evaluation), the best-first frontiers queue a state with the h-value of its
+# parent, which A* lowers by the cost of the step (see FrontierBestFirst.h), and graph_search only computes the h-value
+# of a state once it is popped (see FrontierBestFirst.evaluate).
+# With preferred successors (--preferred-successors), the greedy and weighted A* frontiers also queue the successors in
+# which a box moves in a second queue, which takes turns with the first one.
+deferred_evaluation = False
+preferred_successors = False
+
 # Here we define a priority queue which allows the priority of elements to be updated in constant time.
 # This priority queue is therefore suitable for usage as the frontier in a best-first search.
 
@@ -27,8 +41,9 @@ class PriorityQueue:
         self.heap = []
         self.entry_finder = {}
         self.counter = itertools.count()
+        self.num_elements = 0
 
-    def add(self, element: h_state.HospitalState, priority: int):
+    def add(self, element: h_state.HospitalState, priority: int, h: int = 0):
         # The elements are stored in a queue as a triplet (priority, count, element)
         # Python sorts tuples by comparing the first position and if these tie progressing to the next position until
         # it either finds a position in the tuples where they differ or all positions has been compared (in which case
@@ -44,13 +59,22 @@ class PriorityQueue:
         entry = [priority, -count, element]
         heapq.heappush(self.heap, entry)
         self.entry_finder[element] = entry
+        self.num_elements += 1
+
+    def push(self, element: int, priority: int, h: int = 0):
+        # Like add, but the element is not stored in the entry finder. It can therefore neither be found nor have its
+        # priority changed, but the same element can instead be pushed again with another priority.
+        # The h-value is only used by BucketPriorityQueue, the heap breaks ties by the insertion order.
+        heapq.heappush(self.heap, (priority, -next(self.counter), element))
+        self.num_elements += 1
 
-    def change_priority(self, element: h_state.HospitalState, new_priority: int):
+    def change_priority(self, element: h_state.HospitalState, new_priority: int, h: int = 0):
         # We cannot change the priority of an element already in the heap as that would break the heap invariant.
         # Instead we invalidate the current entry by replacing the element with None and then inserting the element
         # again with the new priority.
         entry = self.entry_finder.pop(element)
         entry[2] = None
+        self.num_elements -= 1
         # Add new entry with new priority
         self.add(element, new_priority)
 
@@ -62,16 +86,22 @@ class PriorityQueue:
             if entry[2] is not None:
                 break
         state = entry[2]
-        self.entry_finder.pop(state)
+        self.entry_finder.pop(state, None)
+        self.num_elements -= 1
         return state
 
+    def peek_priority(self) -> float:
+        # The lowest priority in the queue, which may belong to an outdated entry, or infinity if the queue is empty
+        return self.heap[0][0] if self.heap else float('inf')
+
     def clear(self):
         self.heap.clear()
         self.entry_finder.clear()
         self.counter = itertools.count()
+        self.num_elements = 0
 
     def size(self) -> int:
-        return len(self.entry_finder)
+        return self.num_elements
 
     def get_priority(self, element) -> int:
         entry = self.entry_finder.get(element)
@@ -79,28 +109,254 @@ class PriorityQueue:
             return None
         return entry[0]
 
+    def get(self, element) -> h_state.HospitalState:
+        # Returns the element stored in the queue which is equal to the given element or None if there is none
+        entry = self.entry_finder.get(element)
+        if entry is None:
+            return None
+        return entry[2]
+
+
+class BucketPriorityQueue:
+
+    # A priority queue for small non-negative integer priorities, such as the f-values of A* and greedy search, with
+    # the same methods as PriorityQueue. Each priority has a bucket, which holds a stack of elements per h-value when
+    # ties are broken by the lowest h-value ('h'), or a single stack when they are broken LIFO ('lifo'). Pushing an
+    # element appends it to its stack, and popping takes the last element of the first non-empty stack, which is
+    # found by moving a pointer forward from the lowest priority (and h-value) which may be queued. Both therefore
+    # take amortised constant time, as long as the priorities of the popped elements mostly grow, like in A*.
+    # Like in the heap, elements are deleted lazily: change_priority marks the entry of the element as outdated, and
+    # pop skips the outdated entries.
+
+    def __init__(self, tie_breaking: str = 'h'):
+        self.tie_breaking = tie_breaking
+        # buckets[priority][h] is the stack of the elements with that priority and h-value, where h is always 0 for
+        # LIFO tie-breaking. Elements queued with 'add' are stored as [priority, h, element] entries, like in the heap.
+        self.buckets = []
+        self.bucket_sizes = []
+        # The lowest h-value of each bucket which may have a non-empty stack
+        self.min_h = []
+        # The lowest priority which may have a non-empty bucket
+        self.min_priority = 0
+        self.entry_finder = {}
+        # The number of elements in the buckets, including the outdated entries, and the number of queued elements
+        self.num_stored = 0
+        self.num_elements = 0
+
+    def add(self, element: h_state.HospitalState, priority: int, h: int = 0):
+        entry = [priority, h, element]
+        self._store(entry, priority, h)
+        self.entry_finder[element] = entry
+        self.num_elements += 1
+
+    def push(self, element: int, priority: int, h: int = 0):
+        self._store(element, priority, h)
+        self.num_elements += 1
+
+    def _store(self, item, priority: int, h: int):
+        if self.tie_breaking == 'lifo':
+            h = 0
+        if priority >= len(self.buckets):
+            num_new = priority + 1 - len(self.buckets)
+            self.buckets.extend([] for _ in range(num_new))
+            self.bucket_sizes.extend([0] * num_new)
+            self.min_h.extend([0] * num_new)
+        stacks = self.buckets[priority]
+        if h >= len(stacks):
+            stacks.extend([] for _ in range(h + 1 - len(stacks)))
+        stacks[h].append(item)
+
+        if self.bucket_sizes[priority] == 0 or h < self.min_h[priority]:
+            self.min_h[priority] = h
+        self.bucket_sizes[priority] += 1
+        if self.num_stored == 0 or priority < self.min_priority:
+            self.min_priority = priority
+        self.num_stored += 1
+
+    def change_priority(self, element: h_state.HospitalState, new_priority: int, h: int = 0):
+        entry = self.entry_finder.pop(element)
+        entry[2] = None
+        self.num_elements -= 1
+        self.add(element, new_priority, h)
+
+    def pop(self) -> h_state.HospitalState:
+        bucket_sizes = self.bucket_sizes
+        while True:
+            priority = self.min_priority
+            while bucket_sizes[priority] == 0:
+                priority += 1
+            self.min_priority = priority
+            stacks = self.buckets[priority]
+            h = self.min_h[priority]
+            while not stacks[h]:
+                h += 1
+            self.min_h[priority] = h
+
+            item = stacks[h].pop()
+            bucket_sizes[priority] -= 1
+            self.num_stored -= 1
+            if item.__class__ is not list:
+                break
+            # An entry of 'add', which is skipped if it is outdated
+            if item[2] is not None:
+                item = item[2]
+                self.entry_finder.pop(item, None)
+                break
+        self.num_elements -= 1
+        return item
+
+    def peek_priority(self) -> float:
+        if self.num_stored == 0:
+            return float('inf')
+        while self.bucket_sizes[self.min_priority] == 0:
+            self.min_priority += 1
+        return self.min_priority
+
+    def clear(self):
+        self.buckets = []
+        self.bucket_sizes = []
+        self.min_h = []
+        self.min_priority = 0
+        self.entry_finder.clear()
+        self.num_stored = 0
+        self.num_elements = 0
+
+    def size(self) -> int:
+        return self.num_elements
+
+    def get_priority(self, element) -> int:
+        entry = self.entry_finder.get(element)
+        if entry is None:
+            return None
+        return entry[0]
+
+    def get(self, element) -> h_state.HospitalState:
+        entry = self.entry_finder.get(element)
+        if entry is None:
+            return None
+        return entry[2]
+
+
+def create_integer_priority_queue():
+    # Returns the priority queue of type 'queue_type' for a frontier whose priorities are small non-negative integers
+    if queue_type == 'bucket-h':
+        return BucketPriorityQueue('h')
+    if queue_type == 'bucket-lifo':
+        return BucketPriorityQueue('lifo')
+    return PriorityQueue()
+
 
 class FrontierBestFirst:
 
-    def __init__(self):
+    # Whether graph_search should keep the cheapest known path to every state, i.e. replace queued states by cheaper
+    # duplicates (decrease-key) and reopen expanded states when a cheaper path to them is found.
+    reopen_nodes = False
+
+    # The priority and h-value of the state last queued by add_node, e.g. for the telemetry of graph_search
+    last_f = None
+    last_h = None
+
+    def __init__(self, create_queue=PriorityQueue):
         self.goal_description = None
-        self.priority_queue = PriorityQueue()
+        self.priority_queue = create_queue()
+        self.num_evaluations = 0
+
+        # With deferred evaluation, the h-value and path cost of the state being expanded, the priority of the state
+        # last popped, and the h-values of the states which evaluate queued again
+        self.deferred_evaluation = deferred_evaluation
+        self.parent_h = None
+        self.parent_cost = 0
+        self.popped_priority = None
+        self.evaluated = {}
+
+        # The queue of the preferred successors, and whether it is its turn to be popped. A* only expands states in
+        # the order of their f-values, so it has no such queue.
+        self.preferred_queue = create_queue() if preferred_successors and not self.reopen_nodes else None
+        self.pop_preferred = False
 
     def prepare(self, goal_description: h_goal_description.HospitalGoalDescription):
         self.goal_description = goal_description
         # Prepare is called at the beginning of a search and since we will sometimes reuse frontiers for multiple
         # searches, prepares must ensure that state is cleared.
         self.priority_queue.clear()
+        self.num_evaluations = 0
+        self.parent_h = None
+        self.evaluated.clear()
+        if self.preferred_queue is not None:
+            self.preferred_queue.clear()
+            self.pop_preferred = False
 
     def f(self, state: h_state.HospitalState, goal_description: h_goal_description.HospitalGoalDescription) -> int:
         raise Exception("FrontierBestFirst should not be directly used. Instead use a subclass overriding f()")
 
+    def h(self, state: h_state.HospitalState, goal_description: h_goal_description.HospitalGoalDescription) -> int:
+        # The h-value with which a state is queued. With deferred evaluation, the successors of the expanded state get
+        # its h-value. A* lowers it by the cost of the step to them, which makes it at most their own h-value if the
+        # heuristic is consistent, so A* still finds the cheapest plan.
+        if self.parent_h is not None:
+            if self.reopen_nodes:
+                return max(self.parent_h - (state.path_cost - self.parent_cost), 0)
+            return self.parent_h
+        self.num_evaluations += 1
+        return self.heuristic.h(state, goal_description)
+
+    def evaluate(self, node_id: int, state: h_state.HospitalState) -> bool:
+        """
+        Computes the h-value of a popped state with deferred evaluation, which its successors are queued with.
+        A* must not expand a state before the states with lower f-values, so a state whose f-value exceeds the
+        priority it was popped with is queued again with its f-value instead, and False is returned.
+        """
+        h = self.evaluated.get(node_id)
+        if h is None:
+            self.num_evaluations += 1
+            h = self.heuristic.h(state, self.goal_description)
+        self.parent_h = h
+        self.parent_cost = state.path_cost
+        if self.reopen_nodes:
+            f = self.f(state, self.goal_description)
+            if f > self.popped_priority:
+                self.evaluated[node_id] = h
+                self.priority_queue.push(node_id, f, h)
+                return False
+        return True
+
+    def forget(self, node_id: int):
+        # Drops the h-value which evaluate kept for a node queued again, once graph_search expands or updates the node
+        self.evaluated.pop(node_id, None)
+
+    def is_preferred(self, state: h_state.HospitalState) -> bool:
+        # The successors in which an agent pushes or pulls a box, since only those change the distances of the boxes
+        # to their goals. The intermediate states of operator decomposition hold the actions committed so far.
+        joint_action = state.action or state.pending_actions or ()
+        return any(isinstance(action, (h_actions.PushAction, h_actions.PullAction)) for action in joint_action)
+
     def add(self, state: h_state.HospitalState):
-        self.priority_queue.add(state, self.f(state, self.goal_description))
+        priority = self.f(state, self.goal_description)
+        self.priority_queue.add(state, priority, self.last_h or 0)
 
     def pop(self) -> h_state.HospitalState:
         return self.priority_queue.pop()
 
+    def add_node(self, node_id: int, state: h_state.HospitalState):
+        # Queues a node of a node store by its ID (see HospitalNodeStore) with the priority of its state. The store
+        # itself knows which states have been reached, so a node reached again through a cheaper path is simply queued
+        # again and graph_search skips the outdated entry once the node has been expanded.
+        self.last_f = self.f(state, self.goal_description)
+        self.priority_queue.push(node_id, self.last_f, self.last_h or 0)
+        # A preferred successor is queued in both queues, and graph_search skips the entry popped last
+        if self.preferred_queue is not None and self.is_preferred(state):
+            self.preferred_queue.push(node_id, self.last_f, self.last_h or 0)
+
+    def pop_node(self) -> int:
+        priority_queue = self.priority_queue
+        if self.preferred_queue is not None:
+            self.pop_preferred = not self.pop_preferred
+            if self.pop_preferred and self.preferred_queue.size() > 0:
+                priority_queue = self.preferred_queue
+        if self.deferred_evaluation:
+            self.popped_priority = priority_queue.peek_priority()
+        return priority_queue.pop()
+
     def is_empty(self) -> bool:
         return (self.priority_queue.size() == 0)
 
@@ -111,26 +367,101 @@ class FrontierBestFirst:
         # if get_priority() returns None, element doesn't exist so return False
         return (self.priority_queue.get_priority(state) != None)
 
+    def get(self, state: h_state.HospitalState) -> h_state.HospitalState:
+        # Returns the queued state equal to the given state (but possibly reached through another path) or None
+        return self.priority_queue.get(state)
+
+    def update(self, state: h_state.HospitalState):
+        # Replaces the queued state equal to the given state by the given state and updates its priority accordingly
+        priority = self.f(state, self.goal_description)
+        self.priority_queue.change_priority(state, priority, self.last_h or 0)
+
 
 # The FrontierAStar and FrontierGreedy classes extend the FrontierBestFirst class, that is, they are
 # exact copies of the above class but where the 'f' method is replaced.
 
 class FrontierAStar(FrontierBestFirst):
 
+    # A* must find the cheapest path, also when the heuristic is inconsistent
+    reopen_nodes = True
+
     def __init__(self, heuristic):
-        super().__init__()
+        # The f-values are integers, so the frontier can use a bucket priority queue
+        super().__init__(create_integer_priority_queue)
         self.heuristic = heuristic
 
     def f(self, state: h_state.HospitalState, goal_description: h_goal_description.HospitalGoalDescription) -> int:
-        # f(n) = g(n) + h(n)
-        return len(state.extract_plan()) + self.heuristic.h(state, goal_description)
+        # f(n) = g(n) + h(n), where g(n) is the path cost maintained by the states themselves
+        self.last_h = self.h(state, goal_description)
+        return state.path_cost + self.last_h
+
+class FrontierHDAStar(FrontierAStar):
+
+    # Hash distributed A*, which graph_search runs on 'num_workers' processes (see search_algorithms/hda_star.py).
+    # Each process queues the states it owns in an A* frontier of its own, so this frontier itself only holds the
+    # number of states queued by all processes, as of their last status.
+
+    def __init__(self, heuristic, num_workers: int):
+        super().__init__(heuristic)
+        self.num_workers = num_workers
+        self.num_queued = 0
+
+    def size(self) -> int:
+        return self.num_queued
+
+class FrontierIDAStar(FrontierAStar):
+
+    # Iterative deepening A*, which graph_search runs as a series of depth-first searches bounded by the f-value
+    # (see search_algorithms/ida_star.py). It remembers at most 'table_size' states, so this frontier itself only holds
+    # the number of states on the current path.
+
+    def __init__(self, heuristic, table_size: int):
+        super().__init__(heuristic)
+        self.table_size = table_size
+        self.num_queued = 0
+
+    def size(self) -> int:
+        return self.num_queued
+
+class FrontierWeightedAStar(FrontierBestFirst):
+
+    def __init__(self, heuristic, weight: float):
+        super().__init__()
+        self.heuristic = heuristic
+        self.weight = weight
+
+    def f(self, state: h_state.HospitalState, goal_description: h_goal_description.HospitalGoalDescription) -> float:
+        # f(n) = g(n) + w * h(n), which trades the cost of the plan for fewer expansions as the weight grows
+        self.last_h = self.h(state, goal_description)
+        return state.path_cost + self.weight * self.last_h
+
+class FrontierARAStar(FrontierWeightedAStar):
+
+    # Anytime repairing A* (ARA*), which graph_search runs as a series of weighted A* searches with a decreasing weight
+    # that reuse the states reached before (see search_algorithms/ara_star.py). The search keeps the h-value of every
+    # node, so the nodes are queued with push_node and can be queued again with their priority under a new weight.
+
+    def __init__(self, heuristic, initial_weight: float, weight_step: float):
+        super().__init__(heuristic, initial_weight)
+        self.initial_weight = initial_weight
+        self.weight_step = weight_step
+
+    def push_node(self, node_id: int, path_cost: int, h: int):
+        self.last_h = h
+        self.last_f = path_cost + self.weight * h
+        self.priority_queue.push(node_id, self.last_f)
+
+    def min_f(self) -> float:
+        # The lowest priority in the queue, which may belong to an outdated entry
+        return self.priority_queue.peek_priority()
 
 class FrontierGreedy(FrontierBestFirst):
 
     def __init__(self, heuristic):
-        super().__init__()
+        super().__init__(create_integer_priority_queue)
         self.heuristic = heuristic
 
     def f(self, state: h_state.HospitalState, goal_description: h_goal_description.HospitalGoalDescription) -> int:
         # f(n) = h(n)
-        return self.heuristic.h(state, goal_description)
\ No newline at end of file
+        self.last_h = self.h(state, goal_description)
+        return self.last_h
\ No newline at end of file
@@ -40,6 +40,14 @@ class FrontierDFS:
         self.set.remove(state)
         return state
         
+    def add_node(self, node_id: int, state: h_state.HospitalState):
+        # Queues a node of a node store by its ID (see HospitalNodeStore). The store itself knows which states have
+        # been reached, so the node is not added to the set
+        self.queue.append(node_id)
+
+    def pop_node(self) -> int:
+        return self.queue.pop()
+
     def is_empty(self) -> bool:
         return len(self.queue) == 0
 
@@ -0,0 +1,116 @@
+# coding: utf-8
+#
+# Copyright 2021 The Technical University of Denmark
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#    http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import annotations
+import json
+import sys
+import time
+
+import memory
+
+# Where the search writes its telemetry: None disables it, '-' writes to stderr, a string is a file path which the
+# records are appended to and anything else is a file-like object. Never stdout, which is the channel to the server.
+output = None
+# The number of seconds between two progress records
+interval = 1.0
+
+
+class SearchTelemetry:
+    """
+    Writes the progress of a search as JSON lines, i.e. one JSON object per line. 'due' is meant to be called once per
+    expansion and tells when 'interval' seconds have passed since the last record. Each record holds:
+    - event: 'progress' for the periodic records and 'end' for the final record of the search,
+    - elapsed: the seconds since the search started,
+    - expanded, generated and duplicates: the number of states expanded, the number of successor states generated
+      and how many of those had already been reached,
+    - reached and frontier: the number of states in the node store and the frontier,
+    - expansions_per_second: the expansion rate since the previous record,
+    - rss: the memory usage of the process in bytes,
+    - f_min, f_max, h_min and h_max: the range of the f- and h-values of the states queued since the previous record,
+      which are null for frontiers without a heuristic.
+    The 'end' record additionally holds whether a plan was found ('solved') and, for searches stopped early, whether
+    they ran out of memory or time ('stopped').
+    """
+
+    def __init__(self, path='-', report_interval: float = 1.0):
+        self.owns_file = isinstance(path, str) and path != '-'
+        if path == '-':
+            self.file = sys.stderr
+        elif isinstance(path, str):
+            self.file = open(path, 'a')
+        else:
+            self.file = path
+        self.interval = report_interval
+        self.start_time = time.perf_counter()
+        self.next_report = self.start_time + report_interval
+        self.last_time = self.start_time
+        self.last_expanded = 0
+        self._reset_range()
+
+    def observe(self, f, h):
+        """Counts the f- and h-value of a queued state in the range of the next record"""
+        if self.f_min is None:
+            self.f_min = self.f_max = f
+            self.h_min = self.h_max = h
+            return
+        if f < self.f_min:
+            self.f_min = f
+        elif f > self.f_max:
+            self.f_max = f
+        if h < self.h_min:
+            self.h_min = h
+        elif h > self.h_max:
+            self.h_max = h
+
+    def due(self) -> bool:
+        return time.perf_counter() >= self.next_report
+
+    def report(self, num_expanded: int, num_generated: int, num_duplicates: int, num_reached: int, frontier_size: int,
+               event: str = 'progress', **fields):
+        now = time.perf_counter()
+        record = {
+            'event': event,
+            'elapsed': round(now - self.start_time, 3),
+            'expanded': num_expanded,
+            'generated': num_generated,
+            'duplicates': num_duplicates,
+            'reached': num_reached,
+            'frontier': frontier_size,
+            'expansions_per_second': round((num_expanded - self.last_expanded) / max(now - self.last_time, 1e-9), 1),
+            'rss': memory.get_usage(),
+            'f_min': self.f_min,
+            'f_max': self.f_max,
+            'h_min': self.h_min,
+            'h_max': self.h_max,
+        }
+        record.update(fields)
+        print(json.dumps(record), file=self.file, flush=True)
+
+        self.last_time = now
+        self.last_expanded = num_expanded
+        self.next_report = now + self.interval
+        self._reset_range()
+
+    def close(self):
+        if self.owns_file:
+            self.file.close()
+
+    def _reset_range(self):
+        self.f_min = self.f_max = None
+        self.h_min = self.h_max = None
+
+
+def create_telemetry() -> SearchTelemetry | None:
+    """Returns the telemetry configured by 'output' and 'interval', or None if telemetry is disabled"""
+    if output is None:
+        return None
+    return SearchTelemetry(output, interval)
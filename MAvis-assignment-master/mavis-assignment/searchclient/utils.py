@@ -11,7 +11,10 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 from __future__ import annotations
+import os
 import sys
+import threading
+import time
 
 
 def pos_add(x: tuple[int, int], y: tuple[int, int]) -> tuple[int, int]:
@@ -40,6 +43,21 @@ def parse_response(response: str) -> list[bool]:
     return [part == "true" for part in response.split('|')]
 
 
+def exit_with_parent(poll_interval: float = 0.5):
+    """
+    Makes the calling worker process exit once its parent process is gone, e.g. when the server kills the searchclient
+    once its time is up, which would otherwise leave the worker searching on its own
+    """
+    parent_pid = os.getppid()
+
+    def watch():
+        while os.getppid() == parent_pid:
+            time.sleep(poll_interval)
+        os._exit(1)
+
+    threading.Thread(target=watch, daemon=True).start()
+
+
 class GenericNoOp:
     """A NoOP action which is independent of a specific domain and
     therefore can be used inside domain-agnostic agent types"""